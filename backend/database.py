@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 import os
+import time
+from services.metrics import record_db_query
+from services.tracing import trace_db_query
+from services.db_backend import normalize_database_url, sqlalchemy_engine_options
+from services.slow_queries import slow_query_log, explain_query
+from services.migrations import ORM_MIGRATIONS, run_migrations
 
 def get_database_url():
     """Obtém a URL do banco de dados de forma segura para Render"""
@@ -11,8 +17,7 @@ def get_database_url():
     
     if database_url:
         # Corrige PostgreSQL URL se necessário
-        if database_url.startswith("postgres://"):
-            database_url = database_url.replace("postgres://", "postgresql://", 1)
+        database_url = normalize_database_url(database_url)
         print(f"🔗 Usando PostgreSQL no Render")
         return database_url
     else:
@@ -22,19 +27,47 @@ def get_database_url():
 
 SQLALCHEMY_DATABASE_URL = get_database_url()
 
-# Configuração do engine
-if "sqlite" in SQLALCHEMY_DATABASE_URL:
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False}
-    )
-else:
-    # PostgreSQL no Render
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Configuração do engine (no Postgres: pool, pre-ping e statement_timeout de DB_POOL_*)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **sqlalchemy_engine_options(SQLALCHEMY_DATABASE_URL))
+
+# Métricas e tracing: tempo de cada comando SQL por família (SELECT bots, INSERT messages...)
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start_time"].pop()
+    duration = time.perf_counter() - start
+    record_db_query(statement, parameters, duration)
+    trace_db_query(statement, parameters, duration)
+    slow_query_log.observe(statement, parameters, duration, _explain)
+
+def _explain(statement, parameters):
+    # Conexão crua do pool: o EXPLAIN não passa pelos listeners acima
+    raw = engine.raw_connection()
+    try:
+        return explain_query(raw, "sqlite" if engine.dialect.name == "sqlite" else "postgres", statement, parameters)
+    finally:
+        raw.rollback()
+        raw.close()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def init_orm_db() -> int:
+    """
+    Aplica as migrações do schema dos models no SQLite e devolve quantas rodaram.
+    No Postgres os models usam o banco da API: as tabelas vêm das migrações dela.
+    """
+    if engine.dialect.name != "sqlite":
+        return 0
+    raw = engine.raw_connection()
+    try:
+        return run_migrations(raw.driver_connection, ORM_MIGRATIONS)
+    finally:
+        raw.close()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,17 +1,63 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response, Request, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-import sqlite3
 import json
 import uuid
 from typing import List, Optional
 import os
-from services.ai_service import AIService
+import threading
+from services.idempotency import (
+    run_idempotent,
+    derive_idempotency_key,
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_DERIVED_TTL_SECONDS,
+    idempotency_store,
+)
+from services.job_queue import job_queue, worker_pool
+from services.rate_limiter import admission_controller, admit_bot_chat, RateLimitExceeded
+from services.metrics import (
+    registry,
+    bot_label,
+    mark_conversation_active,
+    record_db_query,
+    CHAT_LATENCY,
+    HTTP_IN_FLIGHT,
+    CONTENT_TYPE_LATEST,
+)
+from services import db_instrumentation, db_backend
+from services.slow_queries import SLOW_QUERY_ORDERS, slow_query_log, slow_query_observer, explainer_for
+from services.stats import read_stats
+from services.archive import ARCHIVE_ENABLED, ConversationArchiver, rehydrate_conversation
+from services.purge import BotPurger, soft_delete_bot
+from services.retention import RETENTION_ENABLED, RetentionPurger
+from services.maintenance import MAINTENANCE_ENABLED, MAINTENANCE_MAX_IN_FLIGHT, MaintenanceScheduler
+from services.backup import BackupError, backup_database, backup_lock, list_backups
+from services.write_behind import WRITE_BEHIND_ENABLED, GroupCommitWriter
+from services.history_cache import history_cache
+from services.tokens import count_tokens, conversation_token_window
+from services.tags import TAG_MATCH_MODES, filtered_bots_query, tag_facets
+from services.search import SEARCH_MAX_LIMIT, search_index_ready, build_match_query, run_search
+from services.migrations import migrations_for, run_migrations, current_version
+from services.usage import (
+    BudgetExceeded,
+    record_usage,
+    check_budgets,
+    get_bot_usage,
+    get_conversation_usage,
+)
+import hashlib
+import time
 import logging
+from services.logging_config import setup_logging
+from services.tracing import configure_tracing, start_span, traced, trace_db_query, current_trace_id
+from database import init_orm_db
+from routers import groups
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (JSON estruturado, fila não bloqueante, amostragem por logger)
+setup_logging()
+# Tracing por spans (rota, SQL, tentativas do LLM) exportado para arquivo ou console
+configure_tracing()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="CRINGE API", version="3.0.0")
@@ -25,22 +71,90 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializar serviço de IA com tratamento robusto de erros
-ai_service = None
-try:
-    ai_service = AIService()
-    logger.info("✅ AIService inicializado com sucesso")
-    
-    # Testar conexão imediatamente
-    status = ai_service.get_status()
-    if status["connection_test"]:
+# Grupos de bots (models SQLAlchemy; o job "group_message" é registrado no import)
+app.include_router(groups.router)
+
+# Métricas: requisições em andamento e tempo de cada comando SQL
+@app.middleware("http")
+async def track_in_flight_requests(request: Request, call_next):
+    HTTP_IN_FLIGHT.inc()
+    try:
+        return await call_next(request)
+    finally:
+        HTTP_IN_FLIGHT.dec()
+
+db_instrumentation.add_query_observer(record_db_query)
+db_instrumentation.add_query_observer(trace_db_query)
+# Queries lentas: ranking em /debug/slow-queries, com o plano capturado em conexão própria
+db_instrumentation.add_query_observer(slow_query_observer(
+    explainer_for(db_backend.connect, "postgres" if db_backend.is_postgres() else "sqlite")
+))
+
+# Tracing: um span raiz por requisição, nomeado pela rota (ex.: "POST /bots/chat/{bot_id}")
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    with start_span("http.request", **{"http.method": request.method, "http.target": request.url.path}) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.update_name(f"{request.method} {route.path}")
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers["X-Trace-Id"] = trace_id
+        return response
+
+# Controle de admissão: rejeições rápidas (429 + Retry-After) em vez de timeouts
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# Orçamentos do ai_config (tokens por dia/conversa, tamanho do prompt) bloqueiam antes da chamada
+@app.exception_handler(BudgetExceeded)
+async def budget_exceeded_handler(request: Request, exc: BudgetExceeded):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason, "budget": exc.budget, "retry_after": exc.retry_after},
+        headers=headers
+    )
+
+# A profundidade da fila de jobs também conta para o descarte de carga
+admission_controller.queue_depth_fn = job_queue.depth
+
+# Serviço de IA: criado no primeiro uso. O import (httpx) e o teste de conexão
+# ficam fora do import do módulo para o processo subir rápido e mesmo offline.
+def get_ai_service():
+    """AIService compartilhado, ou None se não puder ser criado"""
+    try:
+        from services.ai_service import shared_ai_service
+        return shared_ai_service()
+    except Exception as e:
+        logger.error(f"❌ Erro ao inicializar AIService: {e}")
+        return None
+
+# Estado da inicialização, usado pelo /readyz
+startup_state = {"database": False, "workers": False, "ai_service": "pending"}
+
+def warm_up_ai_service():
+    """Cria o AIService e testa a conexão em segundo plano (não bloqueia o startup)"""
+    ai_service = get_ai_service()
+    if not ai_service:
+        startup_state["ai_service"] = "unavailable"
+        return
+    if ai_service.check_connection():
+        startup_state["ai_service"] = "connected"
         logger.info("✅ Conexão com OpenRouter verificada e funcionando")
     else:
+        startup_state["ai_service"] = "unreachable"
         logger.warning("⚠️ Conexão com OpenRouter com problemas")
-        
-except Exception as e:
-    logger.error(f"❌ Erro ao inicializar AIService: {e}")
-    ai_service = None
 
 # Models
 class BotCreate(BaseModel):
@@ -67,6 +181,7 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -76,60 +191,34 @@ class ChatResponse(BaseModel):
 class ImportRequest(BaseModel):
     bots: List[BotCreate]
 
-# Database setup
+search_state = {"available": False}
+
+# Database setup: SQLite (SQLITE_PATH) ou Postgres com pool (DATABASE_URL)
 def get_db_connection():
-    conn = sqlite3.connect('cringe.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_backend.connect()
 
 def init_db():
+    """Cria ou atualiza o schema pelas migrações versionadas do dialeto em uso"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create bots table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bots (
-            id TEXT PRIMARY KEY,
-            creator_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            gender TEXT NOT NULL,
-            introduction TEXT NOT NULL,
-            personality TEXT NOT NULL,
-            welcome_message TEXT NOT NULL,
-            avatar_url TEXT NOT NULL,
-            tags TEXT NOT NULL,
-            conversation_context TEXT NOT NULL,
-            context_images TEXT NOT NULL,
-            system_prompt TEXT NOT NULL,
-            ai_config TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create conversations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id TEXT PRIMARY KEY,
-            bot_id TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (bot_id) REFERENCES bots (id)
-        )
-    ''')
-    
-    # Create messages table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id TEXT PRIMARY KEY,
-            conversation_id TEXT NOT NULL,
-            content TEXT NOT NULL,
-            is_user BOOLEAN NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    try:
+        applied = run_migrations(conn, migrations_for(conn))
+        if applied:
+            logger.info(f"🧱 {applied} migrações aplicadas (schema na versão {current_version(conn)})")
+        # FTS5 só existe no SQLite; no Postgres o /search responde 503
+        search_state["available"] = not db_backend.is_postgres() and search_index_ready(conn)
+    finally:
+        conn.close()
+
+# Move as conversas ociosas para o arquivo; a leitura reidrata sob demanda
+archiver = ConversationArchiver(get_db_connection)
+purger = BotPurger(get_db_connection)
+# Apaga conversas abandonadas conforme RETENTION_RULES; a janela em cache sai junto
+retention = RetentionPurger(get_db_connection, on_delete=history_cache.invalidate)
+# ANALYZE/optimize, checkpoint e incremental_vacuum dos arquivos SQLite na janela de pouco tráfego
+# (a requisição que mede o tráfego também conta como em andamento)
+maintenance = MaintenanceScheduler(busy=lambda: HTTP_IN_FLIGHT.get() > MAINTENANCE_MAX_IN_FLIGHT)
+# Write-behind opcional: as escritas dos turnos de chat saem em lotes (um COMMIT por lote)
+message_writer = GroupCommitWriter(get_db_connection)
 
 def insert_default_bots():
     """Insere os 4 bots padrão no banco de dados"""
@@ -239,9 +328,45 @@ def insert_default_bots():
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    init_orm_db()
     insert_default_bots()
+    startup_state["database"] = True
+    
+    # Fila de geração assíncrona: jobs interrompidos por reinício voltam para a fila
+    job_queue.init_table()
+    job_queue.recover()
+    if job_queue.enabled:
+        worker_pool.start()
+    startup_state["workers"] = True
+    if not idempotency_store.enabled:
+        logger.warning("⚠️ Postgres sem IDEMPOTENCY_DB_PATH: reenvios só são deduplicados enquanto a geração está em andamento")
+    
+    # O teste de conexão com o LLM roda em segundo plano; o serviço já aceita tráfego
+    threading.Thread(target=warm_up_ai_service, name="ai-warm-up", daemon=True).start()
+    
+    # O arquivo de conversas depende de triggers e funções do SQLite
+    if ARCHIVE_ENABLED and not db_backend.is_postgres():
+        archiver.start()
+    if RETENTION_ENABLED and not db_backend.is_postgres():
+        retention.start()
+    if MAINTENANCE_ENABLED:
+        maintenance.start()
+    purger.start()
+    if WRITE_BEHIND_ENABLED:
+        message_writer.start()
+    
     logger.info("🚀 CRINGE API inicializada com sucesso!")
 
+@app.on_event("shutdown")
+def shutdown_event():
+    worker_pool.stop()
+    # Grava o que ainda está na fila do write-behind antes de sair
+    message_writer.stop()
+    archiver.stop()
+    retention.stop()
+    maintenance.stop()
+    purger.stop()
+
 # Routes
 @app.get("/")
 async def root():
@@ -251,14 +376,30 @@ async def root():
         "endpoints": {
             "GET /": "Esta mensagem",
             "GET /health": "Health check com estatísticas",
+            "GET /stats": "Contadores de bots, conversas e mensagens",
+            "GET /livez": "Liveness: o processo está de pé (sem dependências)",
+            "GET /readyz": "Readiness: banco e workers prontos para receber tráfego",
+            "GET /metrics": "Métricas no formato Prometheus",
             "GET /debug/ai-status": "Status detalhado do serviço de IA",
             "GET /debug/conversation/{id}": "Debug de conversa específica",
-            "GET /bots": "Listar todos os bots",
+            "GET /debug/admission": "Estado do controle de admissão (rate limiting)",
+            "GET /debug/slow-queries": "Queries SQL mais lentas, com parâmetros (só tipos) e plano",
+            "GET /debug/maintenance": "Manutenção SQLite: janela, última rodada e efeito por banco",
+            "POST /debug/maintenance/run": "Roda a manutenção SQLite agora (limitada por tempo)",
+            "POST /admin/backup": "Snapshot online do banco (?compression=auto|zstd|gzip|none)",
+            "GET /admin/backups": "Snapshots existentes do banco",
+            "GET /bots": "Listar os bots (?tag=&match=all|any&limit=&offset=)",
+            "GET /tags": "Contagem de bots por tag (facetas, com o mesmo filtro de /bots)",
+            "GET /search?q=": "Busca por texto em bots e mensagens (ranqueada, paginada)",
             "GET /bots/{bot_id}": "Obter um bot específico",
             "POST /bots/import": "Importar bots via JSON",
             "DELETE /bots/{bot_id}": "Excluir um bot",
-            "POST /bots/chat/{bot_id}": "Chat com um bot",
-            "GET /conversations/{conversation_id}": "Obter histórico de conversa"
+            "POST /bots/chat/{bot_id}": "Chat com um bot (?async_mode=true para enfileirar)",
+            "GET /jobs/{job_id}": "Status/resultado de um job de geração (?wait=segundos para aguardar)",
+            "GET /conversations/{conversation_id}": "Obter histórico de conversa",
+            "GET /conversations/{conversation_id}/usage": "Tokens e latência acumulados da conversa",
+            "GET /conversations/{conversation_id}/tokens": "Tamanho da conversa em tokens (?max_tokens= para a janela recente)",
+            "GET /usage": "Tokens e latência por bot e por dia (?bot_id=&days=)"
         }
     }
 
@@ -267,24 +408,16 @@ async def health_check():
     """Health check com estatísticas"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) as count FROM bots")
-        bots_count = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT COUNT(*) as count FROM conversations")
-        conversations_count = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT COUNT(*) as count FROM messages")
-        messages_count = cursor.fetchone()['count']
         
+        # Contadores da tabela stats: O(1), independente do volume de mensagens
+        stats = read_stats(conn)
         conn.close()
         
-        # Status do serviço de IA
+        # Status do serviço de IA (último teste conhecido; o health check não chama o LLM)
         ai_status = "unknown"
-        if ai_service:
-            status_info = ai_service.get_status()
-            ai_status = "healthy" if status_info["connection_test"] else "unhealthy"
+        ai_service = get_ai_service()
+        if ai_service and ai_service.connection_status is not None:
+            ai_status = "healthy" if ai_service.connection_status else "unhealthy"
         
         return {
             "status": "healthy",
@@ -292,9 +425,11 @@ async def health_check():
             "database": "connected",
             "ai_service": ai_status,
             "statistics": {
-                "bots": bots_count,
-                "conversations": conversations_count,
-                "messages": messages_count
+                "bots": stats.get("bots", 0) - stats.get("deleted_bots", 0),
+                "conversations": stats.get("conversations", 0),
+                # Mensagens arquivadas continuam sendo mensagens
+                "messages": stats.get("messages", 0) + stats.get("archived_messages", 0),
+                "archived_conversations": stats.get("archived_conversations", 0)
             }
         }
     except Exception as e:
@@ -304,9 +439,47 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/stats")
+def get_stats():
+    """Contadores de bots, conversas e mensagens (mantidos por triggers, sem full scan)"""
+    conn = get_db_connection()
+    try:
+        return read_stats(conn)
+    finally:
+        conn.close()
+
+@app.get("/livez")
+async def liveness():
+    """Liveness: responde enquanto o processo estiver de pé, sem tocar em dependências"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readiness(response: Response):
+    """Readiness: banco inicializado e acessível, workers rodando. O LLM é informativo."""
+    checks = {"database": startup_state["database"], "workers": startup_state["workers"]}
+    if checks["database"]:
+        try:
+            conn = get_db_connection()
+            conn.execute("SELECT 1").fetchone()
+            conn.close()
+        except Exception as e:
+            logger.warning("⚠️ Readiness: banco inacessível: %s", e)
+            checks["database"] = False
+    
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {"status": "ready" if ready else "not_ready", "checks": checks, "ai_service": startup_state["ai_service"]}
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas do pipeline de chat no formato de exposição do Prometheus"""
+    return PlainTextResponse(registry.expose(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/debug/ai-status")
-async def debug_ai_status():
-    """Endpoint de debug para verificar status da IA"""
+def debug_ai_status():
+    """Endpoint de debug para verificar status da IA (refaz o teste de conexão)"""
+    ai_service = get_ai_service()
     if not ai_service:
         return {
             "status": "unavailable", 
@@ -319,7 +492,7 @@ async def debug_ai_status():
     
     try:
         # Obter status detalhado do serviço de IA
-        status = ai_service.get_status()
+        status = ai_service.get_status(force_check=True)
         
         return {
             "status": "available" if status["connection_test"] else "unavailable",
@@ -337,8 +510,57 @@ async def debug_ai_status():
             }
         }
 
+@app.get("/debug/admission")
+async def debug_admission():
+    """Estado atual do controle de admissão"""
+    return admission_controller.get_status()
+
+@app.get("/debug/slow-queries")
+async def debug_slow_queries(limit: int = 20, order: str = "total"):
+    """Comandos SQL acima de SLOW_QUERY_THRESHOLD_MS, ordenados por tempo total, máximo ou contagem"""
+    if order not in SLOW_QUERY_ORDERS:
+        raise HTTPException(status_code=400, detail="order deve ser total, max ou count")
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "order": order,
+        "queries": slow_query_log.top(max(1, min(limit, 200)), order)
+    }
+
+@app.get("/debug/maintenance")
+def debug_maintenance():
+    """Janela, última rodada e relatório por banco da manutenção SQLite"""
+    return maintenance.status()
+
+@app.post("/debug/maintenance/run")
+def run_maintenance():
+    """Roda a manutenção agora, fora da janela (cada banco continua limitado pelo orçamento de tempo)"""
+    reports = maintenance.run_once(force=True)
+    if reports is None:
+        raise HTTPException(status_code=409, detail="Manutenção já em andamento")
+    return {"reports": reports}
+
+@app.post("/admin/backup")
+def create_backup(compression: Optional[str] = None):
+    """Snapshot online do cringe.db (API de backup do SQLite em passos), comprimido e com rotação"""
+    if db_backend.is_postgres():
+        raise HTTPException(status_code=400, detail="Backup online só no SQLite; no Postgres use pg_dump")
+    if not backup_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Backup já em andamento")
+    try:
+        options = {"compression": compression} if compression else {}
+        return backup_database(db_backend.SQLITE_PATH, **options)
+    except BackupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        backup_lock.release()
+
+@app.get("/admin/backups")
+def get_backups():
+    """Snapshots existentes do cringe.db, do mais novo para o mais antigo"""
+    return {"backups": list_backups(db_backend.SQLITE_PATH)}
+
 @app.get("/debug/conversation/{conversation_id}")
-async def debug_conversation(conversation_id: str):
+def debug_conversation(conversation_id: str):
     """Debug detalhado de uma conversa específica"""
     try:
         conn = get_db_connection()
@@ -356,6 +578,8 @@ async def debug_conversation(conversation_id: str):
         if not conversation:
             return {"error": "Conversa não encontrada"}
         
+        rehydrate_conversation(conn, conversation_id)
+        
         # Buscar mensagens
         cursor.execute('''
             SELECT * FROM messages 
@@ -387,13 +611,24 @@ async def debug_conversation(conversation_id: str):
         logger.error(f"Erro no debug da conversa: {str(e)}")
         return {"error": f"Erro ao buscar conversa: {str(e)}"}
 
+def validate_tag_match(match: str):
+    if match not in TAG_MATCH_MODES:
+        raise HTTPException(status_code=400, detail="match deve ser all (todas as tags) ou any (qualquer uma)")
+
 @app.get("/bots", response_model=List[BotResponse])
-async def get_bots():
-    """Listar todos os bots"""
+async def get_bots(
+    tag: Optional[List[str]] = Query(None),
+    match: str = "all",
+    limit: Optional[int] = None,
+    offset: int = 0
+):
+    """Listar os bots (?tag=a&tag=b filtra; match=all exige todas, match=any qualquer uma)"""
+    validate_tag_match(match)
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM bots ORDER BY created_at DESC")
+        query, params = filtered_bots_query(tag, match, limit, max(0, offset))
+        cursor.execute(query, params)
         bots = cursor.fetchall()
         conn.close()
         
@@ -409,13 +644,23 @@ async def get_bots():
         logger.error(f"Erro ao buscar bots: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar bots: {str(e)}")
 
+@app.get("/tags")
+def get_tags(tag: Optional[List[str]] = Query(None), match: str = "all", limit: int = 100):
+    """Facetas: quantos bots têm cada tag (dentro do filtro ?tag=, se houver)"""
+    validate_tag_match(match)
+    conn = get_db_connection()
+    try:
+        return tag_facets(conn.cursor(), tag, match, max(1, min(limit, 1000)))
+    finally:
+        conn.close()
+
 @app.get("/bots/{bot_id}", response_model=BotResponse)
 async def get_bot(bot_id: str):
     """Obter um bot específico"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM bots WHERE id = ?", (bot_id,))
+        cursor.execute("SELECT * FROM bots WHERE id = ? AND deleted_at IS NULL", (bot_id,))
         bot = cursor.fetchone()
         conn.close()
         
@@ -531,40 +776,29 @@ async def import_bots(import_request: ImportRequest):
 
 @app.delete("/bots/{bot_id}")
 async def delete_bot(bot_id: str):
-    """Excluir um bot e suas conversas"""
+    """Excluir um bot (conversas e mensagens são removidas em segundo plano)"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id, name FROM bots WHERE id = ?", (bot_id,))
-        bot = cursor.fetchone()
+        try:
+            # Só marca deleted_at: a transação é pequena e não trava o banco
+            bot_name = soft_delete_bot(conn, bot_id)
+        finally:
+            conn.close()
         
-        if not bot:
+        if bot_name is None:
             return JSONResponse(
                 status_code=404,
                 content={"error": "Bot não encontrado"}
             )
         
-        bot_name = bot['name']
-        
-        # Excluir em cascata
-        cursor.execute('''
-            DELETE FROM messages 
-            WHERE conversation_id IN (
-                SELECT id FROM conversations WHERE bot_id = ?
-            )
-        ''', (bot_id,))
-        
-        cursor.execute("DELETE FROM conversations WHERE bot_id = ?", (bot_id,))
-        cursor.execute("DELETE FROM bots WHERE id = ?", (bot_id,))
-        
-        conn.commit()
-        conn.close()
+        # O purger apaga conversas e mensagens em lotes curtos
+        purger.wake()
         
         return {
             "message": f"Bot '{bot_name}' excluído com sucesso",
             "deleted_bot_id": bot_id,
-            "deleted_bot_name": bot_name
+            "deleted_bot_name": bot_name,
+            "purge": "scheduled"
         }
         
     except Exception as e:
@@ -574,79 +808,267 @@ async def delete_bot(bot_id: str):
             content={"error": f"Erro ao excluir bot: {str(e)}"}
         )
 
-@app.post("/bots/chat/{bot_id}")
-async def chat_with_bot(bot_id: str, chat_request: ChatRequest):
-    """Chat com um bot específico usando IA real"""
-    logger.info(f"🔍 Iniciando chat com bot {bot_id}")
+def resolve_chat_idempotency_key(bot_id: str, chat_request: ChatRequest, header_key: Optional[str]):
+    """
+    Define a chave de idempotência do turno de chat.
+    Usa a chave enviada pelo cliente (corpo ou header Idempotency-Key) ou,
+    quando a conversa já existe, deriva uma a partir da conversa + hash da mensagem.
+    Retorna (chave, ttl) ou (None, 0) quando não há como deduplicar com segurança.
+    """
+    explicit_key = chat_request.idempotency_key or header_key
+    if explicit_key:
+        return derive_idempotency_key("chat", bot_id, explicit_key), IDEMPOTENCY_TTL_SECONDS
     
-    if not ai_service:
+    if chat_request.conversation_id:
+        message_hash = hashlib.sha256(chat_request.message.strip().encode("utf-8")).hexdigest()
+        key = derive_idempotency_key("chat", bot_id, chat_request.conversation_id, message_hash)
+        return key, IDEMPOTENCY_DERIVED_TTL_SECONDS
+    
+    return None, 0
+
+@app.post("/bots/chat/{bot_id}", dependencies=[Depends(admit_bot_chat)])
+def chat_with_bot(
+    bot_id: str,
+    chat_request: ChatRequest,
+    response: Response,
+    async_mode: bool = False,
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Chat com um bot específico usando IA real (idempotente)"""
+    logger.debug("🔍 Iniciando chat com bot %s", bot_id)
+    
+    if not get_ai_service():
         raise HTTPException(status_code=503, detail="Serviço de IA indisponível")
     
+    key, ttl = resolve_chat_idempotency_key(bot_id, chat_request, idempotency_key)
+    
+    if async_mode:
+        if not job_queue.enabled:
+            raise HTTPException(status_code=503, detail="Fila de jobs indisponível: defina JOB_QUEUE_DB_PATH")
+        return enqueue_chat_job(bot_id, chat_request, response, key)
+    
+    result, replayed = run_idempotent(
+        key,
+        "chat",
+        lambda: process_chat_turn(bot_id, chat_request),
+        ttl=ttl,
+        # Fallback ou "todos os modelos falharam": o retry com a mesma chave precisa chegar ao LLM
+        store_if=lambda result: result.get("model") is not None
+    )
+    
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    
+    return result
+
+def enqueue_chat_job(bot_id: str, chat_request: ChatRequest, response: Response, key: Optional[str]) -> dict:
+    """Enfileira o turno de chat e devolve o id do job imediatamente (202)"""
+    conn = get_db_connection()
+    bot = conn.execute("SELECT id FROM bots WHERE id = ? AND deleted_at IS NULL", (bot_id,)).fetchone()
+    conn.close()
+    
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot não encontrado")
+    
+    # Reenvios com a mesma chave de idempotência apontam para o mesmo job
+    job_id = derive_idempotency_key("chat_job", key) if key else None
+    job, created = job_queue.enqueue(
+        "chat",
+        {"bot_id": bot_id, "request": chat_request.model_dump()},
+        provider=worker_pool.provider_for("chat"),
+        job_id=job_id
+    )
+    
+    if not created:
+        response.headers["Idempotent-Replayed"] = "true"
+    response.status_code = 202
+    
+    logger.debug("📨 Job de chat %s enfileirado (%s)", job['job_id'], job['status'])
+    return {
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "status_url": f"/jobs/{job['job_id']}"
+    }
+
+def run_chat_job(payload: dict) -> dict:
+    """Executa um job de chat enfileirado (chamado pelos workers)"""
+    return process_chat_turn(payload['bot_id'], ChatRequest(**payload['request']))
+
+worker_pool.register_handler("chat", run_chat_job, provider="openrouter")
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, wait: float = 0):
+    """Status e resultado de um job de geração. Com ?wait=N aguarda até N segundos (máx. 30)"""
+    if wait > 0:
+        job = job_queue.wait(job_id, timeout=min(wait, 30.0))
+    else:
+        job = job_queue.get(job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    return {
+        "job_id": job['job_id'],
+        "kind": job['kind'],
+        "status": job['status'],
+        "attempts": job['attempts'],
+        "result": job['result'],
+        "error": job['error']
+    }
+
+def fetch_chat_history(cursor, conversation_id: str, limit: Optional[int] = None) -> List[dict]:
+    """Busca o histórico da conversa no formato de mensagens da IA (role/content/tokens)"""
+    if limit is None:
+        cursor.execute('''
+            SELECT content, is_user, token_count FROM messages 
+            WHERE conversation_id = ? 
+            ORDER BY created_at ASC
+        ''', (conversation_id,))
+    else:
+        # Só as últimas `limit` mensagens: o índice é lido de trás para frente
+        cursor.execute('''
+            SELECT content, is_user, token_count FROM messages
+            WHERE conversation_id = ?
+            ORDER BY created_at DESC LIMIT ?
+        ''', (conversation_id, limit))
+    messages = cursor.fetchall()
+    if limit is not None:
+        messages.reverse()
+    
+    chat_history = []
+    for msg in messages:
+        role = "user" if msg['is_user'] else "assistant"
+        chat_history.append({
+            "role": role,
+            "content": msg['content'],
+            "tokens": msg['token_count']
+        })
+    return chat_history
+
+def load_chat_history(cursor, conversation_id: str) -> List[dict]:
+    """Janela recente da conversa: da cache quando ativa; senão do banco, aquecendo a cache"""
+    cached = history_cache.get(conversation_id)
+    if cached is not None:
+        return cached
+    chat_history = fetch_chat_history(cursor, conversation_id, limit=history_cache.window)
+    history_cache.put(conversation_id, chat_history)
+    return chat_history
+
+def save_user_message(cursor, conversation_id: str, message: str, token_count: int):
+    """Grava a mensagem do usuário com a contagem de tokens (na transação do cursor)"""
+    cursor.execute(
+        "INSERT INTO messages (id, conversation_id, content, is_user, token_count) VALUES (?, ?, ?, ?, ?)",
+        (str(uuid.uuid4()), conversation_id, message, True, token_count)
+    )
+
+def save_bot_reply(cursor, bot_id: str, conversation_id: str, ai_response: str, generation: Optional[dict]) -> int:
+    """Grava a resposta do bot com o uso da geração (na transação do cursor); devolve o token_count"""
+    usage = (generation or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    latency_ms = round(generation["latency"] * 1000) if generation and "latency" in generation else None
+    model = generation["model"] if generation else None
+    token_count = count_tokens(ai_response, model)
+    cursor.execute(
+        "INSERT INTO messages (id, conversation_id, content, is_user, prompt_tokens, completion_tokens, latency_ms, model, token_count) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (str(uuid.uuid4()), conversation_id, ai_response, False,
+         prompt_tokens, completion_tokens, latency_ms, model, token_count)
+    )
+    # A resposta de contingência (todos os modelos falharam) não conta como uso
+    if generation and generation.get("model"):
+        record_usage(cursor, bot_id, conversation_id, prompt_tokens or 0, completion_tokens or 0, latency_ms or 0)
+    return token_count
+
+def chat_turn_writes(bot_id: str, conversation_id: str, new_conversation: bool, user_message: str,
+                     user_tokens: int, ai_response: str, generation: Optional[dict]):
+    """Unidade do write-behind com todas as escritas de um turno (conversa, usuário, bot, uso)"""
+    def write(cursor):
+        if new_conversation:
+            cursor.execute("INSERT INTO conversations (id, bot_id) VALUES (?, ?)", (conversation_id, bot_id))
+        save_user_message(cursor, conversation_id, user_message, user_tokens)
+        save_bot_reply(cursor, bot_id, conversation_id, ai_response, generation)
+    return write
+
+@traced("chat.turn")
+def process_chat_turn(bot_id: str, chat_request: ChatRequest) -> dict:
+    """Executa um turno completo de chat: persiste a mensagem, chama a IA e salva a resposta"""
+    turn_start = time.perf_counter()
+    model_used = "fallback"
+    # ok (um modelo respondeu), fallback (resposta de contingência), rejected (4xx) ou error
+    outcome = "error"
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT * FROM bots WHERE id = ?", (bot_id,))
+        cursor.execute("SELECT * FROM bots WHERE id = ? AND deleted_at IS NULL", (bot_id,))
         bot = cursor.fetchone()
         
         if not bot:
-            logger.error(f"❌ Bot {bot_id} não encontrado")
+            logger.warning("❌ Bot %s não encontrado", bot_id)
             raise HTTPException(status_code=404, detail="Bot não encontrado")
         
         bot_dict = dict(bot)
         bot_dict['tags'] = json.loads(bot_dict['tags'])
         bot_dict['ai_config'] = json.loads(bot_dict['ai_config'])
         
-        logger.info(f"✅ Bot encontrado: {bot_dict['name']}")
+        logger.debug("✅ Bot encontrado: %s", bot_dict['name'])
+        
+        # Orçamentos de tokens do bot/conversa: rejeita antes de gravar ou chamar a IA
+        check_budgets(cursor, bot_id, chat_request.conversation_id, bot_dict['ai_config'])
         
         # Criar nova conversa se não existir
         conversation_id = chat_request.conversation_id
-        if not conversation_id:
+        new_conversation = not conversation_id
+        if new_conversation:
             conversation_id = str(uuid.uuid4())
-            cursor.execute(
-                "INSERT INTO conversations (id, bot_id) VALUES (?, ?)",
-                (conversation_id, bot_id)
-            )
-            logger.info(f"🆕 Nova conversa criada: {conversation_id}")
-        
-        # Salvar mensagem do usuário
-        user_message_id = str(uuid.uuid4())
-        cursor.execute(
-            "INSERT INTO messages (id, conversation_id, content, is_user) VALUES (?, ?, ?, ?)",
-            (user_message_id, conversation_id, chat_request.message, True)
-        )
-        
-        # Buscar histórico de mensagens
-        cursor.execute('''
-            SELECT content, is_user FROM messages 
-            WHERE conversation_id = ? 
-            ORDER BY created_at ASC
-        ''', (conversation_id,))
-        messages = cursor.fetchall()
+            logger.debug("🆕 Nova conversa criada: %s", conversation_id)
         
-        # Preparar histórico para a IA
+        # Histórico anterior ao turno (conversa ativa: da cache, sem consulta) + a mensagem atual
         chat_history = []
-        for msg in messages:
-            role = "user" if msg['is_user'] else "assistant"
-            chat_history.append({
-                "role": role,
-                "content": msg['content']
-            })
+        if not new_conversation:
+            # Conversa arquivada volta para as tabelas quentes antes da leitura
+            rehydrate_conversation(conn, conversation_id)
+            chat_history = load_chat_history(cursor, conversation_id)
+        # Tokens contados uma vez aqui: gravados na mensagem e usados no orçamento do prompt
+        user_tokens = count_tokens(chat_request.message)
+        chat_history.append({"role": "user", "content": chat_request.message, "tokens": user_tokens})
         
-        logger.info(f"📜 Histórico com {len(chat_history)} mensagens")
+        if message_writer.running:
+            # Write-behind: as escritas do turno vão juntas para o writer depois da IA;
+            # a conexão não fica presa durante a chamada ao LLM
+            conn.close()
+            conn = None
+        else:
+            if new_conversation:
+                cursor.execute(
+                    "INSERT INTO conversations (id, bot_id) VALUES (?, ?)",
+                    (conversation_id, bot_id)
+                )
+            
+            # Salvar mensagem do usuário
+            save_user_message(cursor, conversation_id, chat_request.message, user_tokens)
+        
+        logger.debug("📜 Histórico com %d mensagens", len(chat_history))
         
         # Gerar resposta usando IA
+        generation = None
         try:
-            logger.info(f"🤖 Chamando AI Service para {bot_dict['name']}...")
-            ai_response = ai_service.generate_response(
+            logger.debug("🤖 Chamando AI Service para %s...", bot_dict['name'])
+            generation = get_ai_service().generate_response_detailed(
                 bot_data=bot_dict,
                 ai_config=bot_dict['ai_config'],
                 user_message=chat_request.message,
                 chat_history=chat_history
             )
-            logger.info(f"✅ Resposta da IA gerada com sucesso")
+            ai_response = generation["content"]
+            model_used = generation["model"] or "none"
+            logger.debug("✅ Resposta da IA gerada com sucesso")
+        except BudgetExceeded:
+            raise
         except Exception as e:
-            logger.error(f"❌ Erro no AI Service: {str(e)}")
+            logger.error("❌ Erro no AI Service: %s", e)
             # Fallback para resposta simulada baseada no personagem
             fallback_responses = {
                 "Pimenta (Pip)": "💫 *Chocalho!* Algo interrompeu minha conexão mágica... Mas sinto que você queria compartilhar algo importante!",
@@ -657,30 +1079,113 @@ async def chat_with_bot(bot_id: str, chat_request: ChatRequest):
             ai_response = fallback_responses.get(bot_dict['name'], "🤖 Estou tendo problemas técnicos no momento. Tente novamente!")
         
         # Salvar resposta do bot
-        bot_message_id = str(uuid.uuid4())
-        cursor.execute(
-            "INSERT INTO messages (id, conversation_id, content, is_user) VALUES (?, ?, ?, ?)",
-            (bot_message_id, conversation_id, ai_response, False)
-        )
+        with start_span("chat.persist", **{"conversation.id": conversation_id}):
+            if conn is None:
+                # Modo commit espera o COMMIT do lote; modo enqueue responde já
+                ticket = message_writer.write(chat_turn_writes(
+                    bot_id, conversation_id, new_conversation, chat_request.message, user_tokens, ai_response, generation
+                ))
+                bot_tokens = count_tokens(ai_response, generation["model"] if generation else None)
+                history_cache.append_turn(conversation_id, chat_request.message, ai_response, new_conversation,
+                                          user_tokens, bot_tokens)
+                # Se o lote falhar depois (modo enqueue), a janela em cache deixa de valer
+                ticket.add_done_callback(lambda error: error and history_cache.invalidate(conversation_id))
+            else:
+                bot_tokens = save_bot_reply(cursor, bot_id, conversation_id, ai_response, generation)
+                conn.commit()
+                conn.close()
+                # Write-through: o próximo turno monta o prompt sem ler o histórico
+                history_cache.append_turn(conversation_id, chat_request.message, ai_response, new_conversation,
+                                          user_tokens, bot_tokens)
         
-        conn.commit()
-        conn.close()
+        outcome = "ok" if generation and generation.get("model") else "fallback"
+        mark_conversation_active(conversation_id, bot_id)
         
         return {
             "response": ai_response,
             "conversation_id": conversation_id,
             "bot_id": bot_id,
-            "bot_name": bot_dict['name']
+            "bot_name": bot_dict['name'],
+            # None quando nenhum modelo respondeu (a resposta é o fallback do personagem)
+            "model": generation["model"] if generation else None
         }
         
-    except HTTPException:
+    except (HTTPException, BudgetExceeded) as e:
+        if e.status_code < 500:
+            outcome = "rejected"
         raise
     except Exception as e:
-        logger.error(f"💥 Erro geral no chat: {str(e)}")
+        logger.exception("💥 Erro geral no chat: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro no chat: {str(e)}")
+    finally:
+        # Em caso de erro, fechar sem commit desfaz a transação e libera o lock de escrita
+        if conn is not None:
+            conn.close()
+        # Turnos que falham também entram na latência (separados pelo label outcome)
+        CHAT_LATENCY.observe(time.perf_counter() - turn_start, bot=bot_label(bot_id), model=model_used, outcome=outcome)
+
+@app.get("/usage")
+def get_usage(bot_id: Optional[str] = None, days: int = 7):
+    """Tokens e latência agregados por bot e por dia (UTC)"""
+    conn = get_db_connection()
+    try:
+        return get_bot_usage(conn.cursor(), bot_id=bot_id, days=max(1, min(days, 90)))
+    finally:
+        conn.close()
+
+@app.get("/conversations/{conversation_id}/usage")
+def conversation_usage(conversation_id: str):
+    """Tokens e latência acumulados de uma conversa"""
+    conn = get_db_connection()
+    try:
+        usage = get_conversation_usage(conn.cursor(), conversation_id)
+    finally:
+        conn.close()
+    if usage is None:
+        raise HTTPException(status_code=404, detail="Sem uso registrado para esta conversa")
+    return usage
+
+@app.get("/conversations/{conversation_id}/tokens")
+def conversation_tokens(conversation_id: str, max_tokens: Optional[int] = None):
+    """Tamanho da conversa em tokens e quantas mensagens recentes cabem em max_tokens"""
+    if max_tokens is not None and max_tokens < 1:
+        raise HTTPException(status_code=400, detail="max_tokens deve ser positivo")
+    conn = get_db_connection()
+    try:
+        window = conversation_token_window(conn.cursor(), conversation_id, max_tokens)
+    finally:
+        conn.close()
+    if window is None:
+        raise HTTPException(status_code=404, detail="Conversa não encontrada")
+    return window
+
+@app.get("/search")
+def search(q: str, type: str = "all", limit: int = 20, offset: int = 0,
+           bot_id: Optional[str] = None, conversation_id: Optional[str] = None):
+    """Busca full-text (FTS5) em bots e, com conversation_id, no histórico daquela conversa"""
+    if not search_state["available"]:
+        raise HTTPException(status_code=503, detail="Busca indisponível: SQLite sem suporte a FTS5")
+    if type not in ("all", "bots", "messages"):
+        raise HTTPException(status_code=400, detail="type deve ser all, bots ou messages")
+    if type == "messages" and not conversation_id:
+        raise HTTPException(status_code=400, detail="Busca em mensagens exige conversation_id")
+    
+    match = build_match_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma palavra em q")
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+    
+    conn = get_db_connection()
+    try:
+        result = {"query": q, "limit": limit, "offset": offset}
+        result.update(run_search(conn.cursor(), match, type, limit, offset, bot_id, conversation_id))
+        return result
+    finally:
+        conn.close()
 
 @app.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: str):
+def get_conversation(conversation_id: str):
     """Obter histórico completo de uma conversa"""
     try:
         conn = get_db_connection()
@@ -692,6 +1197,8 @@ async def get_conversation(conversation_id: str):
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversa não encontrada")
         
+        rehydrate_conversation(conn, conversation_id)
+        
         cursor.execute('''
             SELECT * FROM messages 
             WHERE conversation_id = ? 
@@ -714,7 +1221,11 @@ async def get_conversation(conversation_id: str):
                     "id": msg['id'],
                     "content": msg['content'],
                     "is_user": bool(msg['is_user']),
-                    "created_at": msg['created_at']
+                    "created_at": msg['created_at'],
+                    "prompt_tokens": msg['prompt_tokens'],
+                    "completion_tokens": msg['completion_tokens'],
+                    "latency_ms": msg['latency_ms'],
+                    "model": msg['model']
                 }
                 for msg in messages
             ]
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, String, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Table, Text, func
+from sqlalchemy.orm import relationship
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from database import Base
 import json
 
@@ -45,3 +48,71 @@ class Bot(Base):
             "system_prompt": self.system_prompt,
             "ai_config": ai_config
         }
+
+
+# --- Grupos (routers/groups.py) ---
+# O schema destas tabelas vem das migrações (ORM_MIGRATIONS / POSTGRES_MIGRATIONS)
+
+group_bots = Table(
+    "group_bots",
+    Base.metadata,
+    Column("group_id", Integer, ForeignKey("groups.id"), primary_key=True),
+    Column("bot_id", String, ForeignKey("bots.id"), primary_key=True),
+)
+
+class Group(Base):
+    __tablename__ = "groups"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    scenario = Column(Text)
+    bots = relationship("Bot", secondary=group_bots)
+
+class Message(Base):
+    # "messages" é a tabela das conversas da API principal (mesmo banco no Postgres)
+    __tablename__ = "group_messages"
+    # Histórico paginado e janela do prompt: filtro por grupo já na ordem do id
+    __table_args__ = (Index("ix_group_messages_group_id_id", "group_id", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    sender_id = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.current_timestamp())
+
+# --- Schemas dos grupos ---
+
+class GroupCreate(BaseModel):
+    name: str
+    scenario: Optional[str] = None
+    bot_ids: List[str] = Field(default_factory=list)
+
+class GroupBotRead(BaseModel):
+    id: str
+    name: str
+
+    class Config:
+        from_attributes = True
+
+class GroupRead(BaseModel):
+    id: int
+    name: str
+    scenario: Optional[str] = None
+    bots: List[GroupBotRead] = Field(default_factory=list)
+
+    class Config:
+        from_attributes = True
+
+class MessageSend(BaseModel):
+    group_id: int
+    sender_id: str
+    text: str
+
+class MessageRead(BaseModel):
+    id: int
+    group_id: int
+    sender_id: str
+    text: str
+
+    class Config:
+        from_attributes = True
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
+import hashlib
 import uuid
 import logging
 import random
@@ -10,21 +11,33 @@ import random
 from database import get_db
 from models import Bot
 from schemas import ChatRequest, ChatResponse, BotDisplay
+from services.rate_limiter import admit_bot_chat
+from services.idempotency import (
+    run_idempotent,
+    derive_idempotency_key,
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_DERIVED_TTL_SECONDS,
+)
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
-# Importação do serviço AI
+# Importação do serviço AI (a instância é compartilhada e criada no primeiro uso)
 try:
-    from services.ai_service import AIService
-    ai_service = AIService()
-    logger.info("✅ AIService carregado com sucesso")
+    from services.ai_service import shared_ai_service
 except ImportError as e:
     logger.error(f"❌ Erro ao importar AIService: {e}")
-    ai_service = None
-except Exception as e:
-    logger.error(f"❌ Erro na inicialização do AIService: {e}")
-    ai_service = None
+    shared_ai_service = None
+
+def get_ai_service():
+    """AIService compartilhado, ou None se não puder ser criado"""
+    if shared_ai_service is None:
+        return None
+    try:
+        return shared_ai_service()
+    except Exception as e:
+        logger.error(f"❌ Erro na inicialização do AIService: {e}")
+        return None
 
 router = APIRouter(prefix="/bots", tags=["Bots"])
 
@@ -32,7 +45,7 @@ router = APIRouter(prefix="/bots", tags=["Bots"])
 def list_bots(db: Session = Depends(get_db)):
     """Lista todos os bots disponíveis"""
     try:
-        logger.info("📋 Buscando lista de bots")
+        logger.debug("📋 Buscando lista de bots")
         bots = db.query(Bot).all()
         result = []
         
@@ -57,16 +70,50 @@ def list_bots(db: Session = Depends(get_db)):
             }
             result.append(BotDisplay(**bot_data))
         
-        logger.info(f"✅ Retornando {len(result)} bots")
+        logger.debug("✅ Retornando %d bots", len(result))
         return result
         
     except Exception as e:
         logger.error(f"❌ Erro em list_bots: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
-@router.post("/chat/{bot_id}", response_model=ChatResponse)
-def chat_with_bot(bot_id: str, request: ChatRequest, db: Session = Depends(get_db)):
-    """Chat com bot usando OpenRouter com prevenção de loop"""
+@router.post("/chat/{bot_id}", response_model=ChatResponse, dependencies=[Depends(admit_bot_chat)])
+def chat_with_bot(
+    bot_id: str,
+    request: ChatRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Chat com bot usando OpenRouter com prevenção de loop (idempotente)"""
+    if idempotency_key:
+        key = derive_idempotency_key("router_chat", bot_id, idempotency_key)
+        ttl = IDEMPOTENCY_TTL_SECONDS
+    else:
+        # Sem chave explícita: o histórico enviado + a mensagem identificam o turno
+        turn_hash = hashlib.sha256(
+            json.dumps([request.chat_history, request.user_message], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        key = derive_idempotency_key("router_chat", bot_id, turn_hash)
+        ttl = IDEMPOTENCY_DERIVED_TTL_SECONDS
+    
+    # Resposta de contingência (model None) não é guardada: o reenvio tenta a IA de novo
+    result, replayed = run_idempotent(
+        key,
+        "router_chat",
+        lambda: _generate_chat_response(bot_id, request, db),
+        ttl=ttl,
+        store_if=lambda result: result.get("model") is not None
+    )
+    
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    
+    return ChatResponse(ai_response=result["ai_response"])
+
+def _generate_chat_response(bot_id: str, request: ChatRequest, db: Session) -> Dict[str, Any]:
+    """Gera a resposta do bot para um turno de chat ({"ai_response", "model"}; model None no fallback)"""
+    ai_service = get_ai_service()
     if not ai_service:
         logger.error("❌ Serviço de IA não disponível")
         raise HTTPException(status_code=500, detail="Serviço de IA não disponível")
@@ -78,7 +125,7 @@ def chat_with_bot(bot_id: str, request: ChatRequest, db: Session = Depends(get_d
     if len(request.user_message) > 1000:
         raise HTTPException(status_code=400, detail="Mensagem muito longa (máximo 1000 caracteres)")
     
-    logger.info(f"💬 Iniciando chat com bot {bot_id}")
+    logger.debug("💬 Iniciando chat com bot %s", bot_id)
     
     # Buscar bot
     bot = db.query(Bot).filter(Bot.id == bot_id).first()
@@ -100,21 +147,24 @@ def chat_with_bot(bot_id: str, request: ChatRequest, db: Session = Depends(get_d
         ai_config = {"temperature": 0.7, "max_output_tokens": 400}
 
     try:
-        logger.info(f"🤖 Gerando resposta para: {request.user_message[:50]}...")
+        logger.debug("🤖 Gerando resposta para: %.50s...", request.user_message)
         
         # Usar o método to_dict do model
         bot_dict = bot.to_dict()
         
-        ai_response = ai_service.generate_response(
+        generation = ai_service.generate_response_detailed(
             bot_data=bot_dict,
             ai_config=ai_config,
             user_message=request.user_message,
             chat_history=request.chat_history
         )
+        ai_response = generation["content"]
+        model = generation["model"]
         
         # 🔥 PREVENÇÃO DE LOOP: Se a resposta for erro, usar fallback criativo
-        if any(keyword in ai_response.lower() for keyword in ['❌', 'erro', 'dificuldade', 'problema', 'falha', 'todos os modelos']):
+        if model is None or any(keyword in ai_response.lower() for keyword in ['❌', 'erro', 'dificuldade', 'problema', 'falha', 'todos os modelos']):
             logger.warning("⚠️ Usando fallback criativo devido a erro na IA")
+            model = None
             
             # Fallbacks específicos para cada bot baseados na personalidade
             fallback_responses = {
@@ -152,8 +202,8 @@ def chat_with_bot(bot_id: str, request: ChatRequest, db: Session = Depends(get_d
                 ]
                 ai_response = random.choice(generic_fallbacks)
         
-        logger.info(f"✅ Resposta gerada: {ai_response[:100]}...")
-        return ChatResponse(ai_response=ai_response)
+        logger.debug("✅ Resposta gerada: %.100s...", ai_response)
+        return {"ai_response": ai_response, "model": model}
         
     except Exception as e:
         error_msg = f"Erro na IA: {str(e)}"
@@ -166,7 +216,7 @@ def chat_with_bot(bot_id: str, request: ChatRequest, db: Session = Depends(get_d
             f"💫 {bot.name}: Estou passando por uma metamorfose linguística momentânea! Sua presença, no entanto, é minha âncora. Compartilhe seus pensamentos..."
         ]
         fallback = random.choice(fallbacks)
-        return ChatResponse(ai_response=fallback)
+        return {"ai_response": fallback, "model": None}
 
 @router.post("/import")
 def import_bots(import_data: Dict[str, Any], db: Session = Depends(get_db)):
@@ -261,7 +311,7 @@ def import_bots(import_data: Dict[str, Any], db: Session = Depends(get_db)):
 def get_bot(bot_id: str, db: Session = Depends(get_db)):
     """Obter detalhes de um bot específico"""
     try:
-        logger.info(f"📋 Buscando bot {bot_id}")
+        logger.debug("📋 Buscando bot %s", bot_id)
         bot = db.query(Bot).filter(Bot.id == bot_id).first()
         
         if not bot:
@@ -319,6 +369,7 @@ def delete_bot(bot_id: str, db: Session = Depends(get_db)):
 @router.get("/health/ai")
 def check_ai_health():
     """Verificar saúde do serviço de IA"""
+    ai_service = get_ai_service()
     if not ai_service:
         return {
             "status": "unhealthy",
@@ -328,7 +379,7 @@ def check_ai_health():
     
     try:
         # Testar conexão básica
-        test_result = ai_service._test_api_connection() if hasattr(ai_service, '_test_api_connection') else False
+        test_result = ai_service.check_connection()
         
         return {
             "status": "healthy" if test_result else "unhealthy",
@@ -1,38 +1,88 @@
 # c:\cringe\3.0\routers\groups.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import get_db
-# Certifique-se de que estes modelos (Bot, Message, etc.) estão no seu models.py
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from sqlalchemy.orm import Session, selectinload
+from typing import Optional
+from database import get_db, SessionLocal
 from models import Group, GroupRead, GroupCreate, Bot, Message, MessageSend, MessageRead
 import json
 import os 
+import hashlib
+import threading
 from dotenv import load_dotenv # <-- Adicionado para carregar o .env
+from services.idempotency import (
+    run_idempotent,
+    derive_idempotency_key,
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_DERIVED_TTL_SECONDS,
+)
+from services.job_queue import job_queue, worker_pool
+from services.rate_limiter import admit_request
 
 # --- Configuração LLM (Google Gemini) ---
 
-# Carrega as variáveis de ambiente do arquivo .env
-# Isso permite que o genai.Client() encontre a GEMINI_API_KEY
-load_dotenv()
-
-client = None
 GEMINI_MODEL = "gemini-2.5-flash" 
 
-try:
-    from google import genai
-    from google.genai.errors import APIError
-    
-    # O cliente genai.Client() agora buscará a chave GEMINI_API_KEY automaticamente 
-    # se ela estiver corretamente configurada no seu .env.
-    client = genai.Client() 
-except ImportError:
-    print("AVISO: O SDK 'google-genai' não está instalado. A resposta do bot será um MOCK.")
-except Exception as e:
-    # Captura o erro, geralmente a chave API ausente, e mantém o cliente como None
-    print(f"AVISO: Não foi possível inicializar o cliente Gemini. Resposta do bot será um MOCK. Erro: {e}")
+# O SDK (import pesado) e o cliente só são carregados na primeira mensagem,
+# não no import do módulo: o serviço sobe rápido e mesmo sem rede.
+_client = None
+_client_loaded = False
+_client_lock = threading.Lock()
+
+class APIError(Exception):
+    """Substituída pela exceção do SDK quando o google-genai é carregado."""
+
+def get_gemini_client():
+    """Cliente Gemini compartilhado, ou None (resposta MOCK) se o SDK/chave não estiverem disponíveis."""
+    global _client, _client_loaded, APIError
+    if _client_loaded:
+        return _client
+    with _client_lock:
+        if _client_loaded:
+            return _client
+        
+        # Carrega as variáveis de ambiente do arquivo .env
+        # Isso permite que o genai.Client() encontre a GEMINI_API_KEY
+        load_dotenv()
+        # Permite apontar o SDK para o mock de testes de carga (loadtest/mock_llm_server.py)
+        base_url = os.getenv("GEMINI_API_BASE_URL")
+        
+        try:
+            from google import genai
+            from google.genai.errors import APIError as SdkAPIError
+            APIError = SdkAPIError
+            
+            # O cliente genai.Client() agora buscará a chave GEMINI_API_KEY automaticamente 
+            # se ela estiver corretamente configurada no seu .env.
+            if base_url:
+                _client = genai.Client(http_options={"base_url": base_url})
+            else:
+                _client = genai.Client() 
+        except ImportError:
+            print("AVISO: O SDK 'google-genai' não está instalado. A resposta do bot será um MOCK.")
+        except Exception as e:
+            # Captura o erro, geralmente a chave API ausente, e mantém o cliente como None
+            print(f"AVISO: Não foi possível inicializar o cliente Gemini. Resposta do bot será um MOCK. Erro: {e}")
+        _client_loaded = True
+    return _client
 
 router = APIRouter(prefix="/groups", tags=["Groups"])
 
+# Paginação por cursor (keyset): o custo de uma página não cresce com o tamanho da campanha.
+# O corpo continua sendo a lista; o cursor da próxima página vai no header X-Next-Cursor.
+# Sem ?limit nem cursor a resposta é a lista completa, como antes da paginação
+GROUPS_PAGE_SIZE = int(os.getenv("GROUPS_PAGE_SIZE", "50"))
+GROUP_MESSAGES_PAGE_SIZE = int(os.getenv("GROUP_MESSAGES_PAGE_SIZE", "50"))
+PAGE_SIZE_MAX = 200
+# Mensagens do grupo usadas como histórico do prompt
+GROUP_HISTORY_MESSAGES = 20
+
+def _page_size(limit: Optional[int], cursor: Optional[int], default: int) -> Optional[int]:
+    """Tamanho da página, ou None (lista completa) quando o cliente não pagina."""
+    if limit is None and cursor is None:
+        return None
+    return max(1, min(limit or default, PAGE_SIZE_MAX))
+
 # ----------------------------------------------------------------------
 # FUNÇÃO AUXILIAR: Geração da Resposta do Bot (Com Lógica Gemini)
 # ----------------------------------------------------------------------
@@ -43,6 +93,7 @@ def generate_bot_response(db: Session, group: Group, user_message: str):
     """
     
     # Se o cliente Gemini não inicializou, retorna o mock
+    client = get_gemini_client()
     if client is None:
         main_bot = group.bots[0] if group.bots else None
         if not main_bot:
@@ -62,7 +113,15 @@ def generate_bot_response(db: Session, group: Group, user_message: str):
         
         # 2. Obter o Histórico (Últimas 20 mensagens)
         # O histórico é crucial para manter a continuidade da conversa.
-        messages_db = db.query(Message).filter(Message.group_id == group.id).order_by(Message.id.asc()).limit(20).all()
+        # Do mais novo para trás pelo índice (group_id, id), depois em ordem cronológica
+        messages_db = (
+            db.query(Message)
+            .filter(Message.group_id == group.id)
+            .order_by(Message.id.desc())
+            .limit(GROUP_HISTORY_MESSAGES)
+            .all()
+        )
+        messages_db.reverse()
         
         # Converte o histórico para o formato da API do Gemini (role e parts)
         history = []
@@ -101,9 +160,21 @@ def generate_bot_response(db: Session, group: Group, user_message: str):
 # ----------------------------------------------------------------------
 
 @router.get("/", response_model=list[GroupRead])
-def list_groups(db: Session = Depends(get_db)):
-    """Lista todos os grupos do banco de dados."""
-    return db.query(Group).all()
+def list_groups(response: Response, after: Optional[int] = None, limit: Optional[int] = None,
+                db: Session = Depends(get_db)):
+    """Lista os grupos em ordem de id; com ?limit= (e ?after=<X-Next-Cursor>) uma página por vez."""
+    limit = _page_size(limit, after, GROUPS_PAGE_SIZE)
+    # selectinload: os bots de todos os grupos da página vêm em uma única query (sem N+1)
+    query = db.query(Group).options(selectinload(Group.bots)).order_by(Group.id.asc())
+    if limit is None:
+        return query.all()
+    if after is not None:
+        query = query.filter(Group.id > after)
+    groups = query.limit(limit + 1).all()
+    if len(groups) > limit:
+        groups = groups[:limit]
+        response.headers["X-Next-Cursor"] = str(groups[-1].id)
+    return groups
 
 @router.post("/", response_model=GroupRead)
 def create_group(group: GroupCreate, db: Session = Depends(get_db)):
@@ -124,52 +195,125 @@ def create_group(group: GroupCreate, db: Session = Depends(get_db)):
     return db_group
 
 @router.get("/{group_id}/messages", response_model=list[MessageRead])
-def list_messages(group_id: int, db: Session = Depends(get_db)):
-    """Lista o histórico de mensagens para um grupo específico."""
+def list_messages(group_id: int, response: Response, before: Optional[int] = None,
+                  limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Histórico do grupo em ordem cronológica. Com ?limit= vem paginado por id: a
+    primeira página traz as mensagens mais recentes; ?before=<X-Next-Cursor> traz as anteriores.
+    """
+    limit = _page_size(limit, before, GROUP_MESSAGES_PAGE_SIZE)
     
-    group = db.query(Group).filter(Group.id == group_id).first()
-    if not group:
+    if not db.query(Group.id).filter(Group.id == group_id).first():
         raise HTTPException(status_code=404, detail="Grupo não encontrado.")
 
-    messages = db.query(Message).filter(Message.group_id == group_id).all()
+    query = db.query(Message).filter(Message.group_id == group_id)
+    if limit is None:
+        return query.order_by(Message.id.asc()).all()
+    if before is not None:
+        query = query.filter(Message.id < before)
+    messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    if len(messages) > limit:
+        messages = messages[:limit]
+        response.headers["X-Next-Cursor"] = str(messages[-1].id)
+    messages.reverse()
     
     return messages
 
 
-@router.post("/send_message")
-def send_message(message_data: MessageSend, db: Session = Depends(get_db)):
-    """Recebe a mensagem do jogador, salva, chama o LLM e salva a resposta do bot."""
+@router.post("/send_message", dependencies=[Depends(admit_request)])
+def send_message(
+    message_data: MessageSend,
+    response: Response,
+    async_mode: bool = False,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Recebe a mensagem do jogador, salva, chama o LLM e salva a resposta do bot (idempotente)."""
+    
+    # Chave explícita do cliente ou derivada de grupo + remetente + hash do texto
+    if idempotency_key:
+        key = derive_idempotency_key("group", message_data.group_id, idempotency_key)
+        ttl = IDEMPOTENCY_TTL_SECONDS
+    else:
+        text_hash = hashlib.sha256(message_data.text.strip().encode("utf-8")).hexdigest()
+        key = derive_idempotency_key("group", message_data.group_id, message_data.sender_id, text_hash)
+        ttl = IDEMPOTENCY_DERIVED_TTL_SECONDS
+    
+    if async_mode:
+        if not job_queue.enabled:
+            raise HTTPException(status_code=503, detail="Fila de jobs indisponível: defina JOB_QUEUE_DB_PATH")
+        # Modo assíncrono: enfileira a geração e devolve o id do job imediatamente
+        job, created = job_queue.enqueue(
+            "group_message",
+            message_data.model_dump(),
+            provider=worker_pool.provider_for("group_message"),
+            job_id=derive_idempotency_key("group_job", key)
+        )
+        if not created:
+            response.headers["Idempotent-Replayed"] = "true"
+        response.status_code = 202
+        return {"job_id": job["job_id"], "status": job["status"], "status_url": f"/jobs/{job['job_id']}"}
+    
+    result, replayed = run_idempotent(
+        key,
+        "group_message",
+        lambda: process_group_message(message_data, db),
+        ttl=ttl
+    )
+    
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    
+    return result
+
+
+def process_group_message(message_data: MessageSend, db: Session) -> dict:
+    """Salva a mensagem do jogador, gera e salva a resposta do bot."""
     
     group = db.query(Group).filter(Group.id == message_data.group_id).first()
     if not group:
         raise HTTPException(status_code=404, detail="Grupo não encontrado.")
     
-    # 1. Salva a mensagem do JOGADOR
+    # 1. Gera a resposta do BOT (CHAMADA REAL AO GEMINI ou MOCK)
+    # A mensagem atual entra no histórico pelo próprio generate_bot_response,
+    # então nada é gravado antes: nenhum lock de escrita durante a chamada ao LLM
+    bot_response_text, bot_id = generate_bot_response(db, group, message_data.text)
+
+    # 2. Mensagem do JOGADOR e resposta do BOT na mesma transação (um COMMIT por turno)
     db_user_message = Message(
         group_id=message_data.group_id,
         sender_id=message_data.sender_id,
         text=message_data.text,
     )
     db.add(db_user_message)
-    db.commit()
-    db.refresh(db_user_message)
-    
-    # 2. Gera a resposta do BOT (CHAMADA REAL AO GEMINI ou MOCK)
-    bot_response_text, bot_id = generate_bot_response(db, group, message_data.text)
 
     if bot_id is None:
         # Se falhar ou não houver bot, apenas retorna a confirmação da mensagem do usuário
+        db.commit()
         return {"status": "User message saved, no bot response generated."}
 
-    # 3. Salva a resposta do BOT
     db_bot_message = Message(
         group_id=message_data.group_id,
         sender_id=f"bot-{bot_id}", # Identificador único do Bot
         text=bot_response_text,
     )
     db.add(db_bot_message)
+    # flush atribui os ids; lidos antes do commit, dispensam o refresh (SELECT extra)
+    db.flush()
+    ids = {"user_message_id": db_user_message.id, "bot_message_id": db_bot_message.id}
     db.commit()
-    db.refresh(db_bot_message)
     
-    # 4. Retorna sucesso
-    return {"status": "Message and response received", "user_message_id": db_user_message.id, "bot_message_id": db_bot_message.id}
\ No newline at end of file
+    # 3. Retorna sucesso
+    return {"status": "Message and response received", **ids}
+
+
+def run_group_message_job(payload: dict) -> dict:
+    """Executa um job de mensagem de grupo enfileirado (chamado pelos workers)."""
+    db = SessionLocal()
+    try:
+        return process_group_message(MessageSend(**payload), db)
+    finally:
+        db.close()
+
+
+worker_pool.register_handler("group_message", run_group_message_job, provider="gemini")
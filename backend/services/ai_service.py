@@ -2,13 +2,33 @@ import os
 import httpx
 import time
 import logging
-from typing import Dict, Any, List
+import threading
+from typing import Dict, Any, List, Optional
+
+from services.metrics import (
+    bot_label,
+    LLM_LATENCY,
+    LLM_ATTEMPTS,
+    LLM_RETRIES,
+    LLM_FALLBACKS,
+    LLM_PROMPT_TOKENS,
+    LLM_COMPLETION_TOKENS,
+)
+from services.tracing import start_span, record_span
+from services.usage import BudgetExceeded, enforce_prompt_budget
 
 logger = logging.getLogger(__name__)
 
-OPENROUTER_API_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Configurável para apontar para o mock de testes de carga (loadtest/mock_llm_server.py)
+OPENROUTER_API_BASE_URL = os.getenv("OPENROUTER_API_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
 MAX_RETRIES = 3
+# Mensagens do histórico enviadas no prompt (as mais recentes)
+PROMPT_HISTORY_MESSAGES = 8
 BACKOFF_FACTOR = 1.5
+# Por quanto tempo o resultado do teste de conexão vale (antes era refeito a cada chamada)
+AI_CONNECTION_CHECK_TTL = float(os.getenv("AI_CONNECTION_CHECK_TTL", "300"))
+# Falhas valem por menos tempo, para o serviço se recuperar logo quando a conexão volta
+AI_CONNECTION_FAILURE_TTL = float(os.getenv("AI_CONNECTION_FAILURE_TTL", "15"))
 
 class AIService:
     def __init__(self):
@@ -17,10 +37,11 @@ class AIService:
         
         # Log mais informativo
         if self.api_key:
-            logger.info(f"🔑 AIService inicializado - API Key: ✅ PRESENTE ({len(self.api_key)} caracteres)")
+            logger.info("🔑 AIService inicializado - API Key: ✅ PRESENTE (%d caracteres)", len(self.api_key))
             # Log apenas os primeiros e últimos 4 caracteres para segurança
-            masked_key = f"{self.api_key[:4]}...{self.api_key[-4:]}" if len(self.api_key) > 8 else "***"
-            logger.info(f"🔑 API Key (mascarada): {masked_key}")
+            if logger.isEnabledFor(logging.DEBUG):
+                masked_key = f"{self.api_key[:4]}...{self.api_key[-4:]}" if len(self.api_key) > 8 else "***"
+                logger.debug("🔑 API Key (mascarada): %s", masked_key)
         else:
             logger.error("❌ OPENROUTER_API_KEY não encontrada!")
             logger.info("💡 Configure a variável de ambiente OPENROUTER_API_KEY")
@@ -44,6 +65,37 @@ class AIService:
         self.current_model_index = 0
         # CORREÇÃO: Timeout aumentado
         self.http_client = httpx.Client(timeout=60.0)
+        
+        # Cache do teste de conexão: (resultado, instante da verificação)
+        self._connection_status: Optional[bool] = None
+        self._connection_checked_at = 0.0
+        self._connection_lock = threading.Lock()
+
+    def check_connection(self, force: bool = False) -> bool:
+        """Teste de conexão com cache (AI_CONNECTION_CHECK_TTL); force=True refaz a chamada"""
+        if not force and self._connection_fresh():
+            return self._connection_status
+        with self._connection_lock:
+            # Outra thread pode ter acabado de verificar enquanto esperávamos o lock
+            if not force and self._connection_fresh():
+                return self._connection_status
+            self._mark_connection(self._test_api_connection())
+            return self._connection_status
+
+    def _connection_fresh(self) -> bool:
+        if self._connection_status is None:
+            return False
+        ttl = AI_CONNECTION_CHECK_TTL if self._connection_status else AI_CONNECTION_FAILURE_TTL
+        return time.monotonic() - self._connection_checked_at < ttl
+
+    def _mark_connection(self, ok: bool):
+        self._connection_status = ok
+        self._connection_checked_at = time.monotonic()
+
+    @property
+    def connection_status(self) -> Optional[bool]:
+        """Último resultado conhecido do teste de conexão (None se nunca verificado), sem rede"""
+        return self._connection_status
 
     def _test_api_connection(self) -> bool:
         """Testa a conexão com a API OpenRouter"""
@@ -64,9 +116,7 @@ class AIService:
                 "temperature": 0.1
             }
             
-            logger.info(f"🔍 Testando conexão com OpenRouter...")
-            logger.info(f"📡 URL: {self.api_url}")
-            logger.info(f"🔑 Headers: Authorization: Bearer ***")
+            logger.debug("🔍 Testando conexão com OpenRouter (%s)", self.api_url)
             
             response = self.http_client.post(
                 self.api_url,
@@ -75,16 +125,16 @@ class AIService:
                 timeout=15
             )
             
-            logger.info(f"📥 Resposta do teste: Status {response.status_code}")
+            logger.debug("📥 Resposta do teste: Status %s", response.status_code)
             
             if response.status_code == 200:
                 result = response.json()
                 content = result['choices'][0]['message']['content'].strip()
-                logger.info(f"✅ Conexão com OpenRouter: OK - Resposta: '{content}'")
+                logger.debug("✅ Conexão com OpenRouter: OK - Resposta: '%s'", content)
                 return True
             elif response.status_code == 401:
                 logger.error("❌ API Key inválida ou não autorizada")
-                logger.error(f"🔍 Resposta completa: {response.text}")
+                logger.error("🔍 Resposta completa: %s", response.text)
                 return False
             elif response.status_code == 402:
                 logger.error("❌ Sem créditos ou limite excedido")
@@ -93,7 +143,7 @@ class AIService:
                 logger.error("❌ Rate limit excedido")
                 return False
             else:
-                logger.error(f"❌ Erro HTTP {response.status_code}: {response.text}")
+                logger.error("❌ Erro HTTP %s: %s", response.status_code, response.text)
                 return False
                 
         except httpx.TimeoutException:
@@ -103,83 +153,142 @@ class AIService:
             logger.error("🔌 Erro de conexão - não foi possível conectar ao OpenRouter")
             return False
         except Exception as e:
-            logger.error(f"💥 Erro inesperado na conexão: {str(e)}")
+            logger.error("💥 Erro inesperado na conexão: %s", e)
             return False
 
-    def _call_openrouter_api(self, payload: Dict[str, Any]) -> str:
-        """Faz chamada para API OpenRouter com fallback"""
+    def _call_openrouter_api(self, payload: Dict[str, Any], bot_id: Optional[str] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Faz chamada para API OpenRouter com fallback.
+        Retorna {"content", "model", "usage", "attempts"}; model é None quando nenhum modelo respondeu.
+        deadline (time.monotonic) limita o tempo total somando retries, backoffs e fallbacks.
+        """
+        bot = bot_label(bot_id)
         
         if not self.api_key:
-            return "🔌 Erro: API Key do OpenRouter não configurada."
+            return self._failed_result("🔌 Erro: API Key do OpenRouter não configurada.", attempts=0)
         
         # Testar conexão primeiro
-        if not self._test_api_connection():
-            return "🔌 Problema de conexão com o serviço de IA. Verifique a API Key e conexão."
+        with start_span("llm.connection_test") as span:
+            connected = self.check_connection()
+            span.set_attribute("llm.connected", connected)
+        if not connected:
+            return self._failed_result("🔌 Problema de conexão com o serviço de IA. Verifique a API Key e conexão.", attempts=0)
+
+        total_attempts = 0
 
         # Tentar cada modelo disponível
         for model_index in range(len(self.available_models)):
             current_model = self.available_models[model_index]
             payload["model"] = current_model
             
-            logger.info(f"🔄 Tentando modelo: {current_model}")
+            logger.debug("🔄 Tentando modelo: %s", current_model)
             
             for attempt in range(MAX_RETRIES):
+                timeout = 45.0
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning("⏱️ Orçamento de latência esgotado após %d tentativas", total_attempts)
+                        LLM_ATTEMPTS.observe(total_attempts, bot=bot, model="none")
+                        return self._failed_result("⏱️ A resposta demorou demais. Tente novamente em instantes.", attempts=total_attempts)
+                    timeout = min(timeout, remaining)
+                
+                total_attempts += 1
+                if attempt > 0:
+                    LLM_RETRIES.inc(bot=bot, model=current_model)
+                attempt_start = time.perf_counter()
                 try:
-                    logger.info(f"📤 Tentativa {attempt + 1} para {current_model}")
+                    logger.debug("📤 Tentativa %d para %s", attempt + 1, current_model)
                     
                     response = self.http_client.post(
                         self.api_url,
                         headers=self.headers,
                         json=payload,
-                        timeout=45.0
+                        timeout=timeout
                     )
+                    # Latência da tentativa em si (sem o backoff que vem depois)
+                    self._observe_attempt(bot, current_model, attempt, str(response.status_code), time.perf_counter() - attempt_start)
                     
-                    logger.info(f"📥 Status: {response.status_code}")
+                    logger.debug("📥 Status: %s", response.status_code)
                     
                     if response.status_code == 200:
                         result = response.json()
                         content = result['choices'][0]['message']['content'].strip()
-                        logger.info(f"✅ Resposta recebida com sucesso do modelo {current_model}")
-                        logger.info(f"📝 Resposta (primeiros 100 chars): {content[:100]}...")
+                        usage = result.get('usage') or {}
+                        logger.debug("✅ Resposta recebida do modelo %s: %.100s...", current_model, content)
                         self.current_model_index = model_index
-                        return content
+                        self._mark_connection(True)
+                        
+                        LLM_ATTEMPTS.observe(total_attempts, bot=bot, model=current_model)
+                        LLM_PROMPT_TOKENS.inc(usage.get('prompt_tokens', 0), bot=bot, model=current_model)
+                        LLM_COMPLETION_TOKENS.inc(usage.get('completion_tokens', 0), bot=bot, model=current_model)
+                        return {
+                            "content": content,
+                            "model": current_model,
+                            "usage": usage,
+                            "attempts": total_attempts
+                        }
                     
                     elif response.status_code == 402:
-                        logger.warning(f"⚠️ Sem créditos para {current_model}")
+                        logger.warning("⚠️ Sem créditos para %s", current_model)
                         break  # Pula para o próximo modelo
                     
                     elif response.status_code == 429:
                         wait_time = BACKOFF_FACTOR * (2 ** attempt)
-                        logger.warning(f"⏰ Rate limit, aguardando {wait_time}s...")
-                        time.sleep(wait_time)
+                        logger.warning("⏰ Rate limit em %s, aguardando %ss...", current_model, wait_time)
+                        self._backoff(wait_time, current_model, "rate_limit", deadline)
                         continue
                     
                     else:
-                        logger.warning(f"⚠️ Erro {response.status_code} para {current_model}: {response.text[:200]}")
+                        logger.warning("⚠️ Erro %s para %s: %.200s", response.status_code, current_model, response.text)
                         if attempt < MAX_RETRIES - 1:
-                            time.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                            self._backoff(BACKOFF_FACTOR * (2 ** attempt), current_model, "http_error", deadline)
                             continue
                         break
                 
                 except httpx.TimeoutException:
-                    logger.warning(f"⏰ Timeout na tentativa {attempt + 1} para {current_model}")
+                    self._observe_attempt(bot, current_model, attempt, "timeout", time.perf_counter() - attempt_start)
+                    logger.warning("⏰ Timeout na tentativa %d para %s", attempt + 1, current_model)
                     if attempt < MAX_RETRIES - 1:
-                        time.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                        self._backoff(BACKOFF_FACTOR * (2 ** attempt), current_model, "timeout", deadline)
                         continue
                     break
                 
                 except Exception as e:
-                    logger.error(f"💥 Erro na tentativa {attempt + 1} para {current_model}: {str(e)}")
+                    self._observe_attempt(bot, current_model, attempt, "error", time.perf_counter() - attempt_start)
+                    logger.error("💥 Erro na tentativa %d para %s: %s", attempt + 1, current_model, e)
                     if attempt < MAX_RETRIES - 1:
-                        time.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                        self._backoff(BACKOFF_FACTOR * (2 ** attempt), current_model, "error", deadline)
                         continue
                     break
             
-            logger.info(f"❌ Modelo {current_model} falhou, tentando próximo...")
+            if model_index < len(self.available_models) - 1:
+                # Só é fallback quando existe um próximo modelo para tentar
+                LLM_FALLBACKS.inc(bot=bot, model=current_model)
+                logger.warning("❌ Modelo %s falhou, tentando próximo...", current_model)
         
         error_msg = "❌ Todos os modelos falharam após várias tentativas."
         logger.error(error_msg)
-        return error_msg
+        LLM_ATTEMPTS.observe(total_attempts, bot=bot, model="none")
+        return self._failed_result(error_msg, attempts=total_attempts)
+
+    @staticmethod
+    def _observe_attempt(bot: str, model: str, attempt: int, status: str, duration: float):
+        """Registra a latência de uma tentativa nas métricas e como span do trace atual"""
+        LLM_LATENCY.observe(duration, bot=bot, model=model, status=status)
+        record_span("llm.attempt", duration, **{"llm.model": model, "llm.attempt": attempt + 1, "llm.status": status})
+
+    @staticmethod
+    def _backoff(seconds: float, model: str, reason: str, deadline: Optional[float] = None):
+        if deadline is not None:
+            # Não dorme além do orçamento de latência
+            seconds = max(0.0, min(seconds, deadline - time.monotonic()))
+        with start_span("llm.backoff", **{"llm.model": model, "backoff.seconds": seconds, "backoff.reason": reason}):
+            time.sleep(seconds)
+
+    @staticmethod
+    def _failed_result(message: str, attempts: int) -> Dict[str, Any]:
+        return {"content": message, "model": None, "usage": {}, "attempts": attempts}
 
     def _prepare_payload(self, system_prompt: str, chat_history: List[Dict[str, str]], user_message: str, temperature: float = 0.7, max_tokens: int = 400) -> Dict[str, Any]:
         """Prepara o payload para a API"""
@@ -193,16 +302,20 @@ class AIService:
             })
         
         # CORREÇÃO: Histórico de conversa limitado para evitar token overflow
-        for message in chat_history[-8:]:  # Mantém apenas últimas 8 mensagens
+        for message in chat_history[-PROMPT_HISTORY_MESSAGES:]:  # Mantém apenas as últimas mensagens
             role = message.get("role")
             content = message.get("content", "").strip()
             
             if role in ["user", "assistant"] and content:
                 # Mapear 'assistant' para 'system' se necessário, mas geralmente é 'assistant'
                 if role == "assistant" and "system" in content.lower():
-                    messages.append({"role": "system", "content": content})
+                    entry = {"role": "system", "content": content}
                 else:
-                    messages.append({"role": role, "content": content})
+                    entry = {"role": role, "content": content}
+                # Contagem gravada no banco: o orçamento do prompt não reconta o texto
+                if message.get("tokens") is not None:
+                    entry["tokens"] = message["tokens"]
+                messages.append(entry)
         
         # CORREÇÃO: Garantir que a mensagem do usuário seja adicionada
         if user_message.strip():
@@ -218,16 +331,19 @@ class AIService:
             "stream": False
         }
         
-        logger.info(f"📝 Payload preparado:")
-        logger.info(f"   - Modelo: {payload['model']}")
-        logger.info(f"   - Mensagens: {len(messages)}")
-        logger.info(f"   - Temperature: {payload['temperature']}")
-        logger.info(f"   - Max Tokens: {payload['max_tokens']}")
+        logger.debug(
+            "📝 Payload preparado: modelo=%s mensagens=%d temperature=%s max_tokens=%s",
+            payload['model'], len(messages), payload['temperature'], payload['max_tokens']
+        )
         
         return payload
 
     def generate_response(self, bot_data: Any, ai_config: Dict[str, Any], user_message: str, chat_history: List[Dict[str, str]]) -> str:
         """Gera resposta usando IA"""
+        return self.generate_response_detailed(bot_data, ai_config, user_message, chat_history)["content"]
+
+    def generate_response_detailed(self, bot_data: Any, ai_config: Dict[str, Any], user_message: str, chat_history: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Gera resposta usando IA e retorna também modelo, uso de tokens e tentativas"""
         try:
             # Converter bot_data para dict se necessário
             if hasattr(bot_data, 'to_dict'):
@@ -235,8 +351,8 @@ class AIService:
             else:
                 bot_dict = bot_data
             
-            logger.info(f"🤖 Iniciando geração de resposta para: {bot_dict.get('name', 'Unknown')}")
-            logger.info(f"💬 Mensagem do usuário: {user_message[:100]}...")
+            logger.debug("🤖 Iniciando geração de resposta para: %s", bot_dict.get('name', 'Unknown'))
+            logger.debug("💬 Mensagem do usuário: %.100s...", user_message)
             
             # CORREÇÃO: Valores padrão mais conservadores
             temperature = ai_config.get('temperature', 0.7)
@@ -258,20 +374,43 @@ class AIService:
                 max_tokens=max_tokens
             )
             
-            logger.info("🚀 Chamando API OpenRouter...")
+            # Orçamentos opcionais do ai_config, aplicados antes da chamada
+            payload["messages"] = [
+                {"role": message["role"], "content": message["content"]}
+                for message in enforce_prompt_budget(payload["messages"], ai_config.get('max_prompt_tokens'))
+            ]
+            max_latency = ai_config.get('max_latency_seconds')
+            deadline = time.monotonic() + max_latency if max_latency else None
+            
+            logger.debug("🚀 Chamando API OpenRouter...")
             start_time = time.time()
             
-            response = self._call_openrouter_api(payload)
+            with start_span("llm.generate", **{"bot.id": bot_dict.get('id')}) as span:
+                result = self._call_openrouter_api(payload, bot_id=bot_dict.get('id'), deadline=deadline)
+                span.set_attributes({"llm.model": result["model"], "llm.attempts": result["attempts"]})
+                if result["model"] is None:
+                    span.set_error("nenhum modelo respondeu")
             
             end_time = time.time()
-            logger.info(f"⏱️  Tempo de resposta: {end_time - start_time:.2f}s")
+            # Uma única linha INFO por geração, com os campos estruturados
+            logger.info(
+                "⏱️  Tempo de resposta: %.2fs",
+                end_time - start_time,
+                extra={
+                    "bot_id": bot_dict.get('id'),
+                    "model": result["model"],
+                    "attempts": result["attempts"],
+                    "latency_s": round(end_time - start_time, 3),
+                }
+            )
             
-            return response
+            result["latency"] = end_time - start_time
+            return result
             
+        except BudgetExceeded:
+            raise
         except Exception as e:
-            logger.error(f"💥 Erro crítico em generate_response: {str(e)}")
-            import traceback
-            logger.error(f"📋 Stack trace: {traceback.format_exc()}")
+            logger.exception("💥 Erro crítico em generate_response: %s", e)
             
             # Fallback mais informativo
             fallback_responses = {
@@ -282,15 +421,30 @@ class AIService:
             }
             
             bot_name = bot_dict.get('name', 'Assistente')
-            return fallback_responses.get(bot_name, "🤖 Estou tendo dificuldades técnicas no momento. Podemos tentar novamente?")
+            fallback = fallback_responses.get(bot_name, "🤖 Estou tendo dificuldades técnicas no momento. Podemos tentar novamente?")
+            return self._failed_result(fallback, attempts=0)
 
-    def get_status(self) -> Dict[str, Any]:
-        """Retorna o status atual do serviço de IA"""
+    def get_status(self, force_check: bool = False) -> Dict[str, Any]:
+        """Retorna o status atual do serviço de IA (teste de conexão em cache, salvo force_check)"""
         return {
             "api_key_set": bool(self.api_key),
             "api_key_length": len(self.api_key) if self.api_key else 0,
-            "connection_test": self._test_api_connection(),
+            "connection_test": self.check_connection(force=force_check),
             "current_model": self.available_models[self.current_model_index] if self.available_models else None,
             "available_models": self.available_models,
             "http_referer": self.headers.get("HTTP-Referer", "Not set")
-        }
\ No newline at end of file
+        }
+
+
+_shared_service: Optional[AIService] = None
+_shared_lock = threading.Lock()
+
+
+def shared_ai_service() -> AIService:
+    """Instância única do AIService, criada no primeiro uso (nada de rede no import)"""
+    global _shared_service
+    if _shared_service is None:
+        with _shared_lock:
+            if _shared_service is None:
+                _shared_service = AIService()
+    return _shared_service
@@ -0,0 +1,318 @@
+# services/archive.py
+
+import os
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from services.stats import register_counter, seed_counter
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Conversas sem mensagens novas há ARCHIVE_IDLE_DAYS saem das tabelas quentes
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_IDLE_DAYS = float(os.getenv("ARCHIVE_IDLE_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+# auto = zstd quando o pacote zstandard estiver instalado, senão gzip (zlib)
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "auto")
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+
+register_counter("archived_conversations", "SELECT COUNT(*) FROM conversation_archive")
+register_counter("archived_messages", "SELECT COALESCE(SUM(message_count), 0) FROM conversation_archive")
+
+
+def _resolve_codec(codec: str) -> str:
+    if codec == "auto":
+        return "zstd" if ZSTD_AVAILABLE else "gzip"
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning("⚠️ ARCHIVE_CODEC=zstd sem o pacote zstandard; usando gzip")
+        return "gzip"
+    return codec
+
+
+def compress(data: bytes, codec: str, level: int = ARCHIVE_COMPRESSION_LEVEL) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    # wbits=31: formato gzip (cabeçalho + CRC), legível com gzip.decompress
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Conversa arquivada com zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data, 31)
+
+
+def install_archive(conn: sqlite3.Connection):
+    """
+    Cria a tabela de arquivo, a coluna conversations.last_message_at (mantida por trigger)
+    e os contadores archived_conversations/archived_messages na tabela stats.
+    Deve rodar depois de install_stats.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(conversations)")}
+        if "archived_at" not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN archived_at DATETIME")
+        if "last_message_at" not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN last_message_at DATETIME")
+            # Preenchimento único para bancos existentes (full scan só na primeira vez)
+            cursor.execute('''
+                UPDATE conversations SET last_message_at = (
+                    SELECT MAX(created_at) FROM messages WHERE conversation_id = conversations.id
+                )
+            ''')
+        if "rehydrated_at" not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN rehydrated_at DATETIME")
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversations_last_message_at
+            AFTER INSERT ON messages
+            BEGIN
+                UPDATE conversations SET last_message_at = NEW.created_at
+                WHERE id = NEW.conversation_id
+                  AND (last_message_at IS NULL OR last_message_at < NEW.created_at);
+            END
+        ''')
+        # Índice parcial: o arquivador só procura entre as conversas ainda quentes
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conversations_idle
+            ON conversations (last_message_at) WHERE archived_at IS NULL
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_archive (
+                conversation_id TEXT PRIMARY KEY,
+                bot_id TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_archive_bot ON conversation_archive (bot_id)")
+
+        # As mensagens arquivadas continuam contando no /health, agora em archived_messages
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stats_conversation_archive_insert
+            AFTER INSERT ON conversation_archive
+            BEGIN
+                UPDATE stats SET value = value + 1 WHERE name = 'archived_conversations';
+                UPDATE stats SET value = value + NEW.message_count WHERE name = 'archived_messages';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stats_conversation_archive_delete
+            AFTER DELETE ON conversation_archive
+            BEGIN
+                UPDATE stats SET value = value - 1 WHERE name = 'archived_conversations';
+                UPDATE stats SET value = value - OLD.message_count WHERE name = 'archived_messages';
+            END
+        ''')
+        seed_counter(cursor, "archived_conversations")
+        seed_counter(cursor, "archived_messages")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def install_rehydrated_at(conn: sqlite3.Connection):
+    """Coluna conversations.rehydrated_at em bancos criados antes dela (install_archive já a inclui)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+    if "rehydrated_at" not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN rehydrated_at DATETIME")
+        conn.commit()
+
+
+# Ociosa: sem mensagens novas e sem reidratação (uma leitura) dentro da janela.
+# A reidratação não muda last_message_at, então sem a segunda condição a conversa
+# recém-lida voltaria para o arquivo na rodada seguinte do arquivador
+_IDLE_CONDITION = '''
+    archived_at IS NULL AND last_message_at < datetime('now', :idle)
+    AND (rehydrated_at IS NULL OR rehydrated_at < datetime('now', :idle))
+'''
+
+
+def find_idle_conversations(conn: sqlite3.Connection, idle_days: float = ARCHIVE_IDLE_DAYS,
+                            limit: int = ARCHIVE_BATCH_SIZE) -> List[str]:
+    rows = conn.execute(f'''
+        SELECT id FROM conversations
+        WHERE {_IDLE_CONDITION}
+        ORDER BY last_message_at
+        LIMIT :limit
+    ''', {"idle": f"-{idle_days} days", "limit": limit}).fetchall()
+    return [row[0] for row in rows]
+
+
+def archive_conversation(conn: sqlite3.Connection, conversation_id: str,
+                         idle_days: float = ARCHIVE_IDLE_DAYS, codec: str = ARCHIVE_CODEC) -> Optional[Dict[str, Any]]:
+    """
+    Move as mensagens de uma conversa ociosa para conversation_archive (um blob comprimido).
+    Tudo numa transação: a conversa é reavaliada sob o lock de escrita, então uma
+    mensagem que chegue durante o arquivamento impede a operação em vez de se perder.
+    """
+    codec = _resolve_codec(codec)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        conversation = cursor.execute(
+            f"SELECT bot_id FROM conversations WHERE id = :id AND {_IDLE_CONDITION}",
+            {"id": conversation_id, "idle": f"-{idle_days} days"}
+        ).fetchone()
+        if not conversation:
+            cursor.execute("ROLLBACK")
+            return None
+
+        cursor.execute(
+            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC",
+            (conversation_id,)
+        )
+        columns = [description[0] for description in cursor.description]
+        messages = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        raw = json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        payload = compress(raw, codec)
+
+        cursor.execute('''
+            INSERT INTO conversation_archive (conversation_id, bot_id, codec, message_count, raw_bytes, payload)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (conversation_id, conversation[0], codec, len(messages), len(raw), payload))
+        cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        cursor.execute("UPDATE conversations SET archived_at = CURRENT_TIMESTAMP WHERE id = ?", (conversation_id,))
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    return {"conversation_id": conversation_id, "messages": len(messages),
+            "raw_bytes": len(raw), "stored_bytes": len(payload), "codec": codec}
+
+
+def rehydrate_conversation(conn: sqlite3.Connection, conversation_id: str) -> bool:
+    """
+    Devolve uma conversa arquivada para as tabelas quentes (custa um lookup por PK
+    quando a conversa não está arquivada). Se já houver uma transação aberta na
+    conexão, a reidratação entra nela; senão abre e confirma a sua.
+    """
+    row = conn.execute("SELECT archived_at FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+    if not row or row[0] is None:
+        return False
+
+    own_transaction = not conn.in_transaction
+    cursor = conn.cursor()
+    if own_transaction:
+        cursor.execute("BEGIN IMMEDIATE")
+    try:
+        archived = cursor.execute(
+            "SELECT codec, payload FROM conversation_archive WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        restored = 0
+        if archived:
+            messages = json.loads(decompress(archived[1], archived[0]).decode("utf-8"))
+            # Só as colunas que ainda existem (o schema pode ter mudado desde o arquivamento)
+            current = {info[1] for info in cursor.execute("PRAGMA table_info(messages)")}
+            for message in messages:
+                columns = [column for column in message if column in current]
+                cursor.execute(
+                    f"INSERT OR IGNORE INTO messages ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [message[column] for column in columns]
+                )
+            restored = len(messages)
+            cursor.execute("DELETE FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
+        cursor.execute(
+            "UPDATE conversations SET archived_at = NULL, rehydrated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (conversation_id,)
+        )
+        if own_transaction:
+            cursor.execute("COMMIT")
+    except Exception:
+        if own_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+
+    logger.info("📦 Conversa %s reidratada do arquivo (%s mensagens)", conversation_id, restored)
+    return True
+
+
+def archive_idle_conversations(conn: sqlite3.Connection, idle_days: float = ARCHIVE_IDLE_DAYS,
+                               batch_size: int = ARCHIVE_BATCH_SIZE, codec: str = ARCHIVE_CODEC) -> Dict[str, int]:
+    """Arquiva um lote de conversas ociosas (uma transação curta por conversa)."""
+    summary = {"conversations": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+    for conversation_id in find_idle_conversations(conn, idle_days, batch_size):
+        result = archive_conversation(conn, conversation_id, idle_days, codec)
+        if not result:
+            continue
+        summary["conversations"] += 1
+        for field in ("messages", "raw_bytes", "stored_bytes"):
+            summary[field] += result[field]
+    if summary["conversations"]:
+        logger.info(
+            "🗄️ %s conversas arquivadas (%s mensagens, %s → %s bytes)",
+            summary["conversations"], summary["messages"], summary["raw_bytes"], summary["stored_bytes"]
+        )
+    return summary
+
+
+class ConversationArchiver:
+    """Thread em segundo plano que arquiva as conversas ociosas em lotes."""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], interval: float = ARCHIVE_INTERVAL_SECONDS,
+                 idle_days: float = ARCHIVE_IDLE_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE):
+        self.connect = connect
+        self.interval = interval
+        self.idle_days = idle_days
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, int]:
+        """Esvazia o backlog de conversas ociosas, lote a lote."""
+        conn = self.connect()
+        total = {"conversations": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+        try:
+            while not self._stop.is_set():
+                summary = archive_idle_conversations(conn, self.idle_days, self.batch_size)
+                for field, value in summary.items():
+                    total[field] += value
+                if summary["conversations"] < self.batch_size:
+                    break
+        finally:
+            conn.close()
+        return total
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="conversation-archiver", daemon=True)
+        self._thread.start()
+        logger.info("🗄️ Arquivador iniciado (ociosas há %s dias, a cada %ss)", self.idle_days, self.interval)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("❌ Erro no arquivamento de conversas: %s", e)
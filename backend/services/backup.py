@@ -0,0 +1,249 @@
+# services/backup.py
+"""
+Snapshots online dos bancos SQLite pela API de backup do SQLite.
+
+Uso (a partir de backend/):
+    python -m services.backup                      # cringe.db em BACKUP_DIR
+    python -m services.backup --database sql_app.db --compression none --keep 3
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from services.db_backend import SQLITE_PATH
+from services.archive import ZSTD_AVAILABLE, zstandard
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+# Páginas copiadas por passo e pausa entre passos: quem escreve no banco nunca espera o backup inteiro
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_SECONDS = float(os.getenv("BACKUP_STEP_SLEEP_SECONDS", "0.01"))
+# Sem WAL, cada escrita de outra conexão reinicia a cópia; depois de tantos reinícios
+# o resto sai em um passo só (segura as escritas só durante essa cópia)
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+# auto = zstd quando o pacote zstandard estiver instalado, senão gzip; none grava o .db puro
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION", "auto").lower()
+BACKUP_COMPRESSION_LEVEL = int(os.getenv("BACKUP_COMPRESSION_LEVEL", "6"))
+# Snapshots mantidos por banco (os mais antigos são apagados depois de cada backup)
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+# PRAGMA quick_check no snapshot antes de comprimir
+BACKUP_VERIFY = os.getenv("BACKUP_VERIFY", "true").lower() == "true"
+
+BACKUP_COMPRESSIONS = ("auto", "zstd", "gzip", "none")
+_EXTENSIONS = {"zstd": ".db.zst", "gzip": ".db.gz", "none": ".db"}
+
+
+class BackupError(Exception):
+    """Snapshot inválido ou configuração de backup inválida."""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _resolve_compression(compression: str) -> str:
+    if compression not in BACKUP_COMPRESSIONS:
+        raise BackupError(f"compression deve ser um de {BACKUP_COMPRESSIONS}")
+    if compression == "auto":
+        return "zstd" if ZSTD_AVAILABLE else "gzip"
+    if compression == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning("⚠️ BACKUP_COMPRESSION=zstd sem o pacote zstandard; usando gzip")
+        return "gzip"
+    return compression
+
+
+def _compress_file(source: str, target: str, compression: str, level: int = BACKUP_COMPRESSION_LEVEL):
+    """Comprime em streaming (memória constante, qualquer tamanho de banco)."""
+    with open(source, "rb") as raw, open(target, "wb") as out:
+        if compression == "zstd":
+            with zstandard.ZstdCompressor(level=level).stream_writer(out, closefd=False) as writer:
+                shutil.copyfileobj(raw, writer, 1024 * 1024)
+        else:
+            with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level) as writer:
+                shutil.copyfileobj(raw, writer, 1024 * 1024)
+
+
+def _snapshot_prefix(database: str) -> str:
+    return os.path.splitext(os.path.basename(database))[0] + "-"
+
+
+def copy_database(source_path: str, target_path: str, pages: int = BACKUP_PAGES_PER_STEP,
+                  sleep: float = BACKUP_STEP_SLEEP_SECONDS, max_restarts: int = BACKUP_MAX_RESTARTS) -> Dict[str, Any]:
+    """
+    Copia o banco com Connection.backup, pages páginas por passo e sleep entre passos.
+
+    No WAL a conexão de origem segura uma transação de leitura: o snapshot fica
+    fixo (a cópia nunca reinicia) e os escritores seguem normalmente. Sem WAL, uma
+    transação aberta bloquearia os escritores; então os passos correm soltos e,
+    se escritas concorrentes reiniciarem a cópia mais de max_restarts vezes, o
+    restante sai em um passo único.
+    """
+    # mode=rw (não ro): uma conexão só leitura não abre um banco WAL sem o -shm
+    source = sqlite3.connect(f"file:{source_path}?mode=rw", uri=True, isolation_level=None, timeout=30)
+    target = sqlite3.connect(target_path)
+    progress = {"steps": 0, "restarts": 0, "pages": 0, "last_remaining": None}
+
+    def on_progress(status, remaining, total):
+        progress["steps"] += 1
+        progress["pages"] = total
+        if progress["last_remaining"] is not None and remaining > progress["last_remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > max_restarts:
+                raise _TooManyRestarts()
+        progress["last_remaining"] = remaining
+        # O sleep do Connection.backup só vale para SQLITE_BUSY; a pausa entre passos é aqui,
+        # com os locks do passo anterior já liberados
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    try:
+        journal_mode = source.execute("PRAGMA journal_mode").fetchone()[0]
+        pinned = journal_mode == "wal"
+        if pinned:
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        single_step = False
+        try:
+            source.backup(target, pages=pages, progress=on_progress)
+        except _TooManyRestarts:
+            single_step = True
+            source.backup(target, pages=-1)
+        if pinned:
+            source.execute("COMMIT")
+    finally:
+        target.close()
+        source.close()
+    return {
+        "journal_mode": journal_mode,
+        "snapshot_pinned": pinned,
+        "steps": progress["steps"],
+        "restarts": progress["restarts"],
+        "single_step_fallback": single_step,
+        "pages": progress["pages"],
+    }
+
+
+def backup_database(database: str = SQLITE_PATH, directory: str = BACKUP_DIR,
+                    compression: str = BACKUP_COMPRESSION, keep: int = BACKUP_KEEP,
+                    verify: bool = BACKUP_VERIFY, pages: int = BACKUP_PAGES_PER_STEP,
+                    sleep: float = BACKUP_STEP_SLEEP_SECONDS) -> Dict[str, Any]:
+    """Snapshot consistente de um banco em directory, comprimido e com rotação. Devolve o relatório."""
+    if not os.path.exists(database):
+        raise BackupError(f"Banco {database} não existe")
+    compression = _resolve_compression(compression)
+    os.makedirs(directory, exist_ok=True)
+
+    started = time.monotonic()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    name = f"{_snapshot_prefix(database)}{stamp}{_EXTENSIONS[compression]}"
+    final_path = os.path.join(directory, name)
+    # .partial até o fim: uma cópia interrompida nunca parece um snapshot válido
+    partial_path = os.path.join(directory, f".{_snapshot_prefix(database)}{stamp}.db.partial")
+    try:
+        copy = copy_database(database, partial_path, pages, sleep)
+        copy_seconds = time.monotonic() - started
+        if verify:
+            check = sqlite3.connect(f"file:{partial_path}?mode=ro", uri=True)
+            try:
+                result = check.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                check.close()
+            if result != "ok":
+                raise BackupError(f"Snapshot de {database} falhou no quick_check: {result}")
+        raw_bytes = os.path.getsize(partial_path)
+        if compression == "none":
+            os.replace(partial_path, final_path)
+        else:
+            _compress_file(partial_path, final_path + ".partial", compression)
+            os.replace(final_path + ".partial", final_path)
+            os.remove(partial_path)
+    except BaseException:
+        for leftover in (partial_path, final_path + ".partial"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    removed = rotate_backups(database, directory, keep)
+    report = dict(
+        copy,
+        database=database,
+        path=final_path,
+        compression=compression,
+        raw_bytes=raw_bytes,
+        stored_bytes=os.path.getsize(final_path),
+        copy_ms=round(copy_seconds * 1000, 1),
+        duration_ms=round((time.monotonic() - started) * 1000, 1),
+        verified=verify,
+        rotated=removed,
+    )
+    logger.info(
+        "💾 Backup de %s em %s (%s → %s bytes, %s passos, %s reinícios, %.0f ms)",
+        database, final_path, report["raw_bytes"], report["stored_bytes"],
+        report["steps"], report["restarts"], report["duration_ms"]
+    )
+    return report
+
+
+def list_backups(database: str = SQLITE_PATH, directory: str = BACKUP_DIR) -> List[Dict[str, Any]]:
+    """Snapshots de um banco, do mais novo para o mais antigo."""
+    if not os.path.isdir(directory):
+        return []
+    prefix = _snapshot_prefix(database)
+    entries = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(tuple(_EXTENSIONS.values())):
+            path = os.path.join(directory, name)
+            entries.append({"name": name, "path": path, "bytes": os.path.getsize(path)})
+    # O timestamp no nome ordena cronologicamente
+    return sorted(entries, key=lambda entry: entry["name"], reverse=True)
+
+
+def rotate_backups(database: str = SQLITE_PATH, directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> List[str]:
+    if keep <= 0:
+        return []
+    removed = []
+    for entry in list_backups(database, directory)[keep:]:
+        os.remove(entry["path"])
+        removed.append(entry["name"])
+    return removed
+
+
+# Um backup por vez no processo: dois snapshots simultâneos só dobrariam a leitura do disco
+backup_lock = threading.Lock()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Snapshot online de um banco SQLite (API de backup)")
+    parser.add_argument("--database", default=SQLITE_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR)
+    parser.add_argument("--compression", default=BACKUP_COMPRESSION, choices=BACKUP_COMPRESSIONS)
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="snapshots mantidos (0 = todos)")
+    parser.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP, help="páginas por passo")
+    parser.add_argument("--sleep", type=float, default=BACKUP_STEP_SLEEP_SECONDS, help="pausa entre passos (s)")
+    parser.add_argument("--no-verify", action="store_true", help="pula o PRAGMA quick_check do snapshot")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        report = backup_database(args.database, args.dir, args.compression, args.keep,
+                                 verify=not args.no_verify, pages=args.pages, sleep=args.sleep)
+    except BackupError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+# services/db_backend.py
+
+import os
+import time
+import sqlite3
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+from services import db_instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Backend da API principal: "auto" usa Postgres quando DATABASE_URL aponta para um
+DB_BACKEND = os.getenv("DB_BACKEND", "auto").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "cringe.db")
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+
+# Pool do engine SQLAlchemy (database.py), que no Postgres também atende a API
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recicla conexões antigas antes que o servidor/proxy as derrube por inatividade
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# statement_timeout por sessão: uma consulta travada não segura a conexão para sempre (0 desliga)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+
+def normalize_database_url(url: str) -> str:
+    # Render/Heroku entregam postgres://, que o SQLAlchemy não aceita mais
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+DATABASE_URL = normalize_database_url(os.getenv("DATABASE_URL", ""))
+
+
+def is_postgres() -> bool:
+    if DB_BACKEND == "postgres":
+        return True
+    if DB_BACKEND == "sqlite":
+        return False
+    return DATABASE_URL.startswith("postgresql")
+
+
+def local_store_path(env_var: str) -> Optional[str]:
+    """
+    Arquivo SQLite de um store auxiliar (fila de jobs, chaves de idempotência): o
+    da variável ou, no SQLite, o próprio banco da API. No Postgres sem caminho
+    explícito não há arquivo: um SQLite local no servidor web não sobrevive a um
+    redeploy nem é compartilhado entre instâncias.
+    """
+    path = os.getenv(env_var, "").strip()
+    if path:
+        return path
+    return None if is_postgres() else SQLITE_PATH
+
+
+def dialect_of(conn: Any) -> str:
+    """Dialeto de uma conexão desta API ("postgres" ou "sqlite")."""
+    return getattr(conn, "dialect", "sqlite")
+
+
+def postgres_session_options(statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS) -> str:
+    return f"-c statement_timeout={int(statement_timeout_ms)}" if statement_timeout_ms > 0 else ""
+
+
+def sqlalchemy_engine_options(url: str) -> Dict[str, Any]:
+    """Argumentos do create_engine com as mesmas regras de pool da API."""
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}}
+    options: Dict[str, Any] = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    session_options = postgres_session_options()
+    connect_args: Dict[str, Any] = {"connect_timeout": DB_CONNECT_TIMEOUT}
+    if session_options:
+        connect_args["options"] = session_options
+    options["connect_args"] = connect_args
+    return options
+
+
+# ----------------------------------------------------------------------
+# Tradução do SQL da API (estilo sqlite3) para o psycopg2
+# ----------------------------------------------------------------------
+
+@lru_cache(maxsize=2048)
+def translate_sql(sql: str, has_parameters: bool = True) -> str:
+    """
+    Converte os placeholders "?" em "%s" fora de literais e comentários "--".
+    Com parâmetros o psycopg2 interpola a string (formatação "%" do Python), então
+    "%" literal vira "%%"; sem parâmetros ele não interpola e o SQL segue intacto
+    (é assim que os passos PL/pgSQL das migrações passam).
+
+    Limites, suficientes para o SQL desta API mas não para SQL arbitrário:
+    - só "?" posicional (nada de ":nome" nem "?NNN");
+    - comentários "/* */" e literais com aspas dobradas ("$$", E'...') não são
+      reconhecidos: um "?" dentro deles, num comando com parâmetros, vira placeholder;
+    - os operadores jsonb "?", "?|" e "?&" só funcionam em comandos sem parâmetros.
+    """
+    if not has_parameters:
+        return sql
+    out = []
+    quote = None
+    i = 0
+    length = len(sql)
+    while i < length:
+        char = sql[i]
+        if quote:
+            out.append("%%" if char == "%" else char)
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+            out.append(char)
+        elif char == "-" and sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = length if end == -1 else end
+            out.append(sql[i:end].replace("%", "%%"))
+            i = end
+            continue
+        elif char == "?":
+            out.append("%s")
+        elif char == "%":
+            out.append("%%")
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+class PostgresRow:
+    """Linha com acesso por índice e por nome, como sqlite3.Row (dict(row) funciona)."""
+
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values: Sequence[Any], index: Dict[str, int]):
+        self._values = tuple(values)
+        self._index = index
+
+    def keys(self):
+        return list(self._index)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, PostgresRow):
+            return self._values == other._values
+        return self._values == other
+
+    def __repr__(self):
+        return f"PostgresRow({dict(zip(self._index, self._values))!r})"
+
+
+# Comandos de transação do código SQLite: o psycopg2 já abre a transação sozinho
+_TRANSACTION_BEGIN = {"BEGIN", "BEGIN IMMEDIATE", "BEGIN DEFERRED", "BEGIN EXCLUSIVE", "BEGIN TRANSACTION"}
+
+
+class PostgresCursor:
+    """Cursor com a interface usada pela API (execute encadeável, fetch*, rowcount)."""
+
+    def __init__(self, connection: "PostgresConnection"):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+        self._index: Dict[str, int] = {}
+
+    def _wrap(self, row):
+        return PostgresRow(row, self._index) if row is not None else None
+
+    def execute(self, sql: str, parameters: Iterable[Any] = ()):
+        command = " ".join(sql.split()).upper().rstrip(";")
+        if command in _TRANSACTION_BEGIN:
+            return self
+        if command == "COMMIT":
+            self.connection.commit()
+            return self
+        if command == "ROLLBACK":
+            self.connection.rollback()
+            return self
+
+        parameters = tuple(parameters or ())
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(translate_sql(sql, bool(parameters)), parameters or None)
+        finally:
+            db_instrumentation.notify_query(sql, parameters, time.perf_counter() - start)
+        self.connection._dirty = True
+        self._index = {column[0]: i for i, column in enumerate(self._cursor.description or ())}
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Sequence[Any]]):
+        rows = [tuple(p) for p in seq_of_parameters]
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(translate_sql(sql), rows)
+        finally:
+            # A primeira linha representa o lote no log de queries lentas (EXPLAIN com bindings)
+            db_instrumentation.notify_query(sql, rows[0] if rows else None, time.perf_counter() - start)
+        self.connection._dirty = True
+        self._index = {}
+        return self
+
+    def fetchone(self):
+        return self._wrap(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._wrap(row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size: int = 1):
+        return [self._wrap(row) for row in self._cursor.fetchmany(size)]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class PostgresConnection:
+    """
+    Conexão emprestada do pool do engine SQLAlchemy com a mesma interface de
+    sqlite3.Connection usada pela API. close() desfaz o que não foi commitado e
+    devolve a conexão ao pool.
+    """
+
+    dialect = "postgres"
+
+    def __init__(self, raw):
+        # Conexão DBAPI do pool (PoolProxiedConnection): close() a devolve em vez de fechar
+        self.raw = raw
+        self._dirty = False
+        # Aceito e ignorado: as linhas já vêm como PostgresRow
+        self.row_factory = None
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._dirty
+
+    def cursor(self) -> PostgresCursor:
+        return PostgresCursor(self)
+
+    def execute(self, sql: str, parameters: Iterable[Any] = ()) -> PostgresCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> PostgresCursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            self.raw.commit()
+        finally:
+            db_instrumentation.notify_query("COMMIT", None, time.perf_counter() - start)
+        self._dirty = False
+
+    def rollback(self):
+        self.raw.rollback()
+        self._dirty = False
+
+    def close(self):
+        if self.raw is None:
+            return
+        raw, self.raw = self.raw, None
+        try:
+            raw.rollback()
+        except Exception:
+            # Conexão quebrada: o pool descarta e abre outra no próximo empréstimo
+            raw.invalidate()
+        raw.close()
+
+
+# ----------------------------------------------------------------------
+# Pool de conexões: o do engine SQLAlchemy de database.py
+# ----------------------------------------------------------------------
+# Um pool só por processo para a API e para os models: pool_size, overflow,
+# timeout, recycle e pre-ping vêm de sqlalchemy_engine_options (DB_POOL_*).
+# Pool esgotado levanta sqlalchemy.exc.TimeoutError depois de DB_POOL_TIMEOUT.
+
+def get_engine():
+    # Import tardio: database.py importa este módulo
+    from database import engine
+    return engine
+
+
+def pool_status() -> Optional[Dict[str, int]]:
+    if not is_postgres():
+        return None
+    pool = get_engine().pool
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+    }
+
+
+def connect():
+    """
+    Conexão da API principal: emprestada do pool Postgres ou uma conexão
+    SQLite instrumentada (SQLITE_PATH) com linhas acessíveis por nome.
+    """
+    if is_postgres():
+        return PostgresConnection(get_engine().raw_connection())
+    conn = db_instrumentation.connect(SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    return conn
@@ -0,0 +1,97 @@
+# services/db_instrumentation.py
+
+import re
+import time
+import sqlite3
+import logging
+import itertools
+from functools import lru_cache
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Observadores chamados após cada comando: fn(sql, parametros, duracao_em_segundos)
+QueryObserver = Callable[[str, Any, float], None]
+_query_observers: List[QueryObserver] = []
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|JOIN)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?[\"'`\[]?(\w+)", re.IGNORECASE)
+
+
+def add_query_observer(observer: QueryObserver):
+    if observer not in _query_observers:
+        _query_observers.append(observer)
+
+
+@lru_cache(maxsize=2048)
+def statement_family(sql: str) -> str:
+    """Agrupa o SQL por comando + tabela principal (ex.: 'SELECT messages')."""
+    stripped = sql.lstrip()
+    if not stripped:
+        return "EMPTY"
+    verb = stripped.split(None, 1)[0].upper()
+    if verb == "PRAGMA":
+        return "PRAGMA"
+    match = _TABLE_PATTERN.search(stripped)
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+def _notify(sql: str, parameters: Any, duration: float):
+    for observer in _query_observers:
+        try:
+            observer(sql, parameters, duration)
+        except Exception as e:
+            logger.debug("Observador de query falhou: %s", e)
+
+
+def notify_query(sql: str, parameters: Any, duration: float):
+    """Repassa aos observadores um comando medido fora do sqlite3 (ex.: conexão Postgres)."""
+    _notify(sql, parameters, duration)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor que mede o tempo de cada execute.
+    No SQLite o execute já roda o primeiro passo da consulta, então agregações
+    (COUNT) e ordenações sem índice são medidas por inteiro.
+    """
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _notify(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        # A primeira linha vai para os observadores: o EXPLAIN do lote precisa dos bindings
+        rows = iter(seq_of_parameters)
+        first = next(rows, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, rows if first is None else itertools.chain((first,), rows))
+        finally:
+            _notify(sql, first, time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        # O COMMIT é onde a espera por lock de escrita do SQLite aparece
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _notify("COMMIT", None, time.perf_counter() - start)
+
+
+def connect(database: str, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect com medição de tempo de cada comando."""
+    return sqlite3.connect(database, factory=InstrumentedConnection, **kwargs)
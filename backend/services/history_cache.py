@@ -0,0 +1,150 @@
+# services/history_cache.py
+
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from services.ai_service import PROMPT_HISTORY_MESSAGES
+from services.metrics import HISTORY_CACHE_LOOKUPS, HISTORY_CACHE_BYTES
+
+# Últimas N mensagens de cada conversa ativa (nunca menos que a janela do prompt)
+HISTORY_CACHE_MESSAGES = max(PROMPT_HISTORY_MESSAGES, int(os.getenv("HISTORY_CACHE_MESSAGES", "16")))
+# Teto de memória da cache inteira; as conversas menos recentes saem primeiro (LRU)
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# A cache vale para um processo: com vários workers escrevendo nas mesmas conversas, desligue
+HISTORY_CACHE_ENABLED = os.getenv("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+
+
+class CachedMessage:
+    """Uma mensagem da janela: só o que o prompt usa, sem __dict__ por instância."""
+
+    __slots__ = ("content", "is_user", "tokens")
+
+    def __init__(self, content: str, is_user: bool, tokens: Optional[int] = None):
+        self.content = content
+        self.is_user = is_user
+        self.tokens = tokens
+
+    def size(self) -> int:
+        return _RECORD_OVERHEAD + sys.getsizeof(self.content)
+
+    def as_chat(self) -> Dict[str, Any]:
+        message = {"role": "user" if self.is_user else "assistant", "content": self.content}
+        if self.tokens is not None:
+            message["tokens"] = self.tokens
+        return message
+
+
+_RECORD_OVERHEAD = sys.getsizeof(CachedMessage("", True)) + 8  # + ponteiro no deque
+
+
+class _Window:
+    __slots__ = ("messages", "size")
+
+    def __init__(self, maxlen: int):
+        self.messages = deque(maxlen=maxlen)
+        self.size = 0
+
+    def append(self, message: CachedMessage) -> int:
+        """Acrescenta e devolve a variação de bytes (a mais antiga sai se a janela está cheia)."""
+        delta = message.size()
+        if len(self.messages) == self.messages.maxlen:
+            delta -= self.messages[0].size()
+        self.messages.append(message)
+        self.size += delta
+        return delta
+
+
+class HistoryCache:
+    """
+    LRU com a janela recente de cada conversa ativa, mantida write-through
+    pelo chat: o turno que grava as mensagens também as acrescenta aqui.
+    Uma conversa só entra completa (carregada do banco ou criada neste
+    processo), então um acerto dispensa a consulta ao histórico.
+    """
+
+    def __init__(self, window: int = HISTORY_CACHE_MESSAGES, max_bytes: int = HISTORY_CACHE_MAX_BYTES,
+                 enabled: bool = HISTORY_CACHE_ENABLED):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.enabled = enabled and window > 0 and max_bytes > 0
+        self._windows: "OrderedDict[str, _Window]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Histórico (role/content/tokens, do mais antigo ao mais novo) ou None se a conversa não está na cache."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            window = self._windows.get(conversation_id)
+            if window is not None:
+                self._windows.move_to_end(conversation_id)
+                history = [message.as_chat() for message in window.messages]
+        HISTORY_CACHE_LOOKUPS.inc(result="hit" if window is not None else "miss")
+        return history if window is not None else None
+
+    def put(self, conversation_id: str, history: List[Dict[str, Any]]):
+        """Carrega a janela lida do banco (as últimas mensagens da conversa, em ordem)."""
+        if not self.enabled:
+            return
+        window = _Window(self.window)
+        for message in history[-self.window:]:
+            window.append(CachedMessage(message["content"], message["role"] == "user", message.get("tokens")))
+        with self._lock:
+            self._replace(conversation_id, window)
+
+    def append_turn(self, conversation_id: str, user_message: str, bot_message: str, new_conversation: bool = False,
+                    user_tokens: Optional[int] = None, bot_tokens: Optional[int] = None):
+        """Write-through depois da gravação do turno; conversa fora da cache só entra se é nova."""
+        if not self.enabled:
+            return
+        with self._lock:
+            window = self._windows.get(conversation_id)
+            if window is None:
+                if not new_conversation:
+                    return
+                window = _Window(self.window)
+                self._windows[conversation_id] = window
+            else:
+                self._windows.move_to_end(conversation_id)
+            self._bytes += window.append(CachedMessage(user_message, True, user_tokens))
+            self._bytes += window.append(CachedMessage(bot_message, False, bot_tokens))
+            self._evict()
+
+    def invalidate(self, conversation_id: str):
+        with self._lock:
+            window = self._windows.pop(conversation_id, None)
+            if window is not None:
+                self._bytes -= window.size
+                HISTORY_CACHE_BYTES.set(self._bytes)
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+            self._bytes = 0
+            HISTORY_CACHE_BYTES.set(0)
+
+    def _replace(self, conversation_id: str, window: _Window):
+        old = self._windows.pop(conversation_id, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._windows[conversation_id] = window
+        self._bytes += window.size
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._windows:
+            _, window = self._windows.popitem(last=False)
+            self._bytes -= window.size
+        HISTORY_CACHE_BYTES.set(self._bytes)
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            return {"conversations": len(self._windows), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "window": self.window}
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,199 @@
+# services/idempotency.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.db_backend import local_store_path
+
+logger = logging.getLogger(__name__)
+
+# Configurações de idempotência
+# Padrão: o banco da API (SQLITE_PATH); no Postgres as chaves só persistem com caminho explícito
+IDEMPOTENCY_DB_PATH = local_store_path("IDEMPOTENCY_DB_PATH")
+# Chaves explícitas (enviadas pelo cliente) valem por mais tempo
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# Chaves derivadas (conversa + hash da mensagem) só deduplicam reenvios próximos,
+# para que o usuário possa repetir a mesma frase de propósito mais tarde
+IDEMPOTENCY_DERIVED_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_DERIVED_TTL_SECONDS", "120"))
+
+
+def derive_idempotency_key(*parts: Any) -> str:
+    """Gera uma chave estável (sha256) a partir das partes informadas."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part if part is not None else "").encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class _InFlightCall:
+    """Uma geração em andamento, compartilhada pelas requisições duplicadas."""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Garante que apenas uma execução por chave esteja em andamento.
+    Chamadas concorrentes com a mesma chave esperam e recebem o mesmo resultado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Executa fn uma única vez por chave. Retorna (resultado, compartilhado)."""
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class IdempotencyStore:
+    """Resultados já gerados, persistidos no SQLite para atender duplicatas tardias."""
+
+    def __init__(self, db_path: Optional[str] = IDEMPOTENCY_DB_PATH):
+        self.db_path = db_path
+        # Sem arquivo só vale a deduplicação em memória (SingleFlight) das requisições concorrentes
+        self.enabled = db_path is not None
+        self._table_ready = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._table_ready:
+            with self._init_lock:
+                if not self._table_ready:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS idempotency_keys (
+                            key TEXT PRIMARY KEY,
+                            scope TEXT NOT NULL,
+                            response TEXT NOT NULL,
+                            created_at REAL NOT NULL,
+                            expires_at REAL NOT NULL
+                        )
+                    ''')
+                    conn.commit()
+                    self._table_ready = True
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna a resposta armazenada para a chave, se ainda não expirou."""
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT response FROM idempotency_keys WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row['response']) if row else None
+
+    def put(self, key: str, scope: str, response: Dict[str, Any], ttl: int = IDEMPOTENCY_TTL_SECONDS):
+        if not self.enabled:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, scope, response, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, scope, json.dumps(response), now, now + ttl)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def purge_expired(self) -> int:
+        if not self.enabled:
+            return 0
+        conn = self._connect()
+        try:
+            cursor = conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+
+# Instâncias compartilhadas pelo processo
+single_flight = SingleFlight()
+idempotency_store = IdempotencyStore()
+
+
+def run_idempotent(key: Optional[str], scope: str, fn: Callable[[], Dict[str, Any]],
+                   ttl: int = IDEMPOTENCY_TTL_SECONDS,
+                   store_if: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Tuple[Dict[str, Any], bool]:
+    """
+    Executa fn no máximo uma vez por chave de idempotência.
+    - Duplicatas concorrentes aguardam a geração em andamento;
+    - Duplicatas tardias recebem o resultado armazenado.
+    store_if decide se o resultado fica gravado: uma falha transitória (ex.: resposta
+    de fallback sem LLM) não é repetida para quem reenviar com a mesma chave.
+    Retorna (resposta, reaproveitada).
+    """
+    if not key:
+        return fn(), False
+
+    stored = idempotency_store.get(key)
+    if stored is not None:
+        logger.info("♻️ Requisição duplicada (%s), devolvendo resultado armazenado", scope)
+        return stored, True
+
+    def _execute():
+        # Outra requisição pode ter concluído entre a consulta acima e a entrada no voo
+        stored_inside = idempotency_store.get(key)
+        if stored_inside is not None:
+            return stored_inside, True
+        result = fn()
+        if store_if is not None and not store_if(result):
+            logger.info("↩️ Resultado de %s não armazenado (falha transitória); o reenvio gera de novo", scope)
+            return result, False
+        try:
+            idempotency_store.put(key, scope, result, ttl)
+        except Exception as e:
+            logger.warning("⚠️ Não foi possível armazenar resultado idempotente: %s", e)
+        return result, False
+
+    (result, from_store), shared = single_flight.do(key, _execute)
+    if shared:
+        logger.info("🔗 Requisição duplicada (%s) anexada à geração em andamento", scope)
+    return result, shared or from_store
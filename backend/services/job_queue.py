@@ -0,0 +1,424 @@
+# services/job_queue.py
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.db_backend import local_store_path
+
+logger = logging.getLogger(__name__)
+
+# Configurações da fila de geração
+# Padrão: o banco da API (SQLITE_PATH); no Postgres a fila só existe com caminho explícito
+JOB_QUEUE_DB_PATH = local_store_path("JOB_QUEUE_DB_PATH")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Pausa do worker depois de um erro do banco da fila (travado, disco cheio...) antes de tentar de novo
+JOB_ERROR_BACKOFF_SECONDS = float(os.getenv("JOB_ERROR_BACKOFF_SECONDS", "2.0"))
+# O contador de profundidade em memória é ressincronizado com o banco (jobs de outros processos)
+JOB_DEPTH_REFRESH_SECONDS = float(os.getenv("JOB_DEPTH_REFRESH_SECONDS", "5.0"))
+# Jobs concluídos/falhos (com o resultado JSON) ficam consultáveis em /jobs/{id} por este tempo
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "86400"))
+# Frequência da limpeza (feita pelos workers ociosos) e linhas apagadas por transação
+JOB_PURGE_INTERVAL_SECONDS = float(os.getenv("JOB_PURGE_INTERVAL_SECONDS", "600"))
+JOB_PURGE_BATCH_SIZE = int(os.getenv("JOB_PURGE_BATCH_SIZE", "500"))
+DEFAULT_PROVIDER_CONCURRENCY = int(os.getenv("JOB_DEFAULT_PROVIDER_CONCURRENCY", "2"))
+
+
+def parse_provider_limits(raw: Optional[str]) -> Dict[str, int]:
+    """Converte 'openrouter=4,gemini=2' em {'openrouter': 4, 'gemini': 2}"""
+    limits = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        provider, value = item.split("=", 1)
+        try:
+            limits[provider.strip()] = max(1, int(value))
+        except ValueError:
+            logger.warning("⚠️ Limite de concorrência inválido para %s: %s", provider, value)
+    return limits
+
+
+PROVIDER_CONCURRENCY = parse_provider_limits(os.getenv("JOB_PROVIDER_CONCURRENCY", "openrouter=4,gemini=2"))
+
+
+class JobQueue:
+    """Fila de jobs de geração persistida no SQLite (sobrevive a reinícios)."""
+
+    def __init__(self, db_path: Optional[str] = JOB_QUEUE_DB_PATH):
+        self.db_path = db_path
+        # Sem arquivo (Postgres sem JOB_QUEUE_DB_PATH) o modo assíncrono fica indisponível
+        self.enabled = db_path is not None
+        self._changed = threading.Condition()
+        # Jobs aguardando ou em execução: lido pelo controle de admissão no event loop, sem SQL
+        self._depth = 0
+        self._depth_lock = threading.Lock()
+        self._depth_refreshed_at = 0.0
+        self._purged_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_table(self):
+        if not self.enabled:
+            logger.warning("⚠️ Postgres sem JOB_QUEUE_DB_PATH: fila de jobs desativada (async_mode responde 503)")
+            return
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS generation_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs (status, created_at)"
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def recover(self) -> int:
+        """Devolve para a fila os jobs que estavam em execução quando o processo caiu."""
+        if not self.enabled:
+            return 0
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE generation_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                (time.time(),)
+            )
+            conn.commit()
+            recovered = cursor.rowcount
+        finally:
+            conn.close()
+        self.refresh_depth()
+        if recovered:
+            logger.info("♻️ %s jobs interrompidos devolvidos à fila", recovered)
+        return recovered
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], provider: str,
+                job_id: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Enfileira um job. Com job_id repetido, devolve o job existente. Retorna (job, criado)."""
+        job_id = job_id or str(uuid.uuid4())
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO generation_jobs (id, kind, provider, payload, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'queued', ?, ?)
+            ''', (job_id, kind, provider, json.dumps(payload), now, now))
+            conn.commit()
+            created = cursor.rowcount == 1
+        finally:
+            conn.close()
+
+        if created:
+            self._adjust_depth(1)
+            self.notify()
+        return self.get(job_id), created
+
+    def claim(self, excluded_providers: List[str]) -> Optional[Dict[str, Any]]:
+        """Reserva o job mais antigo cujo provedor ainda tem capacidade livre."""
+        conn = self._connect()
+        try:
+            placeholders = ",".join("?" for _ in excluded_providers)
+            provider_filter = f"AND provider NOT IN ({placeholders})" if excluded_providers else ""
+            while True:
+                row = conn.execute(f'''
+                    SELECT id FROM generation_jobs
+                    WHERE status = 'queued' {provider_filter}
+                    ORDER BY created_at ASC
+                    LIMIT 1
+                ''', tuple(excluded_providers)).fetchone()
+                if not row:
+                    return None
+
+                cursor = conn.execute('''
+                    UPDATE generation_jobs
+                    SET status = 'running', attempts = attempts + 1, updated_at = ?
+                    WHERE id = ? AND status = 'queued'
+                ''', (time.time(), row['id']))
+                conn.commit()
+                # Outro worker pode ter reservado o mesmo job; tenta o próximo
+                if cursor.rowcount == 1:
+                    return self._row_to_job(
+                        conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (row['id'],)).fetchone()
+                    )
+        finally:
+            conn.close()
+
+    def release(self, job_id: str):
+        """Devolve à fila um job reservado que não chegou a rodar (a tentativa não conta)."""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE generation_jobs
+                SET status = 'queued', attempts = MAX(attempts - 1, 0), updated_at = ?
+                WHERE id = ? AND status = 'running'
+            ''', (time.time(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+        self.notify()
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        self._finish(job_id, "done", result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str, retry: bool = False):
+        self._finish(job_id, "queued" if retry else "failed", error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE generation_jobs SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (status, result, error, time.time(), job_id)
+            )
+            conn.commit()
+            finished = cursor.rowcount == 1 and status in ("done", "failed")
+        finally:
+            conn.close()
+        if finished:
+            self._adjust_depth(-1)
+        self.notify()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_job(row) if row else None
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Aguarda (long-poll) até o job terminar ou o timeout expirar."""
+        deadline = time.time() + timeout
+        job = self.get(job_id)
+        while job and job["status"] in ("queued", "running"):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self.wait_for_change(min(remaining, JOB_POLL_INTERVAL))
+            job = self.get(job_id)
+        return job
+
+    def depth(self) -> int:
+        """Quantidade de jobs aguardando ou em execução (contador em memória, não consulta o banco)."""
+        return self._depth
+
+    def refresh_depth(self) -> int:
+        """Recalcula a profundidade no banco; roda no startup e nos workers ociosos, nunca no event loop."""
+        if not self.enabled:
+            return 0
+        conn = self._connect()
+        try:
+            depth = conn.execute(
+                "SELECT COUNT(*) FROM generation_jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        with self._depth_lock:
+            self._depth = depth
+            self._depth_refreshed_at = time.monotonic()
+        return depth
+
+    def refresh_depth_if_stale(self, max_age: float = JOB_DEPTH_REFRESH_SECONDS):
+        if time.monotonic() - self._depth_refreshed_at >= max_age:
+            # Marca antes de consultar: os outros workers ociosos não repetem o COUNT
+            self._depth_refreshed_at = time.monotonic()
+            self.refresh_depth()
+
+    def purge_finished(self, ttl: float = JOB_RESULT_TTL_SECONDS, batch_size: int = JOB_PURGE_BATCH_SIZE) -> int:
+        """Apaga jobs concluídos/falhos mais antigos que ttl, em lotes curtos (não segura o lock de escrita)."""
+        if not self.enabled:
+            return 0
+        cutoff = time.time() - ttl
+        total = 0
+        conn = self._connect()
+        try:
+            while True:
+                cursor = conn.execute('''
+                    DELETE FROM generation_jobs WHERE rowid IN (
+                        SELECT rowid FROM generation_jobs
+                        WHERE status IN ('done', 'failed') AND updated_at < ?
+                        LIMIT ?
+                    )
+                ''', (cutoff, batch_size))
+                conn.commit()
+                total += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+        finally:
+            conn.close()
+        if total:
+            logger.info("🧹 %s jobs finalizados removidos da fila", total)
+        return total
+
+    def purge_finished_if_due(self, interval: float = JOB_PURGE_INTERVAL_SECONDS):
+        if time.monotonic() - self._purged_at >= interval:
+            self._purged_at = time.monotonic()
+            self.purge_finished()
+
+    def _adjust_depth(self, delta: int):
+        with self._depth_lock:
+            self._depth = max(0, self._depth + delta)
+
+    def wait_for_change(self, timeout: float):
+        """Bloqueia até algum job ser enfileirado/finalizado ou o timeout expirar."""
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row['id'],
+            "kind": row['kind'],
+            "provider": row['provider'],
+            "status": row['status'],
+            "attempts": row['attempts'],
+            "result": json.loads(row['result']) if row['result'] else None,
+            "error": row['error'],
+            "payload": json.loads(row['payload']),
+            "created_at": row['created_at'],
+            "updated_at": row['updated_at'],
+        }
+
+
+class JobWorkerPool:
+    """Pool de threads que executa os jobs respeitando limites por provedor."""
+
+    def __init__(self, queue: JobQueue, workers: int = JOB_WORKERS,
+                 provider_limits: Optional[Dict[str, int]] = None):
+        self.queue = queue
+        self.workers = workers
+        self.provider_limits = provider_limits if provider_limits is not None else PROVIDER_CONCURRENCY
+        self._handlers: Dict[str, Tuple[Callable[[Dict[str, Any]], Dict[str, Any]], str]] = {}
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def register_handler(self, kind: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]], provider: str):
+        """Associa um tipo de job à função que o executa e ao provedor de IA usado."""
+        self._handlers[kind] = (handler, provider)
+
+    def provider_for(self, kind: str) -> str:
+        return self._handlers[kind][1]
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("👷 %s workers de geração iniciados (limites: %s)", self.workers, self.provider_limits)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self.queue.notify()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _saturated_providers(self) -> List[str]:
+        return [
+            provider for provider, running in self._running.items()
+            if running >= self.provider_limits.get(provider, DEFAULT_PROVIDER_CONCURRENCY)
+        ]
+
+    def _reserve_slot(self, provider: str) -> bool:
+        with self._lock:
+            if self._running.get(provider, 0) >= self.provider_limits.get(provider, DEFAULT_PROVIDER_CONCURRENCY):
+                return False
+            self._running[provider] = self._running.get(provider, 0) + 1
+            return True
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            # O lock só protege os contadores: a escrita do claim no SQLite roda fora dele,
+            # então um banco lento ou travado não segura os outros workers
+            with self._lock:
+                saturated = self._saturated_providers()
+            try:
+                job = self.queue.claim(saturated)
+                # Outro worker pode ter ocupado a última vaga do provedor durante o claim
+                if job and not self._reserve_slot(job["provider"]):
+                    self.queue.release(job["job_id"])
+                    continue
+            except sqlite3.Error as e:
+                # Um erro do banco não pode matar o worker: espera e tenta de novo
+                logger.error("❌ Falha ao buscar job na fila: %s", e)
+                self._stop.wait(JOB_ERROR_BACKOFF_SECONDS)
+                continue
+
+            if not job:
+                try:
+                    self.queue.refresh_depth_if_stale()
+                    self.queue.purge_finished_if_due()
+                except sqlite3.Error as e:
+                    logger.warning("⚠️ Falha na manutenção da fila de jobs: %s", e)
+                self.queue.wait_for_change(JOB_POLL_INTERVAL)
+                continue
+
+            try:
+                self._execute(job)
+            except sqlite3.Error as e:
+                # O job fica como "running" e volta para a fila no recover do próximo startup
+                logger.error("❌ Falha ao gravar o estado do job %s: %s", job["job_id"], e)
+                self._stop.wait(JOB_ERROR_BACKOFF_SECONDS)
+            finally:
+                with self._lock:
+                    self._running[job["provider"]] -= 1
+                self.queue.notify()
+
+    def _execute(self, job: Dict[str, Any]):
+        handler_entry = self._handlers.get(job["kind"])
+        if not handler_entry:
+            self.queue.fail(job["job_id"], f"Tipo de job desconhecido: {job['kind']}")
+            return
+
+        handler, _ = handler_entry
+        try:
+            result = handler(job["payload"])
+        except Exception as e:
+            # Erros do cliente (HTTPException 4xx) não adianta repetir; 5xx e falhas
+            # inesperadas (LLM fora do ar, timeout) voltam para a fila
+            detail = getattr(e, "detail", None) or str(e)
+            status_code = getattr(e, "status_code", None)
+            transient = status_code is None or status_code >= 500
+            retry = transient and job["attempts"] < JOB_MAX_ATTEMPTS
+            logger.error("❌ Job %s falhou (tentativa %s): %s", job["job_id"], job["attempts"], detail)
+            self.queue.fail(job["job_id"], str(detail), retry=retry)
+            return
+        self.queue.complete(job["job_id"], result)
+
+
+# Instâncias compartilhadas pelo processo
+job_queue = JobQueue()
+worker_pool = JobWorkerPool(job_queue)
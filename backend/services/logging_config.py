@@ -0,0 +1,136 @@
+# services/logging_config.py
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Configurações de logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (estruturado) ou "text" (legível, para desenvolvimento)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Amostragem por logger das mensagens abaixo de WARNING, ex.: "services.ai_service=0.1,main=0.5"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Atributos padrão de LogRecord; o resto veio de extra={...} e vai como campo estruturado
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def parse_sample_rates(raw: Optional[str]) -> Dict[str, float]:
+    """Converte 'services.ai_service=0.1,main=0.5' em {'services.ai_service': 0.1, 'main': 0.5}"""
+    rates = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos passados em extra={...}."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Descarta uma fração dos registros abaixo de WARNING por logger (prefixo do nome).
+    Avisos e erros nunca são amostrados.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Prefixos mais longos primeiro: 'services.ai_service' vence 'services'
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _rate_for(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que não formata na thread da requisição.
+    O QueueHandler padrão chama format() em prepare(); aqui a mensagem e os
+    argumentos seguem intactos e só são formatados pela thread do listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Sob pressão extrema, perder log é melhor que bloquear a requisição
+            pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, sample_rates: Optional[str] = LOG_SAMPLE_RATES):
+    """Configura o logging raiz: fila não bloqueante + listener que escreve em stderr."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(sample_rates)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Esvazia a fila de logs (chamado no encerramento do processo)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
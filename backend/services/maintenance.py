@@ -0,0 +1,294 @@
+# services/maintenance.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.db_backend import SQLITE_PATH, is_postgres
+from services.job_queue import JOB_QUEUE_DB_PATH
+from services.idempotency import IDEMPOTENCY_DB_PATH
+from services.retention import (AUTO_VACUUM_INCREMENTAL, RETENTION_ENABLED, RETENTION_VACUUM_CONVERT_MAX_MB,
+                                convert_to_incremental_vacuum, reclaim_space)
+from services.metrics import MAINTENANCE_STEPS, MAINTENANCE_STEP_SECONDS, MAINTENANCE_PAGES_FREED, DB_FILE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Manutenção dos arquivos SQLite: PRAGMA optimize/ANALYZE, incremental_vacuum e checkpoint do WAL
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+# Arquivos mantidos (separados por vírgula); vazio = os bancos conhecidos da API que existirem
+MAINTENANCE_DATABASES = os.getenv("MAINTENANCE_DATABASES", "")
+# Janela de pouco tráfego em UTC ("HH:MM-HH:MM", pode virar a meia-noite); vazio = qualquer hora
+MAINTENANCE_WINDOW_UTC = os.getenv("MAINTENANCE_WINDOW_UTC", "03:00-06:00")
+# Intervalo mínimo entre duas rodadas agendadas
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "86400"))
+MAINTENANCE_CHECK_SECONDS = float(os.getenv("MAINTENANCE_CHECK_SECONDS", "60"))
+# Tempo máximo por banco: ao estourar, o comando em curso é interrompido (conn.interrupt)
+MAINTENANCE_TIME_BUDGET_SECONDS = float(os.getenv("MAINTENANCE_TIME_BUDGET_SECONDS", "30"))
+# Só roda com no máximo esta quantidade de requisições HTTP em andamento
+MAINTENANCE_MAX_IN_FLIGHT = int(os.getenv("MAINTENANCE_MAX_IN_FLIGHT", "2"))
+# Linhas amostradas por índice no ANALYZE (PRAGMA analysis_limit): custo limitado em tabelas grandes
+MAINTENANCE_ANALYSIS_LIMIT = int(os.getenv("MAINTENANCE_ANALYSIS_LIMIT", "1000"))
+MAINTENANCE_VACUUM_PAGES = int(os.getenv("MAINTENANCE_VACUUM_PAGES", "500"))
+# Converte para auto_vacuum=INCREMENTAL (VACUUM completo) os bancos até RETENTION_VACUUM_CONVERT_MAX_MB;
+# por padrão só com a retenção ligada, que é quem libera páginas em volume
+MAINTENANCE_CONVERT_AUTO_VACUUM = os.getenv(
+    "MAINTENANCE_CONVERT_AUTO_VACUUM", "true" if RETENTION_ENABLED else "false"
+).lower() == "true"
+
+
+def default_databases() -> List[str]:
+    """Bancos SQLite do projeto (API, fila, idempotência, SQLAlchemy e o do RPG), sem repetir arquivos."""
+    if MAINTENANCE_DATABASES.strip():
+        candidates = [path.strip() for path in MAINTENANCE_DATABASES.split(",") if path.strip()]
+    else:
+        # No Postgres o banco da API não é SQLite; fila e idempotência só se tiverem arquivo próprio
+        api_database = None if is_postgres() else SQLITE_PATH
+        candidates = [api_database, JOB_QUEUE_DB_PATH, IDEMPOTENCY_DB_PATH, "sql_app.db", "cringe_rpg.db"]
+    paths, seen = [], set()
+    for path in candidates:
+        if not path:
+            continue
+        real = os.path.realpath(path)
+        if real not in seen:
+            seen.add(real)
+            paths.append(path)
+    return paths
+
+
+def parse_window(spec: str) -> Optional[Tuple[int, int]]:
+    """"03:00-06:00" -> (180, 360) em minutos do dia (UTC); vazio = sem janela."""
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    try:
+        start, end = (part.strip() for part in spec.split("-"))
+        minutes = []
+        for part in (start, end):
+            hours, mins = part.split(":")
+            value = int(hours) * 60 + int(mins)
+            if not 0 <= value < 24 * 60:
+                raise ValueError
+            minutes.append(value)
+    except ValueError:
+        raise ValueError(f"Janela de manutenção inválida: {spec!r} (use HH:MM-HH:MM)")
+    return minutes[0], minutes[1]
+
+
+def in_window(window: Optional[Tuple[int, int]], now: Optional[datetime] = None) -> bool:
+    if window is None:
+        return True
+    now = now or datetime.now(timezone.utc)
+    minute = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def _file_stats(conn: sqlite3.Connection, path: str) -> Dict[str, int]:
+    wal = path + "-wal"
+    return {
+        "file_bytes": os.path.getsize(path),
+        "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+        "pages": conn.execute("PRAGMA page_count").fetchone()[0],
+        "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+
+
+def _optimize(conn: sqlite3.Connection, deadline: float, analysis_limit: int, vacuum_pages: int) -> Dict[str, Any]:
+    # analysis_limit vale para o ANALYZE e para o que o PRAGMA optimize decidir rodar
+    conn.execute(f"PRAGMA analysis_limit = {int(analysis_limit)}").fetchall()
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        # Banco nunca analisado: o optimize só reanalisa o que já tem estatística
+        conn.execute("ANALYZE")
+        return {"analyze": "full"}
+    conn.execute("PRAGMA optimize").fetchall()
+    return {"analyze": "optimize"}
+
+
+def _checkpoint(conn: sqlite3.Connection, deadline: float, analysis_limit: int, vacuum_pages: int) -> Dict[str, Any]:
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode != "wal":
+        return {"journal_mode": journal_mode}
+    # PASSIVE não espera leitores nem escritores; só com o WAL todo aplicado o TRUNCATE zera o arquivo
+    busy, frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    truncated = False
+    if not busy and frames == checkpointed:
+        truncated = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0] == 0
+    return {"journal_mode": journal_mode, "wal_frames": frames, "checkpointed": checkpointed, "truncated": truncated}
+
+
+def _convert_auto_vacuum(conn: sqlite3.Connection, deadline: float, analysis_limit: int, vacuum_pages: int) -> Dict[str, Any]:
+    # O VACUUM que não terminar no prazo é interrompido e desfeito; a próxima janela tenta de novo
+    return convert_to_incremental_vacuum(conn, RETENTION_VACUUM_CONVERT_MAX_MB)
+
+
+def _vacuum(conn: sqlite3.Connection, deadline: float, analysis_limit: int, vacuum_pages: int) -> Dict[str, Any]:
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        # Sem auto_vacuum incremental as páginas livres são reaproveitadas, mas o arquivo não encolhe
+        return {"auto_vacuum": False, "pages_freed": 0}
+    freed = reclaim_space(conn, vacuum_pages, pause=0, should_stop=lambda: time.monotonic() >= deadline)
+    return {"auto_vacuum": True, "pages_freed": freed}
+
+
+# O checkpoint vem por último: o optimize e o vacuum também escrevem no WAL
+_STEPS = (("optimize", _optimize), ("auto_vacuum", _convert_auto_vacuum), ("vacuum", _vacuum), ("checkpoint", _checkpoint))
+
+
+def maintain_database(path: str, time_budget: float = MAINTENANCE_TIME_BUDGET_SECONDS,
+                      analysis_limit: int = MAINTENANCE_ANALYSIS_LIMIT,
+                      vacuum_pages: int = MAINTENANCE_VACUUM_PAGES,
+                      convert_auto_vacuum: bool = MAINTENANCE_CONVERT_AUTO_VACUUM) -> Dict[str, Any]:
+    """
+    Uma rodada de manutenção em um arquivo, limitada a time_budget segundos:
+    passos que não cabem no tempo são pulados e o comando em curso no fim do
+    prazo é interrompido. Devolve o relatório com tamanhos antes/depois.
+    """
+    label = os.path.basename(path)
+    started = time.monotonic()
+    deadline = started + time_budget
+    report: Dict[str, Any] = {
+        "database": path,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "steps": {},
+    }
+    # mode=rw: um arquivo que não existe não é criado pela manutenção
+    conn = sqlite3.connect(f"file:{path}?mode=rw", uri=True, timeout=min(5.0, time_budget), isolation_level=None)
+    timer = threading.Timer(time_budget, conn.interrupt)
+    timer.daemon = True
+    timer.start()
+    try:
+        report["before"] = _file_stats(conn, path)
+        for name, step in _STEPS:
+            if name == "auto_vacuum" and not convert_auto_vacuum:
+                continue
+            if time.monotonic() >= deadline:
+                report["steps"][name] = {"result": "skipped"}
+                MAINTENANCE_STEPS.inc(database=label, step=name, result="skipped")
+                continue
+            step_start = time.perf_counter()
+            try:
+                details = step(conn, deadline, analysis_limit, vacuum_pages)
+                result = "ok"
+            except sqlite3.OperationalError as e:
+                interrupted = "interrupt" in str(e).lower()
+                details = {"error": str(e)}
+                result = "interrupted" if interrupted else "error"
+            elapsed = time.perf_counter() - step_start
+            report["steps"][name] = dict(details, result=result, ms=round(elapsed * 1000, 1))
+            MAINTENANCE_STEPS.inc(database=label, step=name, result=result)
+            MAINTENANCE_STEP_SECONDS.observe(elapsed, step=name)
+        timer.cancel()
+        report["after"] = _file_stats(conn, path)
+    finally:
+        timer.cancel()
+        conn.close()
+
+    pages_freed = report["steps"].get("vacuum", {}).get("pages_freed", 0)
+    if pages_freed:
+        MAINTENANCE_PAGES_FREED.inc(pages_freed, database=label)
+    DB_FILE_BYTES.set(report["after"]["file_bytes"], database=label, file="db")
+    DB_FILE_BYTES.set(report["after"]["wal_bytes"], database=label, file="wal")
+    report["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return report
+
+
+class MaintenanceScheduler:
+    """
+    Thread que confere a cada MAINTENANCE_CHECK_SECONDS se a manutenção está
+    vencida, se é hora da janela e se o tráfego está baixo; então mantém cada
+    banco em sequência. run_once(force=True) ignora janela e intervalo (debug).
+    """
+
+    def __init__(self, databases: Callable[[], List[str]] = default_databases,
+                 interval: float = MAINTENANCE_INTERVAL_SECONDS, window: str = MAINTENANCE_WINDOW_UTC,
+                 time_budget: float = MAINTENANCE_TIME_BUDGET_SECONDS,
+                 busy: Callable[[], bool] = lambda: False):
+        self.databases = databases
+        self.interval = interval
+        self.window_spec = window
+        self.window = parse_window(window)
+        self.time_budget = time_budget
+        self.busy = busy
+        self.last_run: Optional[float] = None
+        self.reports: Dict[str, Dict[str, Any]] = {}
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def due(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return self.last_run is None or now - self.last_run >= self.interval
+
+    def run_once(self, force: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """Mantém todos os bancos; None se outra rodada já está em andamento."""
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            if not force and not (self.due() and in_window(self.window) and not self.busy()):
+                return []
+            reports = []
+            for path in self.databases():
+                if self._stop.is_set():
+                    break
+                if not os.path.exists(path):
+                    continue
+                try:
+                    report = maintain_database(path, self.time_budget)
+                except Exception as e:
+                    logger.error("❌ Manutenção de %s falhou: %s", path, e)
+                    report = {"database": path, "error": str(e)}
+                self.reports[path] = report
+                reports.append(report)
+            self.last_run = time.time()
+            for report in reports:
+                if "error" not in report:
+                    logger.info(
+                        "🧰 Manutenção de %s em %.0f ms: %s → %s bytes, %s páginas livres → %s",
+                        report["database"], report["duration_ms"],
+                        report["before"]["file_bytes"], report["after"]["file_bytes"],
+                        report["before"]["free_pages"], report["after"]["free_pages"]
+                    )
+            return reports
+        finally:
+            self._run_lock.release()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._run_lock.locked(),
+            "window_utc": self.window_spec or None,
+            "interval_seconds": self.interval,
+            "time_budget_seconds": self.time_budget,
+            "last_run": datetime.fromtimestamp(self.last_run, timezone.utc).isoformat(timespec="seconds")
+            if self.last_run else None,
+            "databases": self.databases(),
+            "reports": list(self.reports.values()),
+        }
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="sqlite-maintenance", daemon=True)
+        self._thread.start()
+        logger.info(
+            "🧰 Manutenção SQLite agendada (janela UTC %s, a cada %ss, até %ss por banco)",
+            self.window_spec or "livre", self.interval, self.time_budget
+        )
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(MAINTENANCE_CHECK_SECONDS):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("❌ Erro na manutenção do SQLite: %s", e)
@@ -0,0 +1,317 @@
+# services/metrics.py
+
+import os
+import time
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services.db_instrumentation import statement_family
+
+# Limite de valores distintos para o label "bot" (evita explosão de cardinalidade)
+METRICS_MAX_BOT_LABELS = int(os.getenv("METRICS_MAX_BOT_LABELS", "200"))
+# Janela em que uma conversa é considerada ativa
+ACTIVE_CONVERSATION_WINDOW = int(os.getenv("METRICS_ACTIVE_CONVERSATION_WINDOW", "300"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+DB_LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 12)
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    # No HELP só barra invertida e quebra de linha são escapadas
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {_escape_help(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        if self._collect:
+            items = list(self._collect().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por série: contagens por bucket (não cumulativas), soma e total
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        return "\n".join(metric.expose() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+# --- Limite de cardinalidade do label "bot" ---
+_bot_labels = set()
+_bot_labels_lock = threading.Lock()
+
+
+def bot_label(bot_id: Optional[str]) -> str:
+    """Valor do label 'bot'; além do limite configurado, agrupa em 'other'."""
+    if not bot_id:
+        return "unknown"
+    if bot_id in _bot_labels:
+        return bot_id
+    with _bot_labels_lock:
+        if len(_bot_labels) < METRICS_MAX_BOT_LABELS:
+            _bot_labels.add(bot_id)
+            return bot_id
+    return "other"
+
+
+# --- Conversas ativas (última mensagem dentro da janela) ---
+_active_conversations: Dict[str, Tuple[float, str]] = {}
+_active_lock = threading.Lock()
+
+
+def mark_conversation_active(conversation_id: str, bot_id: Optional[str]):
+    with _active_lock:
+        _active_conversations[conversation_id] = (time.time(), bot_label(bot_id))
+
+
+def _collect_active_conversations() -> Dict[Tuple[str, ...], float]:
+    cutoff = time.time() - ACTIVE_CONVERSATION_WINDOW
+    counts: Dict[Tuple[str, ...], float] = {}
+    with _active_lock:
+        for conversation_id, (last_seen, bot) in list(_active_conversations.items()):
+            if last_seen < cutoff:
+                del _active_conversations[conversation_id]
+                continue
+            counts[(bot,)] = counts.get((bot,), 0) + 1
+    return counts
+
+
+# --- Métricas do pipeline de chat ---
+CHAT_LATENCY = registry.register(Histogram(
+    "cringe_chat_request_duration_seconds",
+    "Latência ponta a ponta de um turno de chat, por resultado (ok, fallback, rejected, error)",
+    ("bot", "model", "outcome")
+))
+LLM_LATENCY = registry.register(Histogram(
+    "cringe_llm_request_duration_seconds",
+    "Latência de cada tentativa de chamada ao LLM",
+    ("bot", "model", "status")
+))
+LLM_ATTEMPTS = registry.register(Histogram(
+    "cringe_llm_attempts_per_generation",
+    "Tentativas (retries + fallbacks) necessárias por geração",
+    ("bot", "model"),
+    buckets=COUNT_BUCKETS
+))
+LLM_RETRIES = registry.register(Counter(
+    "cringe_llm_retries_total",
+    "Novas tentativas no mesmo modelo (rate limit, timeout, erro)",
+    ("bot", "model")
+))
+LLM_FALLBACKS = registry.register(Counter(
+    "cringe_llm_fallbacks_total",
+    "Trocas de modelo após falha do modelo anterior",
+    ("bot", "model")
+))
+LLM_PROMPT_TOKENS = registry.register(Counter(
+    "cringe_llm_prompt_tokens_total",
+    "Tokens de prompt reportados pelo provedor",
+    ("bot", "model")
+))
+LLM_COMPLETION_TOKENS = registry.register(Counter(
+    "cringe_llm_completion_tokens_total",
+    "Tokens de resposta reportados pelo provedor",
+    ("bot", "model")
+))
+DB_QUERY_LATENCY = registry.register(Histogram(
+    "cringe_db_query_duration_seconds",
+    "Tempo de execução de SQL por família de comando",
+    ("statement",),
+    buckets=DB_LATENCY_BUCKETS
+))
+HISTORY_CACHE_LOOKUPS = registry.register(Counter(
+    "cringe_history_cache_lookups_total",
+    "Consultas à cache de histórico recente (hit dispensa a leitura no banco)",
+    ("result",)
+))
+HISTORY_CACHE_BYTES = registry.register(Gauge(
+    "cringe_history_cache_bytes",
+    "Memória estimada das janelas de histórico em cache"
+))
+MAINTENANCE_STEPS = registry.register(Counter(
+    "cringe_sqlite_maintenance_steps_total",
+    "Passos da manutenção SQLite (optimize, vacuum, checkpoint) por resultado",
+    ("database", "step", "result")
+))
+MAINTENANCE_STEP_SECONDS = registry.register(Histogram(
+    "cringe_sqlite_maintenance_step_duration_seconds",
+    "Tempo de cada passo da manutenção SQLite",
+    ("step",)
+))
+MAINTENANCE_PAGES_FREED = registry.register(Counter(
+    "cringe_sqlite_maintenance_pages_freed_total",
+    "Páginas devolvidas ao disco pelo incremental_vacuum da manutenção",
+    ("database",)
+))
+DB_FILE_BYTES = registry.register(Gauge(
+    "cringe_sqlite_file_bytes",
+    "Tamanho dos arquivos SQLite (banco e WAL) na última manutenção",
+    ("database", "file")
+))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "cringe_http_requests_in_flight",
+    "Requisições HTTP em andamento"
+))
+ACTIVE_CONVERSATIONS = registry.register(Gauge(
+    "cringe_active_conversations",
+    f"Conversas com mensagens nos últimos {ACTIVE_CONVERSATION_WINDOW}s",
+    ("bot",),
+    collect=_collect_active_conversations
+))
+
+
+def record_db_query(sql: str, parameters, duration: float):
+    """Observador de queries: registra o tempo por família de comando."""
+    DB_QUERY_LATENCY.observe(duration, statement=statement_family(sql))
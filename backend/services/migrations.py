@@ -0,0 +1,445 @@
+# services/migrations.py
+
+import sqlite3
+import logging
+from typing import Callable, List, NamedTuple
+
+from services.usage import install_usage
+from services.stats import install_stats
+from services.archive import install_archive, install_rehydrated_at
+from services.search import install_search
+from services.tags import install_tags
+from services.purge import install_soft_delete
+from services.tokens import install_token_counts, backfill_token_counts
+from services.retention import install_retention
+from services.db_backend import dialect_of
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+# Chave do pg_advisory_lock: só um processo migra o Postgres por vez
+POSTGRES_MIGRATION_LOCK = 72_410_042
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    if dialect_of(conn) == "postgres":
+        # Postgres não tem user_version: a versão fica em uma tabela
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        conn.commit()
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _record_version(conn: sqlite3.Connection, migration: "Migration"):
+    if dialect_of(conn) == "postgres":
+        conn.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+            (migration.version, migration.description)
+        )
+        conn.commit()
+        return
+    # PRAGMA não aceita parâmetros; a versão vem da lista de migrações (int)
+    conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+
+
+def run_migrations(conn: sqlite3.Connection, migrations: List[Migration]) -> int:
+    """
+    Aplica, em ordem, as migrações com versão maior que a do banco (PRAGMA
+    user_version no SQLite, tabela schema_migrations no Postgres) e devolve
+    quantas rodaram. Cada passo precisa ser idempotente (IF NOT EXISTS,
+    checagem de colunas): bancos criados pelo init_db antigo estão na versão 0
+    e já têm parte do schema; um passo interrompido antes de gravar a versão
+    simplesmente roda de novo no próximo startup.
+    """
+    versions = [migration.version for migration in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError("Versões de migração devem ser únicas e crescentes")
+
+    if dialect_of(conn) != "postgres":
+        return _apply_pending(conn, migrations, versions)
+    # Vários workers sobem juntos: o lock de sessão serializa as migrações
+    conn.execute("SELECT pg_advisory_lock(?)", (POSTGRES_MIGRATION_LOCK,))
+    try:
+        return _apply_pending(conn, migrations, versions)
+    finally:
+        conn.rollback()
+        conn.execute("SELECT pg_advisory_unlock(?)", (POSTGRES_MIGRATION_LOCK,))
+        conn.commit()
+
+
+def _apply_pending(conn: sqlite3.Connection, migrations: List[Migration], versions: List[int]) -> int:
+    version = current_version(conn)
+    if versions and version > versions[-1]:
+        logger.warning("⚠️ Banco na versão %s, mais nova que o código (%s)", version, versions[-1])
+
+    applied = 0
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+        logger.info("🧱 Migração %s: %s", migration.version, migration.description)
+        migration.apply(conn)
+        if conn.in_transaction:
+            conn.commit()
+        _record_version(conn, migration)
+        applied += 1
+    return applied
+
+
+# ----------------------------------------------------------------------
+# Schema da API (backend/main.py, cringe.db)
+# ----------------------------------------------------------------------
+
+def _create_base_tables(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bots (
+            id TEXT PRIMARY KEY,
+            creator_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            gender TEXT NOT NULL,
+            introduction TEXT NOT NULL,
+            personality TEXT NOT NULL,
+            welcome_message TEXT NOT NULL,
+            avatar_url TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            conversation_context TEXT NOT NULL,
+            context_images TEXT NOT NULL,
+            system_prompt TEXT NOT NULL,
+            ai_config TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            bot_id TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (bot_id) REFERENCES bots (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            conversation_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            is_user BOOLEAN NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+    ''')
+    conn.commit()
+
+
+def _create_hot_path_indexes(conn: sqlite3.Connection):
+    """Índices das chaves estrangeiras e da ordenação da listagem de bots."""
+    # Histórico da conversa: filtro por conversa já na ordem de created_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_bot ON conversations (bot_id)")
+    # GET /bots: ORDER BY created_at DESC sem ordenar em memória
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bots_created_at ON bots (created_at)")
+    conn.commit()
+
+
+API_MIGRATIONS = [
+    Migration(1, "tabelas base (bots, conversations, messages)", _create_base_tables),
+    Migration(2, "uso de tokens por mensagem e agregados", install_usage),
+    Migration(3, "contadores mantidos por triggers (stats)", install_stats),
+    Migration(4, "arquivo de conversas ociosas", install_archive),
+    Migration(5, "índices FTS5 de bots e mensagens", install_search),
+    Migration(6, "tabela normalizada bot_tags", install_tags),
+    Migration(7, "soft delete de bots", install_soft_delete),
+    Migration(8, "índices dos caminhos quentes", _create_hot_path_indexes),
+    Migration(9, "token_count por mensagem e total por conversa", install_token_counts),
+    Migration(10, "índice de atividade das conversas", install_retention),
+    Migration(11, "data de reidratação das conversas arquivadas", install_rehydrated_at),
+]
+
+
+# ----------------------------------------------------------------------
+# Schema da API no Postgres (DATABASE_URL)
+# ----------------------------------------------------------------------
+# Mesmo modelo de dados do SQLite, sem o que é específico dele: FTS5 (a busca
+# fica indisponível), arquivo de conversas (o archiver só roda no SQLite) e os
+# triggers da tabela stats (read_stats usa as estimativas do pg_class).
+
+def _pg_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bots (
+            id TEXT PRIMARY KEY,
+            creator_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            gender TEXT NOT NULL,
+            introduction TEXT NOT NULL,
+            personality TEXT NOT NULL,
+            welcome_message TEXT NOT NULL,
+            avatar_url TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            conversation_context TEXT NOT NULL,
+            context_images TEXT NOT NULL,
+            system_prompt TEXT NOT NULL,
+            ai_config TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            bot_id TEXT NOT NULL REFERENCES bots (id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            conversation_id TEXT NOT NULL REFERENCES conversations (id),
+            content TEXT NOT NULL,
+            is_user BOOLEAN NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        -- A tabela bots pode ter sido criada pelos models SQLAlchemy (sem created_at)
+        ALTER TABLE bots ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+    ''')
+    conn.commit()
+
+
+def _pg_usage(conn):
+    conn.execute('''
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER;
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS completion_tokens INTEGER;
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS latency_ms INTEGER;
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS model TEXT;
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            day TEXT NOT NULL,
+            bot_id TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms_total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, bot_id)
+        );
+        CREATE TABLE IF NOT EXISTS conversation_usage (
+            conversation_id TEXT PRIMARY KEY,
+            bot_id TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms_total INTEGER NOT NULL DEFAULT 0
+        );
+    ''')
+    conn.commit()
+
+
+def _pg_lifecycle_columns(conn):
+    """Colunas de soft delete e arquivo lidas pelas rotas (o arquivo fica sempre vazio)."""
+    conn.execute('''
+        ALTER TABLE bots ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+        ALTER TABLE conversations ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP;
+        ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP;
+        CREATE TABLE IF NOT EXISTS conversation_archive (
+            conversation_id TEXT PRIMARY KEY,
+            bot_id TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            message_count INTEGER NOT NULL,
+            raw_bytes INTEGER NOT NULL,
+            payload BYTEA NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_conversation_archive_bot ON conversation_archive (bot_id);
+    ''')
+    conn.commit()
+
+
+def _pg_tags(conn):
+    """bot_tags mantida por trigger PL/pgSQL (mesma normalização do SQLite; JSON inválido = sem tags)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_tags (
+            tag TEXT NOT NULL,
+            bot_id TEXT NOT NULL,
+            PRIMARY KEY (tag, bot_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_bot_tags_bot ON bot_tags (bot_id);
+
+        CREATE OR REPLACE FUNCTION bot_tags_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM bot_tags WHERE bot_id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.deleted_at IS NULL THEN
+                BEGIN
+                    INSERT INTO bot_tags (bot_id, tag)
+                    SELECT DISTINCT NEW.id, lower(btrim(value))
+                    FROM jsonb_array_elements_text(NEW.tags::jsonb) AS value
+                    WHERE btrim(value) <> ''
+                    ON CONFLICT DO NOTHING;
+                EXCEPTION WHEN others THEN
+                    NULL;
+                END;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS bot_tags_sync ON bots;
+        CREATE TRIGGER bot_tags_sync
+        AFTER INSERT OR DELETE OR UPDATE OF tags, deleted_at ON bots
+        FOR EACH ROW EXECUTE FUNCTION bot_tags_sync();
+    ''')
+    conn.commit()
+    # Backfill: o UPDATE sem mudança de valor dispara o trigger para cada bot
+    conn.execute("UPDATE bots SET tags = tags WHERE deleted_at IS NULL")
+    conn.commit()
+
+
+def _pg_indexes(conn):
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_conversations_bot ON conversations (bot_id);
+        CREATE INDEX IF NOT EXISTS idx_bots_created_at ON bots (created_at);
+        CREATE INDEX IF NOT EXISTS idx_bots_deleted ON bots (deleted_at) WHERE deleted_at IS NOT NULL;
+    ''')
+    conn.commit()
+
+
+def _pg_message_clock(conn):
+    # CURRENT_TIMESTAMP é o início da transação: no lote do write-behind (e no
+    # turno síncrono) pergunta e resposta empatariam no ORDER BY created_at
+    conn.execute("ALTER TABLE messages ALTER COLUMN created_at SET DEFAULT clock_timestamp()")
+    conn.commit()
+
+
+def _pg_token_counts(conn):
+    conn.execute('''
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS token_count INTEGER;
+        ALTER TABLE conversations ADD COLUMN IF NOT EXISTS token_total INTEGER NOT NULL DEFAULT 0;
+
+        CREATE OR REPLACE FUNCTION conversations_token_total() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.token_count IS NOT NULL THEN
+                UPDATE conversations SET token_total = token_total - OLD.token_count WHERE id = OLD.conversation_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.token_count IS NOT NULL THEN
+                UPDATE conversations SET token_total = token_total + NEW.token_count WHERE id = NEW.conversation_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS conversations_token_total ON messages;
+        CREATE TRIGGER conversations_token_total
+        AFTER INSERT OR DELETE OR UPDATE OF token_count ON messages
+        FOR EACH ROW EXECUTE FUNCTION conversations_token_total();
+    ''')
+    conn.commit()
+    backfill_token_counts(conn)
+
+
+def _pg_groups(conn):
+    """Tabelas dos grupos (models.Group/Message): no Postgres o ORM usa o mesmo banco da API."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS groups (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            scenario TEXT
+        );
+        CREATE TABLE IF NOT EXISTS group_bots (
+            group_id INTEGER NOT NULL REFERENCES groups (id),
+            bot_id TEXT NOT NULL REFERENCES bots (id),
+            PRIMARY KEY (group_id, bot_id)
+        );
+        CREATE TABLE IF NOT EXISTS group_messages (
+            id SERIAL PRIMARY KEY,
+            group_id INTEGER NOT NULL REFERENCES groups (id),
+            sender_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS ix_group_messages_group_id_id ON group_messages (group_id, id);
+    ''')
+    conn.commit()
+
+
+POSTGRES_MIGRATIONS = [
+    Migration(1, "tabelas base (bots, conversations, messages)", _pg_base_tables),
+    Migration(2, "uso de tokens por mensagem e agregados", _pg_usage),
+    Migration(3, "colunas de soft delete e arquivo", _pg_lifecycle_columns),
+    Migration(4, "tabela normalizada bot_tags", _pg_tags),
+    Migration(5, "índices dos caminhos quentes", _pg_indexes),
+    Migration(6, "created_at das mensagens pelo relógio do comando", _pg_message_clock),
+    Migration(7, "token_count por mensagem e total por conversa", _pg_token_counts),
+    Migration(8, "grupos de bots e mensagens dos grupos", _pg_groups),
+]
+
+
+def migrations_for(conn) -> List[Migration]:
+    return POSTGRES_MIGRATIONS if dialect_of(conn) == "postgres" else API_MIGRATIONS
+
+
+# ----------------------------------------------------------------------
+# Schema dos models SQLAlchemy no SQLite (backend/database.py, sql_app.db)
+# ----------------------------------------------------------------------
+# Arquivo separado do cringe.db, com a própria PRAGMA user_version. No Postgres
+# os models usam o banco da API e as tabelas vêm de POSTGRES_MIGRATIONS.
+
+def _orm_bots(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bots (
+            id VARCHAR PRIMARY KEY,
+            creator_id VARCHAR,
+            name VARCHAR,
+            gender VARCHAR,
+            introduction TEXT,
+            personality TEXT,
+            welcome_message TEXT,
+            avatar_url VARCHAR,
+            tags TEXT,
+            conversation_context TEXT,
+            context_images TEXT,
+            ai_config TEXT,
+            system_prompt TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_bots_creator_id ON bots (creator_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_bots_name ON bots (name)")
+    conn.commit()
+
+
+def _orm_groups(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS groups (
+            id INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            scenario TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS group_bots (
+            group_id INTEGER NOT NULL,
+            bot_id VARCHAR NOT NULL,
+            PRIMARY KEY (group_id, bot_id),
+            FOREIGN KEY (group_id) REFERENCES groups (id),
+            FOREIGN KEY (bot_id) REFERENCES bots (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS group_messages (
+            id INTEGER PRIMARY KEY,
+            group_id INTEGER NOT NULL,
+            sender_id VARCHAR NOT NULL,
+            text TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_id) REFERENCES groups (id)
+        )
+    ''')
+    # Histórico paginado e janela do prompt: filtro por grupo já na ordem do id
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_group_messages_group_id_id ON group_messages (group_id, id)")
+    conn.commit()
+
+
+ORM_MIGRATIONS = [
+    Migration(1, "tabela bots dos models", _orm_bots),
+    Migration(2, "grupos de bots e mensagens dos grupos", _orm_groups),
+]
@@ -0,0 +1,194 @@
+# services/purge.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+from services.stats import register_counter, seed_counter
+
+logger = logging.getLogger(__name__)
+
+# Exclusão de bots: o DELETE só marca deleted_at; o purger apaga o resto em lotes
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_INTERVAL_SECONDS = float(os.getenv("PURGE_INTERVAL_SECONDS", "60"))
+# Pausa entre lotes: devolve o lock de escrita do SQLite para as requisições
+PURGE_BATCH_PAUSE_SECONDS = float(os.getenv("PURGE_BATCH_PAUSE_SECONDS", "0.05"))
+
+register_counter("deleted_bots", "SELECT COUNT(*) FROM bots WHERE deleted_at IS NOT NULL")
+
+
+def install_soft_delete(conn: sqlite3.Connection):
+    """
+    Adiciona bots.deleted_at, os índices usados pelo purger e o contador
+    deleted_bots (bots marcados e ainda não purgados). Deve rodar depois de install_stats.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(bots)")}
+        if "deleted_at" not in columns:
+            cursor.execute("ALTER TABLE bots ADD COLUMN deleted_at DATETIME")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_bot ON conversations (bot_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bots_deleted ON bots (deleted_at) WHERE deleted_at IS NOT NULL")
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stats_bots_soft_delete
+            AFTER UPDATE OF deleted_at ON bots
+            WHEN OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL
+            BEGIN
+                UPDATE stats SET value = value + 1 WHERE name = 'deleted_bots';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stats_bots_purged
+            AFTER DELETE ON bots
+            WHEN OLD.deleted_at IS NOT NULL
+            BEGIN
+                UPDATE stats SET value = value - 1 WHERE name = 'deleted_bots';
+            END
+        ''')
+        seed_counter(cursor, "deleted_bots")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def soft_delete_bot(conn: sqlite3.Connection, bot_id: str) -> Optional[str]:
+    """
+    Marca o bot como excluído (escrita pequena, O(tags do bot)) e devolve o nome,
+    ou None se o bot não existe ou já foi excluído. Conversas e mensagens ficam para o purger.
+    """
+    cursor = conn.cursor()
+    bot = cursor.execute(
+        "SELECT name FROM bots WHERE id = ? AND deleted_at IS NULL", (bot_id,)
+    ).fetchone()
+    if not bot:
+        return None
+    cursor.execute(
+        "UPDATE bots SET deleted_at = CURRENT_TIMESTAMP WHERE id = ? AND deleted_at IS NULL", (bot_id,)
+    )
+    # Some das facetas e filtros por tag imediatamente
+    cursor.execute("DELETE FROM bot_tags WHERE bot_id = ?", (bot_id,))
+    conn.commit()
+    return bot[0]
+
+
+def delete_conversation_batch(cursor: sqlite3.Cursor, conversation_id: str, batch_size: int) -> Dict[str, int]:
+    """
+    Na transação do cursor: apaga até batch_size mensagens da conversa (as mais
+    antigas primeiro) e, quando ela fica vazia, a conversa com uso e arquivo.
+    """
+    cursor.execute('''
+        DELETE FROM messages WHERE id IN (
+            SELECT id FROM messages WHERE conversation_id = ? ORDER BY created_at LIMIT ?
+        )
+    ''', (conversation_id, batch_size))
+    done = {"messages": cursor.rowcount, "conversations": 0}
+    if done["messages"] < batch_size:
+        cursor.execute("DELETE FROM conversation_usage WHERE conversation_id = ?", (conversation_id,))
+        cursor.execute("DELETE FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
+        cursor.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        done["conversations"] = 1
+    return done
+
+
+def purge_batch(conn: sqlite3.Connection, bot_id: str, batch_size: int = PURGE_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Uma transação curta do purge: até batch_size mensagens de uma conversa do bot;
+    a conversa sai quando fica vazia e o bot sai quando não tem mais conversas.
+    """
+    done = {"messages": 0, "conversations": 0, "bots": 0}
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        conversation = cursor.execute(
+            "SELECT id FROM conversations WHERE bot_id = ? LIMIT 1", (bot_id,)
+        ).fetchone()
+        if conversation:
+            done.update(delete_conversation_batch(cursor, conversation[0], batch_size))
+        else:
+            # Arquivos órfãos (conversa já removida) e, por fim, o próprio bot
+            cursor.execute("DELETE FROM conversation_archive WHERE bot_id = ?", (bot_id,))
+            cursor.execute("DELETE FROM bots WHERE id = ? AND deleted_at IS NOT NULL", (bot_id,))
+            done["bots"] = cursor.rowcount
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    return done
+
+
+def purge_deleted_bots(conn: sqlite3.Connection, batch_size: int = PURGE_BATCH_SIZE,
+                       pause: float = PURGE_BATCH_PAUSE_SECONDS,
+                       should_stop: Callable[[], bool] = lambda: False) -> Dict[str, int]:
+    """Purga todos os bots marcados, lote a lote (cada lote é uma transação)."""
+    total = {"messages": 0, "conversations": 0, "bots": 0}
+    bot_ids = [row[0] for row in conn.execute("SELECT id FROM bots WHERE deleted_at IS NOT NULL")]
+    for bot_id in bot_ids:
+        while not should_stop():
+            done = purge_batch(conn, bot_id, batch_size)
+            for field, value in done.items():
+                total[field] += value
+            if done["bots"] or not any(done.values()):
+                break
+            if pause:
+                time.sleep(pause)
+    if total["bots"]:
+        logger.info(
+            "🧹 %s bots purgados (%s conversas, %s mensagens)",
+            total["bots"], total["conversations"], total["messages"]
+        )
+    return total
+
+
+class BotPurger:
+    """Thread em segundo plano que purga os bots excluídos; acorda logo após um DELETE."""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], interval: float = PURGE_INTERVAL_SECONDS,
+                 batch_size: int = PURGE_BATCH_SIZE):
+        self.connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def wake(self):
+        self._wake.set()
+
+    def run_once(self) -> Dict[str, int]:
+        conn = self.connect()
+        try:
+            return purge_deleted_bots(conn, self.batch_size, should_stop=self._stop.is_set)
+        finally:
+            conn.close()
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="bot-purger", daemon=True)
+        self._thread.start()
+        logger.info("🧹 Purger de bots iniciado (lotes de %s mensagens)", self.batch_size)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        # Primeira rodada logo no startup: retoma purges interrompidos por reinício
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("❌ Erro no purge de bots: %s", e)
+            self._wake.wait(self.interval)
@@ -0,0 +1,240 @@
+# services/rate_limiter.py
+
+import os
+import math
+import time
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+# Limites no formato "requisições/segundos" (ex.: "20/60" = 20 por minuto, com rajada de 20)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_PER_USER = os.getenv("RATE_LIMIT_PER_USER", "20/60")
+RATE_LIMIT_PER_BOT = os.getenv("RATE_LIMIT_PER_BOT", "60/60")
+RATE_LIMIT_GLOBAL = os.getenv("RATE_LIMIT_GLOBAL", "120/60")
+# Descarte de carga: rejeita cedo quando há trabalho demais acumulado
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "200"))
+ADMISSION_SHED_RETRY_AFTER = int(os.getenv("ADMISSION_SHED_RETRY_AFTER", "5"))
+# Quantidade máxima de buckets por usuário/bot mantidos em memória
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+# Proxies reversos (IPs ou redes, separados por vírgula) autorizados a informar o usuário
+# em X-User-Id / X-Forwarded-For; de qualquer outro cliente esses headers são ignorados
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+
+
+def parse_rate(raw: str) -> Tuple[float, float]:
+    """Converte '20/60' em (capacidade=20, recarga=20/60 tokens por segundo)"""
+    requests, _, seconds = raw.partition("/")
+    capacity = float(requests)
+    period = float(seconds or 1)
+    return capacity, capacity / period
+
+
+class RateLimitExceeded(Exception):
+    """Requisição rejeitada pelo controle de admissão (vira HTTP 429)."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated_at")
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos até haver um token disponível (0 se já houver)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.refill_rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.refill_rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class KeyedBuckets:
+    """Buckets por chave (usuário, bot), limitados em quantidade (LRU)."""
+
+    def __init__(self, rate: str, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.capacity, self.refill_rate = parse_rate(rate)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def get(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, self.refill_rate)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+
+class AdmissionController:
+    """
+    Controle de admissão para os endpoints de chat:
+    - descarte de carga por requisições em andamento e profundidade da fila;
+    - token buckets global, por bot e por usuário.
+    """
+
+    def __init__(self, user_rate: str = RATE_LIMIT_PER_USER, bot_rate: str = RATE_LIMIT_PER_BOT,
+                 global_rate: str = RATE_LIMIT_GLOBAL, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 max_queue_depth: int = ADMISSION_MAX_QUEUE_DEPTH,
+                 queue_depth_fn: Optional[Callable[[], int]] = None,
+                 enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.user_buckets = KeyedBuckets(user_rate)
+        self.bot_buckets = KeyedBuckets(bot_rate)
+        capacity, refill_rate = parse_rate(global_rate)
+        self.global_bucket = TokenBucket(capacity, refill_rate)
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        # Roda no event loop e sob o lock: precisa ser uma leitura em memória (JobQueue.depth), nunca SQL
+        self.queue_depth_fn = queue_depth_fn
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._last_queue_depth = 0
+
+    def _queue_depth(self) -> int:
+        if self.queue_depth_fn:
+            self._last_queue_depth = self.queue_depth_fn()
+        return self._last_queue_depth
+
+    def _check(self, user_id: Optional[str], bot_id: Optional[str]):
+        now = time.monotonic()
+
+        if self.in_flight >= self.max_in_flight:
+            raise RateLimitExceeded("Servidor sobrecarregado", ADMISSION_SHED_RETRY_AFTER)
+        if self.max_queue_depth and self._queue_depth() >= self.max_queue_depth:
+            raise RateLimitExceeded("Fila de geração cheia", ADMISSION_SHED_RETRY_AFTER)
+
+        buckets = [("global", self.global_bucket)]
+        if bot_id:
+            buckets.append(("bot", self.bot_buckets.get(bot_id)))
+        if user_id:
+            buckets.append(("usuário", self.user_buckets.get(user_id)))
+
+        # Só consome tokens se todos os limites permitirem
+        for scope, bucket in buckets:
+            wait = bucket.wait_time(now)
+            if wait > 0:
+                raise RateLimitExceeded(f"Limite de requisições por {scope} excedido", wait)
+        for _, bucket in buckets:
+            bucket.consume()
+
+    @contextmanager
+    def admit(self, user_id: Optional[str] = None, bot_id: Optional[str] = None):
+        """Admite a requisição ou levanta RateLimitExceeded; contabiliza requisições em andamento."""
+        if not self.enabled:
+            yield
+            return
+
+        with self._lock:
+            try:
+                self._check(user_id, bot_id)
+            except RateLimitExceeded as e:
+                self.rejected += 1
+                logger.warning("🚦 Requisição rejeitada (%s) usuário=%s bot=%s", e.reason, user_id, bot_id)
+                raise
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def get_status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self._last_queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "rejected": self.rejected,
+        }
+
+
+admission_controller = AdmissionController()
+
+
+def parse_trusted_proxies(raw: str) -> List[ipaddress._BaseNetwork]:
+    """Converte '10.0.0.0/8,127.0.0.1' nas redes correspondentes (entrada inválida é ignorada)."""
+    networks = []
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning("⚠️ Proxy confiável inválido em TRUSTED_PROXIES: %s", item)
+    return networks
+
+
+_trusted_proxies = parse_trusted_proxies(TRUSTED_PROXIES)
+
+
+def _is_trusted(host: Optional[str], trusted: List[ipaddress._BaseNetwork]) -> bool:
+    try:
+        address = ipaddress.ip_address((host or "").strip())
+    except ValueError:
+        return False
+    return any(address in network for network in trusted)
+
+
+def resolve_user_id(request: Request, trusted: Optional[List[ipaddress._BaseNetwork]] = None) -> str:
+    """
+    Identifica o usuário pelo IP do cliente. Só quando a conexão vem de um proxy
+    confiável valem X-User-Id e, na falta dele, o X-Forwarded-For (o último
+    endereço que não é de um proxy confiável: os da esquerda o cliente forja).
+    """
+    trusted = _trusted_proxies if trusted is None else trusted
+    peer = request.client.host if request.client else None
+    if not _is_trusted(peer, trusted):
+        return peer or "anonymous"
+    user_id = request.headers.get("X-User-Id")
+    if user_id:
+        return user_id
+    forwarded = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    for hop in reversed(forwarded):
+        if not _is_trusted(hop, trusted):
+            return hop
+    return forwarded[0] if forwarded else peer
+
+
+# Dependências FastAPI. São assíncronas de propósito: a rejeição roda no event loop
+# e não espera por uma thread livre do threadpool.
+async def admit_bot_chat(request: Request, bot_id: str):
+    with admission_controller.admit(user_id=resolve_user_id(request), bot_id=bot_id):
+        yield
+
+
+async def admit_request(request: Request):
+    with admission_controller.admit(user_id=resolve_user_id(request)):
+        yield
@@ -0,0 +1,265 @@
+# services/retention.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from services.purge import delete_conversation_batch
+
+logger = logging.getLogger(__name__)
+
+# Retenção de conversas abandonadas (o "Reiniciar Chat" do frontend cria uma
+# conversa nova a cada clique). Apaga dados: fica desligada até ser configurada
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+# Regras separadas por vírgula, "dias[:mensagens]": "7:3" apaga conversas com menos
+# de 3 mensagens paradas há 7 dias; "365" apaga qualquer conversa parada há um ano
+RETENTION_RULES = os.getenv("RETENTION_RULES", "7:3,365")
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+# Mensagens apagadas por transação e conversas lidas por consulta de candidatas
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "200"))
+RETENTION_SCAN_SIZE = int(os.getenv("RETENTION_SCAN_SIZE", "100"))
+# Pausa entre lotes: devolve o lock de escrita do SQLite para as requisições
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.05"))
+# Páginas devolvidas ao disco por passo de PRAGMA incremental_vacuum
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "500"))
+# Bancos até este tamanho migram para auto_vacuum=INCREMENTAL na janela de manutenção
+# (VACUUM completo, lock exclusivo); acima disso a conversão fica para o operador
+RETENTION_VACUUM_CONVERT_MAX_MB = float(os.getenv("RETENTION_VACUUM_CONVERT_MAX_MB", "256"))
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Última atividade da conversa: a última mensagem ou, sem mensagens, a criação
+_ACTIVITY = "COALESCE(last_message_at, created_at)"
+
+
+class RetentionRule(NamedTuple):
+    idle_days: float
+    # Só conversas com menos mensagens que isto (None = qualquer tamanho)
+    max_messages: Optional[int] = None
+
+    def describe(self) -> str:
+        if self.max_messages is None:
+            return f"paradas há {self.idle_days:g} dias"
+        return f"com menos de {self.max_messages} mensagens paradas há {self.idle_days:g} dias"
+
+
+def parse_rules(spec: str) -> List[RetentionRule]:
+    """Lê RETENTION_RULES ("7:3,365"); regra inválida é erro de configuração."""
+    rules = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        days, _, messages = item.partition(":")
+        try:
+            rule = RetentionRule(float(days), int(messages) if messages else None)
+        except ValueError:
+            raise ValueError(f"Regra de retenção inválida: {item!r} (use dias[:mensagens])")
+        if rule.idle_days <= 0 or (rule.max_messages is not None and rule.max_messages < 1):
+            raise ValueError(f"Regra de retenção inválida: {item!r}")
+        rules.append(rule)
+    return rules
+
+
+def install_retention(conn: sqlite3.Connection):
+    """Índice da última atividade: as candidatas saem em ordem, sem full scan."""
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_conversations_activity ON conversations ({_ACTIVITY}, id)")
+    conn.commit()
+
+
+def convert_to_incremental_vacuum(conn: sqlite3.Connection,
+                                  max_mb: float = RETENTION_VACUUM_CONVERT_MAX_MB) -> Dict[str, object]:
+    """
+    Troca o banco para auto_vacuum=INCREMENTAL, para o espaço das conversas
+    apagadas voltar ao disco em passos curtos. Exige um VACUUM completo (reescreve
+    o arquivo sob lock exclusivo), então roda na janela de manutenção e confere o
+    modo a cada vez: um banco grande demais hoje é convertido quando couber.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return {"incremental": True, "converted": False}
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    size_mb = page_count * page_size / (1024 * 1024)
+    if size_mb > max_mb:
+        logger.warning(
+            "⚠️ Banco de %.0f MB sem auto_vacuum incremental: o espaço liberado pela retenção só volta "
+            "ao disco depois de 'PRAGMA auto_vacuum = INCREMENTAL; VACUUM;' feito pelo operador",
+            size_mb
+        )
+        return {"incremental": False, "converted": False, "size_mb": round(size_mb, 1)}
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    logger.info("🧽 auto_vacuum incremental ativado (VACUUM de %.1f MB)", size_mb)
+    return {"incremental": True, "converted": True, "size_mb": round(size_mb, 1)}
+
+
+def _rule_filter(rule: RetentionRule) -> str:
+    """Condição da regra sobre a linha de conversations (os parâmetros vêm de _rule_params)."""
+    condition = f"{_ACTIVITY} < datetime('now', ?)"
+    if rule.max_messages is not None:
+        # Conta no máximo max_messages mensagens (conversa arquivada: o total do arquivo)
+        condition += '''
+            AND (CASE WHEN archived_at IS NULL
+                 THEN (SELECT COUNT(*) FROM (SELECT 1 FROM messages WHERE conversation_id = conversations.id LIMIT ?))
+                 ELSE (SELECT COALESCE(MAX(message_count), 0) FROM conversation_archive WHERE conversation_id = conversations.id)
+                 END) < ?'''
+    return condition
+
+
+def _rule_params(rule: RetentionRule) -> tuple:
+    params = (f"-{rule.idle_days} days",)
+    if rule.max_messages is not None:
+        params += (rule.max_messages, rule.max_messages)
+    return params
+
+
+def find_expired_conversations(conn: sqlite3.Connection, rule: RetentionRule, limit: int = RETENTION_SCAN_SIZE,
+                               after: Optional[tuple] = None) -> List[tuple]:
+    """
+    Próximas conversas que a regra apaga, da menos recente para a mais recente:
+    (id, última atividade). after = última linha da página anterior (keyset), então
+    as conversas longas que a regra poupa são lidas uma vez por rodada.
+    """
+    sql = f"SELECT id, {_ACTIVITY} FROM conversations WHERE {_rule_filter(rule)}"
+    params = _rule_params(rule)
+    if after is not None:
+        # O >= explícito dá ao índice o ponto de partida; a comparação de tuplas desempata pelo id
+        sql += f" AND {_ACTIVITY} >= ? AND ({_ACTIVITY}, id) > (?, ?)"
+        params += (after[1], after[1], after[0])
+    sql += f" ORDER BY {_ACTIVITY}, id LIMIT ?"
+    return [tuple(row) for row in conn.execute(sql, params + (limit,)).fetchall()]
+
+
+def delete_expired_conversation(conn: sqlite3.Connection, conversation_id: str, rule: RetentionRule,
+                                batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_BATCH_PAUSE_SECONDS,
+                                should_stop: Callable[[], bool] = lambda: False) -> Dict[str, int]:
+    """
+    Apaga a conversa em transações curtas de até batch_size mensagens. A regra é
+    reavaliada sob o lock de escrita a cada lote: se chegar uma mensagem nova no
+    meio, a exclusão para (só as mensagens mais antigas já saíram).
+    """
+    total = {"messages": 0, "conversations": 0}
+    cursor = conn.cursor()
+    while not should_stop():
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            expired = cursor.execute(
+                f"SELECT 1 FROM conversations WHERE id = ? AND {_rule_filter(rule)}",
+                (conversation_id,) + _rule_params(rule)
+            ).fetchone()
+            if not expired:
+                cursor.execute("ROLLBACK")
+                break
+            done = delete_conversation_batch(cursor, conversation_id, batch_size)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        total["messages"] += done["messages"]
+        total["conversations"] += done["conversations"]
+        if done["conversations"]:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def reclaim_space(conn: sqlite3.Connection, pages: int = RETENTION_VACUUM_PAGES,
+                  pause: float = RETENTION_BATCH_PAUSE_SECONDS,
+                  should_stop: Callable[[], bool] = lambda: False) -> int:
+    """Devolve as páginas livres ao disco em passos de incremental_vacuum; retorna quantas."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        return 0
+    freed = 0
+    while not should_stop():
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            break
+        # Cada passo da pragma libera uma página: fetchall executa todos os passos
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        freed += min(free, pages)
+        if pause:
+            time.sleep(pause)
+    return freed
+
+
+def apply_retention(conn: sqlite3.Connection, rules: List[RetentionRule],
+                    batch_size: int = RETENTION_BATCH_SIZE, scan_size: int = RETENTION_SCAN_SIZE,
+                    pause: float = RETENTION_BATCH_PAUSE_SECONDS,
+                    on_delete: Optional[Callable[[str], None]] = None,
+                    should_stop: Callable[[], bool] = lambda: False) -> Dict[str, int]:
+    """Aplica todas as regras, página a página, e depois devolve o espaço liberado."""
+    total = {"conversations": 0, "messages": 0, "pages_freed": 0}
+    for rule in rules:
+        after = None
+        while not should_stop():
+            candidates = find_expired_conversations(conn, rule, scan_size, after)
+            for conversation_id, _ in candidates:
+                done = delete_expired_conversation(conn, conversation_id, rule, batch_size, pause, should_stop)
+                total["messages"] += done["messages"]
+                total["conversations"] += done["conversations"]
+                if done["conversations"] and on_delete:
+                    on_delete(conversation_id)
+            if len(candidates) < scan_size:
+                break
+            after = candidates[-1]
+
+    if total["conversations"]:
+        total["pages_freed"] = reclaim_space(conn, pause=pause, should_stop=should_stop)
+        logger.info(
+            "🧹 Retenção: %s conversas apagadas (%s mensagens, %s páginas devolvidas ao disco)",
+            total["conversations"], total["messages"], total["pages_freed"]
+        )
+    return total
+
+
+class RetentionPurger:
+    """Thread em segundo plano que aplica as regras de retenção a cada intervalo."""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], rules: Optional[List[RetentionRule]] = None,
+                 interval: float = RETENTION_INTERVAL_SECONDS, batch_size: int = RETENTION_BATCH_SIZE,
+                 on_delete: Optional[Callable[[str], None]] = None):
+        self.connect = connect
+        self.rules = parse_rules(RETENTION_RULES) if rules is None else rules
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_delete = on_delete
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, int]:
+        conn = self.connect()
+        try:
+            return apply_retention(conn, self.rules, self.batch_size, on_delete=self.on_delete,
+                                   should_stop=self._stop.is_set)
+        finally:
+            conn.close()
+
+    def start(self):
+        if self._thread or not self.rules:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="retention-purger", daemon=True)
+        self._thread.start()
+        logger.info(
+            "🧹 Retenção iniciada (a cada %ss): conversas %s",
+            self.interval, "; ".join(rule.describe() for rule in self.rules)
+        )
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        # Primeira rodada logo no startup, depois a cada intervalo
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("❌ Erro na retenção de conversas: %s", e)
+            self._stop.wait(self.interval)
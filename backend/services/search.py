@@ -0,0 +1,191 @@
+# services/search.py
+
+import re
+import json
+import sqlite3
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pesos do bm25 por coluna de bots_fts: nome > tags > introdução > personalidade
+BOT_COLUMN_WEIGHTS = (10.0, 2.0, 1.0, 5.0)
+# Termos de busca aceitos por consulta (o resto é ignorado)
+SEARCH_MAX_TERMS = 8
+SEARCH_MAX_LIMIT = 50
+
+# remove_diacritics: "pocao" encontra "poção"
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _table_exists(cursor: sqlite3.Cursor, name: str) -> bool:
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def _sync_triggers(table: str, fts: str, columns: List[str]) -> List[str]:
+    """Triggers que mantêm um índice FTS5 de conteúdo externo igual à tabela de origem."""
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    old_values = ", ".join(f"OLD.{column}" for column in columns)
+    insert = f"INSERT INTO {fts} (rowid, {cols}) VALUES (NEW.rowid, {new_values});"
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', OLD.rowid, {old_values});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON {table} BEGIN {delete} {insert} END",
+    ]
+
+
+def install_search(conn: sqlite3.Connection) -> bool:
+    """
+    Cria os índices FTS5 de bots (nome, introdução, personalidade, tags) e de
+    mensagens, com triggers de sincronização. Na primeira vez reconstrói o índice
+    a partir das tabelas. Devolve False quando o SQLite não tem FTS5.
+    """
+    if not fts5_available(conn):
+        logger.warning("⚠️ SQLite sem FTS5: /search indisponível")
+        return False
+
+    indexes = {
+        "bots_fts": ("bots", ["name", "introduction", "personality", "tags"]),
+        "messages_fts": ("messages", ["content"]),
+    }
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for fts, (table, columns) in indexes.items():
+            created = not _table_exists(cursor, fts)
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"{', '.join(columns)}, content='{table}', content_rowid='rowid', tokenize='{FTS_TOKENIZER}')"
+            )
+            for trigger in _sync_triggers(table, fts, columns):
+                cursor.execute(trigger)
+            if created:
+                cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+                logger.info("🔎 Índice %s construído", fts)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    return True
+
+
+def search_index_ready(conn: sqlite3.Connection) -> bool:
+    """Os índices FTS5 foram criados (a migração pula a busca quando o SQLite não tem FTS5)."""
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE name IN ('bots_fts', 'messages_fts')").fetchall()
+    return len(rows) == 2
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """
+    Converte o texto do usuário numa consulta FTS5 segura: cada palavra vira um
+    termo entre aspas (sem operadores do usuário) e a última aceita prefixo.
+    """
+    terms = _WORD_RE.findall(text or "")[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _page(rows: List[sqlite3.Row], limit: int) -> Dict[str, Any]:
+    # Busca limit + 1 linhas: sabe se há próxima página sem contar todos os resultados
+    return {"has_more": len(rows) > limit, "rows": rows[:limit]}
+
+
+def _bot_hit(row: sqlite3.Row) -> Dict[str, Any]:
+    # Mesmo formato do GET /bots (o cliente monta o card sem outra requisição)
+    bot = dict(row)
+    bot["tags"] = json.loads(bot["tags"])
+    bot["ai_config"] = json.loads(bot["ai_config"])
+    bot["score"] = round(-bot["score"], 4)
+    return bot
+
+
+def search_bots(cursor: sqlite3.Cursor, match: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    weights = ", ".join(str(weight) for weight in BOT_COLUMN_WEIGHTS)
+    rows = cursor.execute(f'''
+        SELECT b.*, bm25(bots_fts, {weights}) AS score
+        FROM bots_fts
+        JOIN bots b ON b.rowid = bots_fts.rowid
+        WHERE bots_fts MATCH ? AND b.deleted_at IS NULL
+        ORDER BY score
+        LIMIT ? OFFSET ?
+    ''', (match, limit + 1, offset)).fetchall()
+    page = _page(rows, limit)
+    return {
+        "has_more": page["has_more"],
+        "items": [_bot_hit(row) for row in page["rows"]],
+    }
+
+
+def search_messages(cursor: sqlite3.Cursor, match: str, conversation_id: str, limit: int = 20, offset: int = 0,
+                    bot_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Busca nas mensagens de uma conversa quente (as arquivadas voltam ao índice ao
+    serem reidratadas). O escopo é obrigatório: conversas não têm dono, então quem
+    conhece o id da conversa é quem pode lê-la; uma busca global entregaria trechos
+    e ids das conversas de todo mundo. Bots removidos (soft delete) ficam de fora.
+    """
+    query = '''
+        SELECT m.id, m.conversation_id, m.is_user, m.created_at, c.bot_id,
+               snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet,
+               bm25(messages_fts) AS score
+        FROM messages_fts
+        JOIN messages m ON m.rowid = messages_fts.rowid
+        JOIN conversations c ON c.id = m.conversation_id
+        JOIN bots b ON b.id = c.bot_id
+        WHERE messages_fts MATCH ? AND m.conversation_id = ? AND b.deleted_at IS NULL
+    '''
+    params: List[Any] = [match, conversation_id]
+    if bot_id:
+        query += " AND c.bot_id = ?"
+        params.append(bot_id)
+    query += " ORDER BY score LIMIT ? OFFSET ?"
+    params += [limit + 1, offset]
+
+    page = _page(cursor.execute(query, params).fetchall(), limit)
+    return {
+        "has_more": page["has_more"],
+        "items": [
+            {
+                "message_id": row["id"],
+                "conversation_id": row["conversation_id"],
+                "bot_id": row["bot_id"],
+                "is_user": bool(row["is_user"]),
+                "created_at": row["created_at"],
+                "snippet": row["snippet"],
+                "score": round(-row["score"], 4),
+            }
+            for row in page["rows"]
+        ],
+    }
+
+
+def run_search(cursor: sqlite3.Cursor, match: str, search_type: str = "all", limit: int = 20, offset: int = 0,
+               bot_id: Optional[str] = None, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Resultado do GET /search. Mensagens só entram com conversation_id: sem escopo,
+    "all" significa apenas bots e "messages" é recusado (ValueError).
+    """
+    if search_type == "messages" and not conversation_id:
+        raise ValueError("Busca em mensagens exige conversation_id")
+    result: Dict[str, Any] = {}
+    if search_type in ("all", "bots"):
+        result["bots"] = search_bots(cursor, match, limit, offset)
+    if search_type in ("all", "messages") and conversation_id:
+        result["messages"] = search_messages(cursor, match, conversation_id, limit, offset, bot_id)
+    return result
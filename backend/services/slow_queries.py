@@ -0,0 +1,201 @@
+# services/slow_queries.py
+
+import os
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from services.db_instrumentation import statement_family
+
+logger = logging.getLogger(__name__)
+
+# Comandos acima deste tempo entram no log de queries lentas
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+# Captura o plano (EXPLAIN QUERY PLAN / EXPLAIN) na primeira ocorrência de cada comando
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+# Comandos distintos mantidos no ranking do /debug/slow-queries
+SLOW_QUERY_MAX_STATEMENTS = int(os.getenv("SLOW_QUERY_MAX_STATEMENTS", "200"))
+
+# explain(sql, parametros) -> linhas do plano
+Explainer = Callable[[str, Any], List[str]]
+
+# Só estes comandos têm plano; COMMIT lento (espera de lock) entra sem plano
+_EXPLAINABLE = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE"}
+
+
+def parameter_shape(parameters: Any) -> Any:
+    """Tipos (e tamanho dos textos) dos parâmetros, sem os valores: o log não vaza conteúdo."""
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if len(parameters) > 20:
+            return [shape(value) for value in parameters[:20]] + [f"... +{len(parameters) - 20}"]
+        return [shape(value) for value in parameters]
+    return shape(parameters)
+
+
+def explain_query(conn: Any, dialect: str, sql: str, parameters: Any) -> List[str]:
+    """Plano de execução de um comando (não executa o comando em nenhum dos dialetos)."""
+    cursor = conn.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters or ())
+            return [row[3] for row in cursor.fetchall()]
+        if parameters:
+            cursor.execute("EXPLAIN " + sql, parameters)
+        else:
+            cursor.execute("EXPLAIN " + sql)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def explainer_for(connect: Callable[[], Any], dialect: str) -> Explainer:
+    """Explainer que abre uma conexão própria: a da requisição pode estar no meio de uma transação."""
+    def explain(sql: str, parameters: Any) -> List[str]:
+        conn = connect()
+        try:
+            return explain_query(conn, dialect, sql, parameters)
+        finally:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            conn.close()
+    return explain
+
+
+class SlowQueryLog:
+    """
+    Ranking dos comandos lentos (agregados pelo SQL normalizado) com o formato
+    dos parâmetros e o plano de execução. O EXPLAIN roda em uma thread própria:
+    a requisição que disparou a query lenta não paga por ele.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+                 max_statements: int = SLOW_QUERY_MAX_STATEMENTS, explain: bool = SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.max_statements = max_statements
+        self.explain = explain
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._plans: "queue.Queue" = queue.Queue(maxsize=100)
+        self._worker: Optional[threading.Thread] = None
+
+    def observe(self, sql: str, parameters: Any, duration: float, explainer: Optional[Explainer] = None):
+        elapsed_ms = duration * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+        statement = " ".join(sql.split())
+        verb = statement.split(" ", 1)[0].upper() if statement else ""
+        if verb == "EXPLAIN":
+            return
+        shape = parameter_shape(parameters)
+
+        with self._lock:
+            entry = self._entries.get(statement)
+            if entry is None:
+                if len(self._entries) >= self.max_statements:
+                    # Sai o comando com menor tempo acumulado
+                    weakest = min(self._entries, key=lambda key: self._entries[key]["total_ms"])
+                    del self._entries[weakest]
+                entry = self._entries[statement] = {
+                    "statement": statement,
+                    "family": statement_family(statement),
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "parameters": shape,
+                    "plan": None,
+                    "plan_error": None,
+                }
+                # Sem os valores dos placeholders o EXPLAIN falharia ("Incorrect number of bindings")
+                wants_plan = (self.explain and explainer is not None and verb in _EXPLAINABLE
+                              and not (parameters is None and "?" in statement))
+            else:
+                wants_plan = False
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["last_seen"] = time.time()
+            plan = entry["plan"]
+
+        if wants_plan:
+            # O log sai junto com o plano, quando a thread de EXPLAIN terminar
+            self._enqueue_plan(statement, sql, parameters, elapsed_ms, explainer)
+            return
+        logger.warning(
+            "🐢 Query lenta (%.1f ms): %s | parâmetros %s%s",
+            elapsed_ms, statement[:500], shape, f" | plano: {' / '.join(plan)}" if plan else ""
+        )
+
+    def _enqueue_plan(self, statement: str, sql: str, parameters: Any, elapsed_ms: float, explainer: Explainer):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._plan_loop, name="slow-query-explain", daemon=True)
+                self._worker.start()
+        try:
+            self._plans.put_nowait((statement, sql, parameters, elapsed_ms, explainer))
+        except queue.Full:
+            logger.warning("🐢 Query lenta (%.1f ms): %s (fila de EXPLAIN cheia)", elapsed_ms, statement[:500])
+
+    def _plan_loop(self):
+        while True:
+            statement, sql, parameters, elapsed_ms, explainer = self._plans.get()
+            plan, error = None, None
+            try:
+                plan = explainer(sql, parameters)
+            except Exception as e:
+                error = str(e)
+            try:
+                with self._lock:
+                    entry = self._entries.get(statement)
+                    if entry is not None:
+                        entry["plan"], entry["plan_error"] = plan, error
+                    shape = entry["parameters"] if entry else parameter_shape(parameters)
+                logger.warning(
+                    "🐢 Query lenta (%.1f ms): %s | parâmetros %s | plano: %s",
+                    elapsed_ms, statement[:500], shape, " / ".join(plan) if plan else f"indisponível ({error})"
+                )
+            finally:
+                self._plans.task_done()
+
+    def flush(self, timeout: float = 5.0):
+        """Espera os EXPLAINs pendentes (testes e shutdown)."""
+        deadline = time.monotonic() + timeout
+        while self._plans.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def top(self, limit: int = 20, order: str = "total") -> List[Dict[str, Any]]:
+        key = {"total": "total_ms", "max": "max_ms", "count": "count"}[order]
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry[key], reverse=True)[:limit]
+            return [
+                dict(entry, total_ms=round(entry["total_ms"], 1), max_ms=round(entry["max_ms"], 1),
+                     avg_ms=round(entry["total_ms"] / entry["count"], 1))
+                for entry in entries
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+SLOW_QUERY_ORDERS = ("total", "max", "count")
+
+slow_query_log = SlowQueryLog()
+
+
+def slow_query_observer(explainer: Optional[Explainer]) -> Callable[[str, Any, float], None]:
+    """Observador para db_instrumentation.add_query_observer com o explainer da conexão."""
+    def observe(sql: str, parameters: Any, duration: float):
+        slow_query_log.observe(sql, parameters, duration, explainer)
+    return observe
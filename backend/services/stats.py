@@ -0,0 +1,113 @@
+# services/stats.py
+
+import sqlite3
+import logging
+from typing import Dict
+
+from services.db_backend import dialect_of
+
+logger = logging.getLogger(__name__)
+
+# Tabelas contadas; cada uma ganha um par de triggers (INSERT/DELETE)
+STATS_TABLES = ("bots", "conversations", "messages")
+
+# Contadores mantidos por triggers de outros módulos (nome -> SELECT que os recalcula)
+_extra_counters: Dict[str, str] = {}
+
+
+def _trigger_sql(table: str, event: str, delta: str) -> str:
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS stats_{table}_{event.lower()}
+        AFTER {event} ON {table}
+        BEGIN
+            UPDATE stats SET value = value {delta} 1 WHERE name = '{table}';
+        END
+    '''
+
+
+def register_counter(name: str, count_sql: str):
+    """Registra um contador extra (os triggers ficam a cargo de quem registra) no recount_stats."""
+    _extra_counters[name] = count_sql
+
+
+def seed_counter(cursor: sqlite3.Cursor, name: str):
+    """Grava o valor inicial de um contador registrado (só na primeira vez)."""
+    cursor.execute(f"INSERT OR IGNORE INTO stats (name, value) SELECT ?, ({_extra_counters[name]})", (name,))
+
+
+def install_stats(conn: sqlite3.Connection):
+    """
+    Cria a tabela stats e os triggers que a mantêm.
+    Na primeira vez em um banco já populado faz uma contagem inicial (COUNT(*));
+    depois disso os contadores só mudam pelos triggers, na mesma transação da escrita.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        for table in STATS_TABLES:
+            cursor.execute(_trigger_sql(table, "INSERT", "+"))
+            cursor.execute(_trigger_sql(table, "DELETE", "-"))
+            # Triggers e contagem na mesma transação: nenhuma escrita fica de fora
+            cursor.execute(f"INSERT OR IGNORE INTO stats (name, value) SELECT '{table}', COUNT(*) FROM {table}")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def _postgres_stats(conn) -> Dict[str, int]:
+    """
+    No Postgres não há triggers de contagem: uma linha de stats por tabela
+    viraria ponto de contenção entre todas as transações que inserem mensagens.
+    Usa a estimativa do planner (pg_class.reltuples, atualizada pelo autovacuum).
+    """
+    stats = {table: 0 for table in STATS_TABLES}
+    rows = conn.execute(
+        "SELECT relname, reltuples FROM pg_class WHERE oid IN (" + ", ".join(["to_regclass(?)"] * len(STATS_TABLES)) + ")",
+        STATS_TABLES
+    ).fetchall()
+    for row in rows:
+        stats[row[0]] = max(0, int(row[1]))
+    # Poucos bots marcados: o índice parcial idx_bots_deleted torna a contagem exata barata
+    stats["deleted_bots"] = conn.execute("SELECT COUNT(*) FROM bots WHERE deleted_at IS NOT NULL").fetchone()[0]
+    return stats
+
+
+def read_stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Lê os contadores (O(1), independente do tamanho das tabelas)."""
+    if dialect_of(conn) == "postgres":
+        return _postgres_stats(conn)
+    rows = conn.execute("SELECT name, value FROM stats").fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def recount_stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Recalcula os contadores do zero (reparo; faz full scan das tabelas)."""
+    if dialect_of(conn) == "postgres":
+        # Refaz as estimativas do planner em vez de contar linha a linha
+        conn.execute(f"ANALYZE {', '.join(STATS_TABLES)}")
+        conn.commit()
+        return read_stats(conn)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for table in STATS_TABLES:
+            cursor.execute(f"INSERT OR REPLACE INTO stats (name, value) SELECT '{table}', COUNT(*) FROM {table}")
+        for name, count_sql in _extra_counters.items():
+            try:
+                cursor.execute(f"INSERT OR REPLACE INTO stats (name, value) SELECT ?, ({count_sql})", (name,))
+            except sqlite3.OperationalError:
+                # Registrado por outro banco deste processo (a tabela não existe aqui)
+                continue
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    logger.info("🔢 Estatísticas recalculadas")
+    return read_stats(conn)
@@ -0,0 +1,136 @@
+# services/tags.py
+
+import sqlite3
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TAG_MATCH_MODES = ("all", "any")
+TAG_FACET_LIMIT = 100
+
+# Tags normalizadas (minúsculas, sem espaços nas pontas) a partir do JSON de bots.tags;
+# JSON inválido vira lista vazia em vez de quebrar o INSERT do bot
+_TAGS_FROM_JSON = '''
+    SELECT DISTINCT {bot}.id, lower(trim(value))
+    FROM {source}json_each(CASE WHEN json_valid({bot}.tags) THEN {bot}.tags ELSE '[]' END)
+    WHERE type = 'text' AND trim(value) != ''
+'''
+
+
+def normalize_tags(tags: Optional[List[str]]) -> List[str]:
+    seen = []
+    for tag in tags or []:
+        tag = tag.strip().lower()
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def install_tags(conn: sqlite3.Connection):
+    """
+    Cria bot_tags (índice normalizado de bots.tags) e os triggers que o mantêm
+    em criação, importação, atualização e exclusão de bots. Na primeira vez
+    preenche a partir dos bots existentes.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        created = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bot_tags'"
+        ).fetchone() is None
+        # PK (tag, bot_id): filtro por tag e facetas leem só o índice
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bot_tags (
+                tag TEXT NOT NULL,
+                bot_id TEXT NOT NULL,
+                PRIMARY KEY (tag, bot_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bot_tags_bot ON bot_tags (bot_id)")
+
+        insert_new = "INSERT OR IGNORE INTO bot_tags (bot_id, tag) " + _TAGS_FROM_JSON.format(bot="NEW", source="") + ";"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS bot_tags_insert AFTER INSERT ON bots
+            BEGIN {insert_new} END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS bot_tags_delete AFTER DELETE ON bots
+            BEGIN DELETE FROM bot_tags WHERE bot_id = OLD.id; END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS bot_tags_update AFTER UPDATE OF id, tags ON bots
+            BEGIN
+                DELETE FROM bot_tags WHERE bot_id = OLD.id;
+                {insert_new}
+            END
+        ''')
+
+        if created:
+            cursor.execute(
+                "INSERT OR IGNORE INTO bot_tags (bot_id, tag) "
+                + _TAGS_FROM_JSON.format(bot="bots", source="bots, ")
+            )
+            logger.info("🏷️ Índice de tags preenchido com os bots existentes")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def _tag_filter(tags: List[str], match: str) -> Tuple[str, List[Any]]:
+    """Subconsulta com os ids dos bots que têm todas (all) ou alguma (any) das tags."""
+    placeholders = ", ".join("?" * len(tags))
+    query = f"SELECT bot_id FROM bot_tags WHERE tag IN ({placeholders})"
+    params: List[Any] = list(tags)
+    # GROUP BY também deduplica os bots no modo any
+    query += " GROUP BY bot_id"
+    if match == "all" and len(tags) > 1:
+        query += " HAVING COUNT(*) = ?"
+        params.append(len(tags))
+    return query, params
+
+
+def filtered_bots_query(tags: Optional[List[str]], match: str = "all",
+                        limit: Optional[int] = None, offset: int = 0) -> Tuple[str, List[Any]]:
+    """SQL de listagem de bots filtrada por tags (mesma ordem do GET /bots)."""
+    query = "SELECT * FROM bots WHERE deleted_at IS NULL"
+    params: List[Any] = []
+    tags = normalize_tags(tags)
+    if tags:
+        subquery, params = _tag_filter(tags, match)
+        query += f" AND id IN ({subquery})"
+    query += " ORDER BY created_at DESC"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    return query, params
+
+
+def tag_facets(cursor: sqlite3.Cursor, tags: Optional[List[str]] = None, match: str = "all",
+               limit: int = TAG_FACET_LIMIT) -> Dict[str, Any]:
+    """
+    Contagem de bots por tag. Com filtro, as contagens são dentro do conjunto
+    filtrado (quantos bots restariam ao adicionar cada tag).
+    """
+    tags = normalize_tags(tags)
+    if tags:
+        subquery, params = _tag_filter(tags, match)
+        total = cursor.execute(f"SELECT COUNT(*) FROM ({subquery}) AS matching", params).fetchone()[0]
+        rows = cursor.execute(f'''
+            SELECT tag, COUNT(*) AS count FROM bot_tags
+            WHERE bot_id IN ({subquery})
+            GROUP BY tag ORDER BY count DESC, tag LIMIT ?
+        ''', params + [limit]).fetchall()
+    else:
+        total = cursor.execute("SELECT COUNT(*) FROM bots WHERE deleted_at IS NULL").fetchone()[0]
+        rows = cursor.execute('''
+            SELECT tag, COUNT(*) AS count FROM bot_tags
+            GROUP BY tag ORDER BY count DESC, tag LIMIT ?
+        ''', (limit,)).fetchall()
+
+    return {
+        "filter": {"tags": tags, "match": match},
+        "total_bots": total,
+        "tags": [{"tag": row[0], "count": row[1]} for row in rows],
+    }
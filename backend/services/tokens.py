@@ -0,0 +1,157 @@
+# services/tokens.py
+
+import re
+import math
+import sqlite3
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Caracteres por token de cada família de modelo (pedaço do nome -> média dos
+# tokenizadores BPE em texto PT/EN); o resto usa DEFAULT_CHARS_PER_TOKEN
+TOKENIZER_FAMILIES = (
+    ("gpt", 4.0),
+    ("claude", 3.5),
+    ("gemini", 4.0),
+    ("llama", 3.8),
+    ("mistral", 3.6),
+    ("qwen", 3.4),
+    ("deepseek", 3.4),
+)
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+TOKEN_BACKFILL_BATCH_SIZE = 1000
+
+# Palavras e sinais: cada pedaço vira ao menos um token, palavras longas viram vários
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=256)
+def chars_per_token(model: Optional[str]) -> float:
+    name = (model or "").lower()
+    for family, ratio in TOKENIZER_FAMILIES:
+        if family in name:
+            return ratio
+    return DEFAULT_CHARS_PER_TOKEN
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Contagem aproximada de tokens (sem carregar tokenizador), calculada uma vez na gravação."""
+    ratio = chars_per_token(model)
+    return sum(math.ceil(len(piece) / ratio) for piece in _PIECES.findall(text or ""))
+
+
+def install_token_counts(conn: sqlite3.Connection):
+    """
+    Adiciona messages.token_count e conversations.token_total (soma mantida por
+    triggers, inclusive quando o arquivo ou o purge removem mensagens) e
+    calcula a contagem das mensagens já existentes.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(messages)")}
+        if "token_count" not in columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(conversations)")}
+        if "token_total" not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN token_total INTEGER NOT NULL DEFAULT 0")
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversations_token_total_insert
+            AFTER INSERT ON messages WHEN NEW.token_count IS NOT NULL
+            BEGIN
+                UPDATE conversations SET token_total = token_total + NEW.token_count WHERE id = NEW.conversation_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversations_token_total_delete
+            AFTER DELETE ON messages WHEN OLD.token_count IS NOT NULL
+            BEGIN
+                UPDATE conversations SET token_total = token_total - OLD.token_count WHERE id = OLD.conversation_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS conversations_token_total_update
+            AFTER UPDATE OF token_count ON messages
+            BEGIN
+                UPDATE conversations
+                SET token_total = token_total + COALESCE(NEW.token_count, 0) - COALESCE(OLD.token_count, 0)
+                WHERE id = NEW.conversation_id;
+            END
+        ''')
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    backfill_token_counts(conn)
+
+
+def backfill_token_counts(conn: sqlite3.Connection, batch_size: int = TOKEN_BACKFILL_BATCH_SIZE) -> int:
+    """Conta os tokens das mensagens antigas em lotes (cada lote é uma transação curta)."""
+    total = 0
+    last_id = ""
+    while True:
+        # Paginação pela chave primária: cada lote lê só as próximas linhas
+        rows = conn.execute(
+            "SELECT id, content, model, token_count FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        pending = [(count_tokens(row[1], row[2]), row[0]) for row in rows if row[3] is None]
+        if pending:
+            conn.executemany("UPDATE messages SET token_count = ? WHERE id = ?", pending)
+            conn.commit()
+            total += len(pending)
+    if total:
+        logger.info("🔢 Tokens contados em %s mensagens existentes", total)
+    return total
+
+
+def conversation_token_window(cursor: sqlite3.Cursor, conversation_id: str,
+                              max_tokens: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Tamanho da conversa em tokens (lido da linha da conversa) e, com max_tokens,
+    quantas das mensagens mais recentes cabem nesse orçamento.
+    """
+    row = cursor.execute("SELECT token_total FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+    if not row:
+        return None
+    window: Dict[str, Any] = {"conversation_id": conversation_id, "token_total": row[0]}
+    if max_tokens is not None:
+        recent = recent_messages_within(cursor, conversation_id, max_tokens)
+        window["budget"] = {
+            "max_tokens": max_tokens,
+            "messages": len(recent),
+            "tokens": sum(message["tokens"] for message in recent),
+        }
+    return window
+
+
+def recent_messages_within(cursor: sqlite3.Cursor, conversation_id: str, max_tokens: int,
+                           limit: int = 200) -> List[Dict[str, Any]]:
+    """
+    Mensagens mais recentes (em ordem cronológica) cuja soma de token_count cabe em
+    max_tokens. A soma acumulada é calculada pelo banco lendo o índice de trás para
+    frente; o texto das mensagens não é reprocessado.
+    """
+    rows = cursor.execute('''
+        SELECT content, is_user, tokens, running FROM (
+            SELECT content, is_user, COALESCE(token_count, 0) AS tokens,
+                   SUM(COALESCE(token_count, 0)) OVER (ORDER BY created_at DESC ROWS UNBOUNDED PRECEDING) AS running
+            FROM messages
+            WHERE conversation_id = ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        ) AS recent
+        WHERE running <= ?
+        ORDER BY running
+    ''', (conversation_id, limit, max_tokens)).fetchall()
+    return [
+        {"role": "user" if row[1] else "assistant", "content": row[0], "tokens": row[2]}
+        for row in reversed(rows)
+    ]
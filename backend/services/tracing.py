@@ -0,0 +1,304 @@
+# services/tracing.py
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import secrets
+import logging
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from services.db_instrumentation import statement_family
+
+logger = logging.getLogger(__name__)
+
+# Configurações de tracing
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+# "console" (stdout) ou "file" (TRACING_FILE, uma linha JSON por span)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+# "auto" usa o SDK do OpenTelemetry se estiver instalado; "builtin" força o tracer interno
+TRACING_BACKEND = os.getenv("TRACING_BACKEND", "auto").lower()
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "cringe-api")
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.trace import Status, StatusCode
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+
+class _NoopSpan:
+    """Span usado quando o tracing está desligado: custo praticamente zero."""
+
+    __slots__ = ()
+
+    def update_name(self, name: str):
+        pass
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+    def set_error(self, description: str):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+# ----------------------------------------------------------------------
+# Tracer interno (formato compatível com os campos do OpenTelemetry)
+# ----------------------------------------------------------------------
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "events")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any],
+                 start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.status = "UNSET"
+        self.events = []
+
+    def update_name(self, name: str):
+        self.name = name
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        self.events.append({
+            "name": "exception",
+            "timestamp": time.time_ns(),
+            "attributes": {"exception.type": type(exc).__name__, "exception.message": str(exc)},
+        })
+
+    def set_error(self, description: str):
+        self.status = "ERROR"
+        self.attributes["error.description"] = description
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "context": {"trace_id": self.trace_id, "span_id": self.span_id},
+            "parent_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+class _SpanExporter:
+    """Escreve os spans finalizados em uma thread separada (não bloqueia a requisição)."""
+
+    def __init__(self, exporter: str, path: str):
+        self.exporter = exporter
+        self.path = path
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        out = sys.stdout if self.exporter == "console" else open(self.path, "a", encoding="utf-8")
+        try:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    break
+                out.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                if self._queue.empty():
+                    out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    def shutdown(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=2)
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_exporter: Optional[_SpanExporter] = None
+_otel_tracer = None
+_backend = "disabled"
+
+
+def configure_tracing(enabled: bool = TRACING_ENABLED, exporter: str = TRACING_EXPORTER,
+                      path: str = TRACING_FILE, backend: str = TRACING_BACKEND):
+    """Liga o tracing com o SDK do OpenTelemetry (se disponível) ou com o tracer interno."""
+    global _exporter, _otel_tracer, _backend
+    if not enabled:
+        _backend = "disabled"
+        return
+
+    if backend in ("auto", "otel") and OTEL_AVAILABLE:
+        provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+        out = sys.stdout if exporter == "console" else open(path, "a", encoding="utf-8")
+        # Uma linha JSON por span, igual ao tracer interno
+        exporter_impl = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+        provider.add_span_processor(BatchSpanProcessor(exporter_impl))
+        otel_trace.set_tracer_provider(provider)
+        _otel_tracer = otel_trace.get_tracer("cringe")
+        _backend = "otel"
+    else:
+        if backend == "otel":
+            logger.warning("⚠️ opentelemetry-sdk não instalado; usando o tracer interno")
+        _exporter = _SpanExporter(exporter, path)
+        _backend = "builtin"
+
+    logger.info("🔭 Tracing habilitado (backend=%s, exportador=%s)", _backend, exporter)
+
+
+def is_enabled() -> bool:
+    return _backend != "disabled"
+
+
+@contextmanager
+def start_span(name: str, **attributes):
+    """Abre um span filho do span atual (ou raiz de um novo trace)."""
+    if _backend == "disabled":
+        yield _NOOP_SPAN
+        return
+
+    if _backend == "otel":
+        with _otel_tracer.start_as_current_span(name, attributes=_clean(attributes)) as otel_span:
+            yield _OtelSpanAdapter(otel_span)
+        return
+
+    parent = _current_span.get()
+    span = Span(name, parent.trace_id if parent else secrets.token_hex(16),
+                parent.span_id if parent else None, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        _exporter.export(span)
+
+
+def record_span(name: str, duration: float, **attributes):
+    """
+    Registra um span já medido (terminando agora), como filho do span atual.
+    Só registra dentro de um trace ativo, para não gerar raízes soltas.
+    """
+    if _backend == "disabled":
+        return
+
+    end_ns = time.time_ns()
+    start_ns = end_ns - int(duration * 1e9)
+
+    if _backend == "otel":
+        if not otel_trace.get_current_span().get_span_context().is_valid:
+            return
+        otel_span = _otel_tracer.start_span(name, attributes=_clean(attributes), start_time=start_ns)
+        otel_span.end(end_time=end_ns)
+        return
+
+    parent = _current_span.get()
+    if parent is None:
+        return
+    span = Span(name, parent.trace_id, parent.span_id, attributes, start_ns=start_ns)
+    span.end_ns = end_ns
+    _exporter.export(span)
+
+
+def traced(name: str):
+    """Decorator: executa a função dentro de um span com o nome dado."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_db_query(sql: str, parameters, duration: float):
+    """Observador de queries: um span por comando SQL dentro do trace atual."""
+    record_span("db.query", duration, **{
+        "db.operation": statement_family(sql),
+        "db.statement": " ".join(sql.split())[:500],
+    })
+
+
+def current_trace_id() -> Optional[str]:
+    if _backend == "otel":
+        context = otel_trace.get_current_span().get_span_context()
+        return format(context.trace_id, "032x") if context.is_valid else None
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    # O OpenTelemetry só aceita tipos primitivos como atributo
+    return {
+        key: value if isinstance(value, (str, bool, int, float)) else str(value)
+        for key, value in attributes.items() if value is not None
+    }
+
+
+class _OtelSpanAdapter:
+    """Expõe a mesma interface do Span interno sobre um span do OpenTelemetry."""
+
+    __slots__ = ("_span",)
+
+    def __init__(self, span):
+        self._span = span
+
+    def update_name(self, name: str):
+        self._span.update_name(name)
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self._span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self._span.set_attributes(_clean(attributes))
+
+    def record_exception(self, exc: BaseException):
+        self._span.record_exception(exc)
+        self._span.set_status(Status(StatusCode.ERROR, str(exc)))
+
+    def set_error(self, description: str):
+        self._span.set_status(Status(StatusCode.ERROR, description))
@@ -0,0 +1,221 @@
+# services/usage.py
+
+import math
+import sqlite3
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Colunas de uso gravadas em cada mensagem do bot
+USAGE_COLUMNS = {
+    "prompt_tokens": "INTEGER",
+    "completion_tokens": "INTEGER",
+    "latency_ms": "INTEGER",
+    "model": "TEXT",
+}
+
+# Overhead aproximado de cada mensagem no formato de chat (role, separadores)
+TOKENS_PER_MESSAGE = 4
+
+
+class BudgetExceeded(Exception):
+    """Chamada ao LLM bloqueada por um orçamento do ai_config (vira HTTP 429/413)."""
+
+    def __init__(self, reason: str, budget: str, status_code: int = 429, retry_after: Optional[int] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.detail = reason
+        self.budget = budget
+        # status_code também marca o erro como definitivo para os workers da fila
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token), usada antes da chamada."""
+    return math.ceil(len(text or "") / 4)
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """Tokens de uma mensagem: a contagem gravada no banco quando existe, senão a estimativa."""
+    tokens = message.get("tokens")
+    if tokens is not None:
+        return tokens
+    return estimate_tokens(message.get("content", ""))
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(message_tokens(message) + TOKENS_PER_MESSAGE for message in messages)
+
+
+def enforce_prompt_budget(messages: List[Dict[str, str]], max_prompt_tokens: Optional[int]) -> List[Dict[str, str]]:
+    """
+    Descarta o histórico mais antigo até o prompt caber em max_prompt_tokens.
+    O system prompt e a mensagem atual do usuário nunca são descartados.
+    """
+    if not max_prompt_tokens:
+        return messages
+
+    messages = list(messages)
+    total = estimate_prompt_tokens(messages)
+    index = 1 if messages and messages[0].get("role") == "system" else 0
+    # Mantém sempre a última mensagem (a do usuário)
+    while total > max_prompt_tokens and index < len(messages) - 1:
+        dropped = messages.pop(index)
+        total -= message_tokens(dropped) + TOKENS_PER_MESSAGE
+
+    if total > max_prompt_tokens:
+        raise BudgetExceeded(
+            f"Prompt estimado em {total} tokens excede o limite de {max_prompt_tokens}",
+            budget="max_prompt_tokens",
+            status_code=413
+        )
+    return messages
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _seconds_until_utc_midnight() -> int:
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def install_usage(conn: sqlite3.Connection):
+    """Cria as colunas de uso em messages e as tabelas de agregados (por bot/dia e por conversa)."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    for column, column_type in USAGE_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            day TEXT NOT NULL,
+            bot_id TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms_total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, bot_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_usage (
+            conversation_id TEXT PRIMARY KEY,
+            bot_id TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms_total INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.commit()
+
+
+def record_usage(cursor: sqlite3.Cursor, bot_id: str, conversation_id: str,
+                 prompt_tokens: int, completion_tokens: int, latency_ms: int):
+    """Soma o uso de uma geração nos agregados (na mesma transação da mensagem)."""
+    values = (prompt_tokens, completion_tokens, latency_ms)
+    cursor.execute('''
+        INSERT INTO usage_daily (day, bot_id, requests, prompt_tokens, completion_tokens, latency_ms_total)
+        VALUES (?, ?, 1, ?, ?, ?)
+        ON CONFLICT (day, bot_id) DO UPDATE SET
+            requests = usage_daily.requests + 1,
+            prompt_tokens = usage_daily.prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = usage_daily.completion_tokens + excluded.completion_tokens,
+            latency_ms_total = usage_daily.latency_ms_total + excluded.latency_ms_total
+    ''', (_today(), bot_id) + values)
+    cursor.execute('''
+        INSERT INTO conversation_usage (conversation_id, bot_id, requests, prompt_tokens, completion_tokens, latency_ms_total)
+        VALUES (?, ?, 1, ?, ?, ?)
+        ON CONFLICT (conversation_id) DO UPDATE SET
+            requests = conversation_usage.requests + 1,
+            prompt_tokens = conversation_usage.prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = conversation_usage.completion_tokens + excluded.completion_tokens,
+            latency_ms_total = conversation_usage.latency_ms_total + excluded.latency_ms_total
+    ''', (conversation_id, bot_id) + values)
+
+
+def check_budgets(cursor: sqlite3.Cursor, bot_id: str, conversation_id: Optional[str], ai_config: Dict[str, Any]):
+    """
+    Verifica os orçamentos do ai_config antes de chamar o LLM:
+      - max_daily_tokens: tokens (prompt + resposta) do bot no dia (UTC)
+      - max_conversation_tokens: tokens acumulados na conversa
+    """
+    max_daily = ai_config.get("max_daily_tokens")
+    if max_daily:
+        row = cursor.execute(
+            "SELECT prompt_tokens + completion_tokens FROM usage_daily WHERE day = ? AND bot_id = ?",
+            (_today(), bot_id)
+        ).fetchone()
+        used = row[0] if row else 0
+        if used >= max_daily:
+            logger.warning("💸 Orçamento diário do bot %s esgotado (%s/%s tokens)", bot_id, used, max_daily)
+            raise BudgetExceeded(
+                f"Orçamento diário de tokens do bot esgotado ({used}/{max_daily})",
+                budget="max_daily_tokens",
+                retry_after=_seconds_until_utc_midnight()
+            )
+
+    max_conversation = ai_config.get("max_conversation_tokens")
+    if max_conversation and conversation_id:
+        row = cursor.execute(
+            "SELECT prompt_tokens + completion_tokens FROM conversation_usage WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        used = row[0] if row else 0
+        if used >= max_conversation:
+            logger.warning("💸 Orçamento da conversa %s esgotado (%s/%s tokens)", conversation_id, used, max_conversation)
+            raise BudgetExceeded(
+                f"Orçamento de tokens da conversa esgotado ({used}/{max_conversation}); inicie uma nova conversa",
+                budget="max_conversation_tokens"
+            )
+
+
+def _summarize(row) -> Dict[str, Any]:
+    requests = row["requests"] or 0
+    return {
+        "requests": requests,
+        "prompt_tokens": row["prompt_tokens"] or 0,
+        "completion_tokens": row["completion_tokens"] or 0,
+        "avg_latency_ms": round(row["latency_ms_total"] / requests) if requests else None,
+    }
+
+
+def get_bot_usage(cursor: sqlite3.Cursor, bot_id: Optional[str] = None, days: int = 7) -> Dict[str, Any]:
+    """Uso por bot nos últimos `days` dias (UTC), com o detalhamento diário."""
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    query = "SELECT * FROM usage_daily WHERE day >= ?"
+    params: List[Any] = [since]
+    if bot_id:
+        query += " AND bot_id = ?"
+        params.append(bot_id)
+    query += " ORDER BY bot_id, day"
+
+    bots: Dict[str, Dict[str, Any]] = {}
+    for row in cursor.execute(query, params).fetchall():
+        entry = bots.setdefault(row["bot_id"], {
+            "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_ms_total": 0, "daily": []
+        })
+        for field in ("requests", "prompt_tokens", "completion_tokens", "latency_ms_total"):
+            entry[field] += row[field]
+        entry["daily"].append({"day": row["day"], **_summarize(row)})
+
+    return {
+        "since": since,
+        "bots": {
+            bot: {**_summarize(entry), "daily": entry["daily"]}
+            for bot, entry in bots.items()
+        }
+    }
+
+
+def get_conversation_usage(cursor: sqlite3.Cursor, conversation_id: str) -> Optional[Dict[str, Any]]:
+    row = cursor.execute("SELECT * FROM conversation_usage WHERE conversation_id = ?", (conversation_id,)).fetchone()
+    if not row:
+        return None
+    return {"conversation_id": conversation_id, "bot_id": row["bot_id"], **_summarize(row)}
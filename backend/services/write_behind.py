@@ -0,0 +1,206 @@
+# services/write_behind.py
+
+import os
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Write-behind das mensagens do chat: um único writer agrupa as escritas de
+# todas as requisições em poucas transações (um fsync por lote, não por turno)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+# commit: a requisição responde depois do COMMIT do lote (nada se perde)
+# enqueue: responde ao enfileirar (mais rápido; um crash perde o lote em andamento)
+WRITE_BEHIND_DURABILITY = os.getenv("WRITE_BEHIND_DURABILITY", "commit").lower()
+# Janela de agrupamento: o writer espera até isso por mais escritas antes do COMMIT
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "5"))
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "256"))
+# Fila cheia bloqueia quem escreve (backpressure) em vez de crescer sem limite
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WRITE_BEHIND_TIMEOUT_SECONDS = float(os.getenv("WRITE_BEHIND_TIMEOUT_SECONDS", "30"))
+
+DURABILITY_MODES = ("commit", "enqueue")
+
+# Uma unidade de escrita recebe o cursor do writer e executa seus comandos
+WriteUnit = Callable[[Any], None]
+
+
+class WriteTicket:
+    """Resultado de uma unidade enfileirada: wait() devolve quando o lote dela foi commitado."""
+
+    __slots__ = ("_done", "_lock", "_callbacks", "error")
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[Optional[BaseException]], Any]] = []
+        self.error: Optional[BaseException] = None
+
+    def _resolve(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self.error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run(callback)
+
+    def _run(self, callback: Callable[[Optional[BaseException]], Any]):
+        try:
+            callback(self.error)
+        except Exception as e:
+            logger.error("❌ Write-behind: callback falhou: %s", e)
+
+    def add_done_callback(self, callback: Callable[[Optional[BaseException]], Any]):
+        """Chama callback(erro ou None) quando o lote for gravado (na hora, se já foi)."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run(callback)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = WRITE_BEHIND_TIMEOUT_SECONDS):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Escrita não commitada dentro do prazo")
+        if self.error is not None:
+            raise self.error
+
+
+class GroupCommitWriter:
+    """
+    Thread única que drena a fila de unidades de escrita e grava cada lote
+    (até max_batch unidades ou flush_ms de espera) em uma só transação.
+    Cada unidade roda em um SAVEPOINT: a que falha é desfeita sozinha e
+    recebe o erro no ticket, sem derrubar as outras do lote.
+    """
+
+    def __init__(self, connect: Callable[[], Any], flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 max_batch: int = WRITE_BEHIND_MAX_BATCH, durability: str = WRITE_BEHIND_DURABILITY,
+                 queue_size: int = WRITE_BEHIND_QUEUE_SIZE):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability deve ser um de {DURABILITY_MODES}")
+        self.connect = connect
+        self.flush_seconds = flush_ms / 1000
+        self.max_batch = max_batch
+        self.durability = durability
+        self._queue: "queue.Queue[Tuple[WriteUnit, WriteTicket]]" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+        self._stats = {"batches": 0, "units": 0, "failed_units": 0, "max_batch_seen": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def submit(self, unit: WriteUnit) -> WriteTicket:
+        """Enfileira a unidade e devolve o ticket (não espera o COMMIT)."""
+        if not self.running:
+            raise RuntimeError("Writer de write-behind não iniciado")
+        ticket = WriteTicket()
+        self._queue.put((unit, ticket))
+        return ticket
+
+    def write(self, unit: WriteUnit, timeout: Optional[float] = WRITE_BEHIND_TIMEOUT_SECONDS) -> WriteTicket:
+        """Enfileira e, no modo commit, só devolve depois que o lote foi gravado."""
+        ticket = self.submit(unit)
+        if self.durability == "commit":
+            ticket.wait(timeout)
+        return ticket
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="write-behind", daemon=True)
+        self._thread.start()
+        logger.info(
+            "✍️ Write-behind iniciado (janela de %.0f ms, até %s escritas por COMMIT, durabilidade=%s)",
+            self.flush_seconds * 1000, self.max_batch, self.durability
+        )
+
+    def stop(self, timeout: float = 10.0):
+        """Para o writer depois de gravar o que já estava na fila."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def status(self) -> Dict[str, Any]:
+        return dict(self._stats, queued=self._queue.qsize(), durability=self.durability, running=self.running)
+
+    def _next_batch(self) -> List[Tuple[WriteUnit, WriteTicket]]:
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._commit_batch(batch)
+            elif self._stop.is_set():
+                break
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _commit_batch(self, batch: List[Tuple[WriteUnit, WriteTicket]]):
+        errors: Dict[int, BaseException] = {}
+        try:
+            if self._conn is None:
+                self._conn = self.connect()
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for index, (unit, _) in enumerate(batch):
+                    cursor.execute("SAVEPOINT write_unit")
+                    try:
+                        unit(cursor)
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT write_unit")
+                        errors[index] = e
+                    cursor.execute("RELEASE SAVEPOINT write_unit")
+                cursor.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    cursor.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            # Falha do lote inteiro (lock, disco, conexão): todas as unidades recebem o erro
+            logger.error("❌ Write-behind: lote de %s escritas falhou: %s", len(batch), e)
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+            for _, ticket in batch:
+                ticket._resolve(e)
+            self._stats["failed_units"] += len(batch)
+            return
+
+        for index, (_, ticket) in enumerate(batch):
+            error = errors.get(index)
+            if error is not None:
+                logger.error("❌ Write-behind: escrita descartada: %s", error)
+            ticket._resolve(error)
+        self._stats["batches"] += 1
+        self._stats["units"] += len(batch)
+        self._stats["failed_units"] += len(errors)
+        self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], len(batch))
@@ -0,0 +1,120 @@
+# benchmarks/harness.py
+"""
+Mini-harness de microbenchmarks: registro de casos, medição e comparação
+com baselines salvas em JSON (com limite de regressão por caso).
+"""
+
+import gc
+import json
+import time
+import statistics
+from typing import Callable, Dict, List, Optional
+
+# Tempo mínimo de cada rodada (o número de chamadas por rodada é calibrado)
+MIN_ROUND_SECONDS = 0.05
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+
+_cases: List["BenchmarkCase"] = []
+
+
+class BenchmarkCase:
+    def __init__(self, name: str, setup: Callable[[], Callable[[], object]], repeat: int, quick: bool):
+        self.name = name
+        self.setup = setup
+        self.repeat = repeat
+        self.quick = quick
+
+
+def benchmark(name: str, repeat: int = DEFAULT_REPEAT, quick: bool = True):
+    """
+    Registra um caso. A função decorada faz o preparo (fora da medição)
+    e devolve o callable que será medido.
+    quick=False deixa o caso fora do modo --quick (tamanhos grandes).
+    """
+    def decorator(setup):
+        _cases.append(BenchmarkCase(name, setup, repeat, quick))
+        return setup
+    return decorator
+
+
+def registered_cases() -> List[BenchmarkCase]:
+    return list(_cases)
+
+
+def _calibrate(fn: Callable[[], object]) -> int:
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_ROUND_SECONDS or number >= 1_000_000:
+            return number
+        number *= 10 if elapsed < MIN_ROUND_SECONDS / 10 else 2
+
+
+def measure(case: BenchmarkCase) -> Dict[str, float]:
+    """Mede o caso: devolve tempo por chamada (mínimo e mediana das rodadas), em segundos."""
+    fn = case.setup()
+    fn()  # aquecimento (caches, imports tardios, páginas do SQLite)
+    number = _calibrate(fn)
+
+    rounds = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(case.repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            rounds.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return {"min": min(rounds), "median": statistics.median(rounds), "number": number, "repeat": case.repeat}
+
+
+def load_baselines(path: str) -> Dict[str, dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(path: str, results: Dict[str, Dict[str, float]], previous: Dict[str, dict]):
+    """Grava as medições como nova baseline, preservando limites específicos já configurados."""
+    baselines = dict(previous)
+    for name, result in results.items():
+        entry = {"median": result["median"], "min": result["min"]}
+        if "threshold" in previous.get(name, {}):
+            entry["threshold"] = previous[name]["threshold"]
+        baselines[name] = entry
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(baselines.items())), f, indent=2)
+        f.write("\n")
+
+
+def compare(name: str, result: Dict[str, float], baseline: Optional[dict], default_threshold: float) -> dict:
+    """Compara a mediana com a baseline; regressão quando passa de baseline * (1 + limite)."""
+    if not baseline:
+        return {"status": "new", "ratio": None, "threshold": default_threshold}
+    threshold = baseline.get("threshold", default_threshold)
+    ratio = result["median"] / baseline["median"] if baseline["median"] else float("inf")
+    if ratio > 1 + threshold:
+        status = "regression"
+    elif ratio < 1 - threshold:
+        status = "improved"
+    else:
+        status = "ok"
+    return {"status": status, "ratio": ratio, "threshold": threshold}
+
+
+def format_seconds(value: float) -> str:
+    if value < 1e-3:
+        return f"{value * 1e6:.1f}µs"
+    if value < 1:
+        return f"{value * 1e3:.2f}ms"
+    return f"{value:.3f}s"
@@ -0,0 +1,284 @@
+# benchmarks/hot_paths.py
+"""
+Microbenchmarks dos caminhos quentes do backend.
+
+Uso:
+    python benchmarks/hot_paths.py                  # mede e compara com benchmarks/baselines.json
+    python benchmarks/hot_paths.py --quick          # sem os tamanhos grandes (50k bots, grupos enormes)
+    python benchmarks/hot_paths.py -k list_bots     # só os casos cujo nome contém o filtro
+    python benchmarks/hot_paths.py --save-baseline  # grava as medições como nova baseline
+
+Sai com código 1 quando algum caso fica mais lento que baseline * (1 + limite).
+O limite padrão vem de --threshold / BENCH_REGRESSION_THRESHOLD e pode ser
+sobrescrito por caso com a chave "threshold" no arquivo de baselines.
+
+Tudo roda em um diretório temporário: os bancos (cringe.db, cringe_rpg.db,
+sql_app.db) são criados do zero e o banco real nunca é tocado.
+"""
+
+import os
+import sys
+import json
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import importlib.util
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from harness import (  # noqa: E402
+    benchmark,
+    registered_cases,
+    measure,
+    load_baselines,
+    save_baselines,
+    compare,
+    format_seconds,
+    DEFAULT_THRESHOLD,
+)
+
+BASELINE_PATH = os.getenv("BENCH_BASELINE_PATH", os.path.join(BENCH_DIR, "baselines.json"))
+BENCH_REGRESSION_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", str(DEFAULT_THRESHOLD)))
+
+TAGS = ["fantasia", "rpg", "taverna", "magia", "humor"]
+AI_CONFIG = {"temperature": 0.8, "max_output_tokens": 1024, "model_name": "mistralai/mistral-7b-instruct:free"}
+LONG_TEXT = "O bardo afina o alaúde enquanto a chuva bate nas janelas da taverna. " * 4
+
+
+def _chat_history(size: int):
+    return [
+        {"role": "user" if index % 2 == 0 else "assistant", "content": f"{LONG_TEXT} #{index}"}
+        for index in range(size)
+    ]
+
+
+def _bot_row_values(index: int) -> tuple:
+    return (
+        f"bot-{index}", "system", f"Bot {index}", "Indefinido", "Introdução do bot.", LONG_TEXT,
+        "Olá, aventureiro!", "https://example.com/avatar.png", json.dumps(TAGS), "Contexto.", "[]",
+        "Você é um bot de testes.", json.dumps(AI_CONFIG),
+    )
+
+
+# ----------------------------------------------------------------------
+# AIService._prepare_payload
+# ----------------------------------------------------------------------
+
+def _prepare_payload_case(history_size: int):
+    def setup():
+        from services.ai_service import AIService
+        service = AIService()
+        history = _chat_history(history_size)
+        return lambda: service._prepare_payload("Você é o Mestre da Masmorra.", history, "Eu abro a porta.", 0.8, 512)
+    return setup
+
+
+for _size in (8, 200):
+    benchmark(f"prepare_payload[history={_size}]")(_prepare_payload_case(_size))
+
+
+# ----------------------------------------------------------------------
+# Bot.to_dict e decodificação JSON de tags/ai_config
+# ----------------------------------------------------------------------
+
+@benchmark("bot_to_dict")
+def _bot_to_dict():
+    from models import Bot
+    bot = Bot(
+        id="bot-1", creator_id="system", name="Pimenta (Pip)", gender="Feminino",
+        introduction="Introdução.", personality=LONG_TEXT, welcome_message="Olá!",
+        avatar_url="https://example.com/pip.png", tags=json.dumps(TAGS), conversation_context="Contexto.",
+        context_images="[]", ai_config_json=json.dumps(AI_CONFIG), system_prompt="Você é a Pip.",
+    )
+    return bot.to_dict
+
+
+@benchmark("bot_row_json_decode")
+def _bot_row_json_decode():
+    # Mesmo padrão de backend/main.py: dict(sqlite3.Row) + json.loads de tags e ai_config
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE bots (id, creator_id, name, gender, introduction, personality, welcome_message, "
+        "avatar_url, tags, conversation_context, context_images, system_prompt, ai_config)"
+    )
+    conn.execute("INSERT INTO bots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _bot_row_values(0))
+    row = conn.execute("SELECT * FROM bots").fetchone()
+
+    def decode():
+        bot_dict = dict(row)
+        bot_dict['tags'] = json.loads(bot_dict['tags'])
+        bot_dict['ai_config'] = json.loads(bot_dict['ai_config'])
+        return bot_dict
+    return decode
+
+
+# ----------------------------------------------------------------------
+# Busca de histórico em backend/main.py
+# ----------------------------------------------------------------------
+
+def _history_fetch_case(message_count: int):
+    def setup():
+        import main
+        main.init_db()
+        main.insert_default_bots()
+        conn = main.get_db_connection()
+        bot_id = conn.execute("SELECT id FROM bots LIMIT 1").fetchone()["id"]
+
+        conversation_id = str(uuid.uuid4())
+        conn.execute("INSERT INTO conversations (id, bot_id) VALUES (?, ?)", (conversation_id, bot_id))
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, content, is_user) VALUES (?, ?, ?, ?)",
+            ((str(uuid.uuid4()), conversation_id, f"{LONG_TEXT} #{i}", i % 2 == 0) for i in range(message_count))
+        )
+        # Ruído: outras conversas na mesma tabela, como em produção
+        noise_conversation = str(uuid.uuid4())
+        conn.execute("INSERT INTO conversations (id, bot_id) VALUES (?, ?)", (noise_conversation, bot_id))
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, content, is_user) VALUES (?, ?, ?, ?)",
+            ((str(uuid.uuid4()), noise_conversation, LONG_TEXT, True) for _ in range(5000))
+        )
+        conn.commit()
+
+        cursor = conn.cursor()
+        return lambda: main.fetch_chat_history(cursor, conversation_id)
+    return setup
+
+
+for _size in (10, 100, 1000):
+    benchmark(f"history_fetch[messages={_size}]")(_history_fetch_case(_size))
+
+
+# ----------------------------------------------------------------------
+# db.add_message_to_group (db.py da raiz) com grupos crescentes
+# ----------------------------------------------------------------------
+
+_root_db = None
+
+
+def _load_root_db():
+    # backend/db/ é um pacote com o mesmo nome; carrega o db.py da raiz pelo caminho
+    global _root_db
+    if _root_db is None:
+        spec = importlib.util.spec_from_file_location("cringe_root_db", os.path.join(REPO_ROOT, "db.py"))
+        _root_db = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_root_db)
+        _root_db.init_db()
+    return _root_db
+
+
+def _add_message_case(group_size: int):
+    def setup():
+        db = _load_root_db()
+        group_id = f"group-{group_size}-{uuid.uuid4().hex[:6]}"
+        messages = [db.Message(sender_id="user-1", sender_type="user", text=LONG_TEXT, timestamp=float(i)) for i in range(group_size)]
+        db.save_group(db.ChatGroup(group_id=group_id, name="Taverna", scenario="Cenário", member_ids=["user-1"], messages=messages))
+        message = db.Message(sender_id="user-1", sender_type="user", text=LONG_TEXT, timestamp=0.0)
+        return lambda: db.add_message_to_group(group_id, message)
+    return setup
+
+
+for _size in (10, 100, 1000):
+    benchmark(f"add_message_to_group[messages={_size}]", repeat=3)(_add_message_case(_size))
+benchmark("add_message_to_group[messages=10000]", repeat=3, quick=False)(_add_message_case(10000))
+
+
+# ----------------------------------------------------------------------
+# list_bots (routers/bots.py) + serialização da resposta
+# ----------------------------------------------------------------------
+
+def _list_bots_case(bot_count: int):
+    def setup():
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from fastapi.encoders import jsonable_encoder
+        from database import Base
+        from models import Bot
+        from routers.bots import list_bots
+
+        path = os.path.abspath(f"list_bots_{bot_count}.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine, tables=[Bot.__table__])
+        raw = sqlite3.connect(path)
+        raw.executemany(
+            "INSERT INTO bots (id, creator_id, name, gender, introduction, personality, welcome_message, "
+            "avatar_url, tags, conversation_context, context_images, system_prompt, ai_config) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (_bot_row_values(index) for index in range(bot_count))
+        )
+        raw.commit()
+        raw.close()
+        Session = sessionmaker(bind=engine)
+
+        def run():
+            db = Session()
+            try:
+                return jsonable_encoder(list_bots(db))
+            finally:
+                db.close()
+        return run
+    return setup
+
+
+for _size, _quick in ((10, True), (1000, True), (50000, False)):
+    benchmark(f"list_bots[bots={_size}]", repeat=3, quick=_quick)(_list_bots_case(_size))
+
+
+# ----------------------------------------------------------------------
+# Execução
+# ----------------------------------------------------------------------
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks dos caminhos quentes com baselines")
+    parser.add_argument("-k", "--filter", default="", help="só casos cujo nome contém o texto")
+    parser.add_argument("--quick", action="store_true", help="pula os tamanhos grandes")
+    parser.add_argument("--threshold", type=float, default=BENCH_REGRESSION_THRESHOLD,
+                        help="regressão tolerada (0.25 = 25%% mais lento)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", action="store_true", help="imprime os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    cases = [
+        case for case in registered_cases()
+        if args.filter in case.name and (case.quick or not args.quick)
+    ]
+    baselines = load_baselines(args.baseline)
+    results, report = {}, {}
+
+    with tempfile.TemporaryDirectory(prefix="cringe-bench-") as workdir:
+        original_cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for case in cases:
+                results[case.name] = measure(case)
+                report[case.name] = {**results[case.name], **compare(case.name, results[case.name], baselines.get(case.name), args.threshold)}
+                if not args.json:
+                    entry = report[case.name]
+                    ratio = f"{entry['ratio']:.2f}x" if entry["ratio"] is not None else "—"
+                    print(f"{case.name:<40}{format_seconds(entry['median']):>12}{ratio:>9}  {entry['status']}")
+        finally:
+            os.chdir(original_cwd)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        save_baselines(args.baseline, results, baselines)
+        print(f"💾 Baseline gravada em {args.baseline}")
+        return 0
+
+    regressions = [name for name, entry in report.items() if entry["status"] == "regression"]
+    if regressions:
+        print(f"❌ Regressões acima do limite: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -241,7 +241,12 @@ save_message = add_message_to_group
 # ----------------------------------------
 
 def init_db():
-    """Inicializa o banco de dados e as tabelas, se não existirem."""
+    """
+    Inicializa o banco de dados e as tabelas, se não existirem.
+
+    Este é o banco local dos scripts da raiz (cringe_rpg.db), separado dos bancos
+    do backend, e fica fora das migrações versionadas de services/migrations.py.
+    """
     conn = get_db_connection()
     c = conn.cursor()
 
@@ -296,5 +301,7 @@ def init_db():
         
     conn.close()
 
-# Executa a inicialização ao carregar o módulo
-init_db()
+# A inicialização não roda mais no import (evita I/O ao carregar o módulo):
+# chame init_db() explicitamente no startup, ou execute este arquivo.
+if __name__ == "__main__":
+    init_db()
@@ -59,16 +59,35 @@ def load_bots_from_db() -> List[Dict]:
         st.session_state.api_health = "unreachable"
         return []
 
-def chat_with_bot(bot_id: str, message: str, conversation_id: Optional[str] = None):
+@st.cache_data(ttl=60)
+def search_bots(query: str) -> Optional[List[Dict]]:
+    """Busca no servidor (FTS5); None quando a busca não está disponível"""
+    try:
+        response = requests.get(f"{API_URL}/search", params={"q": query, "type": "bots", "limit": 50}, timeout=10)
+        if response.status_code == 200:
+            return response.json()["bots"]["items"]
+        return None
+    except Exception:
+        return None
+
+def generate_idempotency_key(bot_id: str, conversation: Dict, message: str) -> str:
+    """Chave estável para um envio: reruns e reenvios da mesma mensagem geram a mesma chave"""
+    position = len(conversation['messages'])
+    unique_string = f"{bot_id}:{conversation['started_at']}:{position}:{message.strip()}"
+    return hashlib.sha256(unique_string.encode()).hexdigest()
+
+def chat_with_bot(bot_id: str, message: str, conversation_id: Optional[str] = None, idempotency_key: Optional[str] = None):
     try:
         payload = {
             "message": message,
-            "conversation_id": conversation_id
+            "conversation_id": conversation_id,
+            "idempotency_key": idempotency_key
         }
         
         response = requests.post(
             f"{API_URL}/bots/chat/{bot_id}", 
             json=payload, 
+            headers={"Idempotency-Key": idempotency_key} if idempotency_key else None,
             timeout=30
         )
         
@@ -307,6 +326,9 @@ def show_chat_interface():
         st.session_state.waiting_for_response = True
         st.session_state.last_user_message = user_message.strip()
         
+        # Chave calculada antes de anexar a mensagem, para que reruns reutilizem a mesma
+        idempotency_key = generate_idempotency_key(bot['id'], current_conversation, user_message)
+        
         # Adicionar mensagem do usuário
         current_conversation['messages'].append({
             'content': user_message,
@@ -325,7 +347,8 @@ def show_chat_interface():
             response = chat_with_bot(
                 bot['id'], 
                 user_message, 
-                current_conversation['conversation_id']
+                current_conversation['conversation_id'],
+                idempotency_key
             )
             
             st.session_state.waiting_for_response = False
@@ -364,6 +387,19 @@ def show_bots_list():
     st.title("🤖 Todos os Personagens")
     st.markdown("---")
     
+    query = st.text_input("🔎 Buscar personagens", placeholder="nome, tag ou trecho da personalidade")
+    if query.strip():
+        results = search_bots(query.strip())
+        if results is not None:
+            if not results:
+                st.info("Nenhum personagem encontrado para essa busca.")
+                return
+            cols = st.columns(2)
+            for i, bot in enumerate(results):
+                create_bot_card(bot, cols[i % 2])
+            return
+        st.warning("⚠️ Busca indisponível no momento; mostrando todos os personagens.")
+    
     bots = load_bots_from_db()
     
     if not bots:
@@ -0,0 +1,203 @@
+# loadtest/load_generator.py
+"""
+Gerador de carga assíncrono para a API do CRINGE.
+
+Dispara /bots/chat/{bot_id} e /groups/send_message com concorrência fixa e
+reporta vazão, status e latências p50/p95/p99 por cenário.
+
+Uso:
+    python loadtest/load_generator.py --base-url http://localhost:8000 \
+        --bot-id 6fb7db99-3438-4aa5-8e5c-bf47b73241b9 --group-id 1 \
+        --concurrency 20 --duration 60 --mix chat=0.8,group=0.2
+
+Cada usuário virtual manda X-User-Id próprio (o limite por usuário continua
+valendo por usuário; a API só aceita o header com TRUSTED_PROXIES=127.0.0.1) e mensagens únicas (a deduplicação não mascara a carga).
+"""
+
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil por interpolação linear (valores já ordenados)."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def parse_mix(raw: str) -> Dict[str, float]:
+    """Converte 'chat=0.8,group=0.2' em pesos por cenário."""
+    mix = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        name, weight = item.split("=", 1)
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class ScenarioStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Dict[str, int] = {}
+
+    def record(self, status: str, latency: float):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latencies.append(latency)
+
+    def summary(self, elapsed: float) -> dict:
+        ordered = sorted(self.latencies)
+        ok = sum(count for status, count in self.statuses.items() if status.startswith("2"))
+        return {
+            "requests": len(ordered),
+            "ok": ok,
+            "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+            "p50_s": round(percentile(ordered, 0.50), 3),
+            "p95_s": round(percentile(ordered, 0.95), 3),
+            "p99_s": round(percentile(ordered, 0.99), 3),
+            "max_s": round(ordered[-1], 3) if ordered else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, bot_ids: List[str], group_ids: List[int], mix: Dict[str, float],
+                 concurrency: int, duration: Optional[float], total_requests: Optional[int],
+                 timeout: float, async_mode: bool):
+        self.base_url = base_url.rstrip("/")
+        self.bot_ids = bot_ids
+        self.group_ids = group_ids
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total_requests = total_requests
+        self.timeout = timeout
+        self.async_mode = async_mode
+        self.stats: Dict[str, ScenarioStats] = {}
+        self._issued = 0
+
+        # Só entram no sorteio os cenários com alvo configurado
+        available = {"chat": bool(bot_ids), "group": bool(group_ids)}
+        self.mix = {name: weight for name, weight in mix.items() if available.get(name) and weight > 0}
+        if not self.mix:
+            raise ValueError("Nenhum cenário disponível: informe --bot-id e/ou --group-id")
+
+    def _next_scenario(self) -> str:
+        names = list(self.mix)
+        return random.choices(names, weights=[self.mix[name] for name in names])[0]
+
+    def _should_continue(self, deadline: Optional[float]) -> bool:
+        if self.total_requests is not None:
+            if self._issued >= self.total_requests:
+                return False
+            self._issued += 1
+            return True
+        return time.perf_counter() < deadline
+
+    async def _send(self, client: httpx.AsyncClient, user_index: int, scenario: str) -> httpx.Response:
+        user_id = f"load-user-{user_index}"
+        message = f"Mensagem de carga {uuid.uuid4().hex[:8]}: o que acontece a seguir na taverna?"
+        params = {"async_mode": "true"} if self.async_mode else None
+        headers = {"X-User-Id": user_id}
+
+        if scenario == "chat":
+            bot_id = random.choice(self.bot_ids)
+            return await client.post(f"/bots/chat/{bot_id}", json={"message": message}, params=params, headers=headers)
+
+        payload = {"group_id": random.choice(self.group_ids), "sender_id": f"user-{user_id}", "text": message}
+        return await client.post("/groups/send_message", json=payload, params=params, headers=headers)
+
+    async def _virtual_user(self, client: httpx.AsyncClient, user_index: int, deadline: Optional[float]):
+        while self._should_continue(deadline):
+            scenario = self._next_scenario()
+            start = time.perf_counter()
+            try:
+                response = await self._send(client, user_index, scenario)
+                status = str(response.status_code)
+            except httpx.TimeoutException:
+                status = "timeout"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            self.stats.setdefault(scenario, ScenarioStats()).record(status, time.perf_counter() - start)
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        deadline = time.perf_counter() + self.duration if self.duration else None
+        start = time.perf_counter()
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            await asyncio.gather(*(self._virtual_user(client, index, deadline) for index in range(self.concurrency)))
+        elapsed = time.perf_counter() - start
+
+        overall = ScenarioStats()
+        for scenario_stats in self.stats.values():
+            for status, count in scenario_stats.statuses.items():
+                overall.statuses[status] = overall.statuses.get(status, 0) + count
+            overall.latencies.extend(scenario_stats.latencies)
+
+        return {
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 2),
+            "overall": overall.summary(elapsed),
+            "scenarios": {name: scenario_stats.summary(elapsed) for name, scenario_stats in self.stats.items()},
+        }
+
+
+def print_report(report: dict):
+    print(f"\n📊 Concorrência {report['concurrency']} por {report['elapsed_s']}s")
+    header = f"{'cenário':<10}{'reqs':>8}{'ok':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  status"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["scenarios"].items()) + [("total", report["overall"])]
+    for name, summary in rows:
+        print(
+            f"{name:<10}{summary['requests']:>8}{summary['ok']:>8}{summary['throughput_rps']:>9}"
+            f"{summary['p50_s']:>9}{summary['p95_s']:>9}{summary['p99_s']:>9}{summary['max_s']:>9}  {summary['statuses']}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Gerador de carga para /bots/chat e /groups/send_message")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--bot-id", action="append", default=[], help="pode ser repetido")
+    parser.add_argument("--group-id", action="append", type=int, default=[], help="pode ser repetido")
+    parser.add_argument("--mix", default="chat=1,group=1", help="pesos por cenário, ex.: chat=0.8,group=0.2")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos (ignorado com --requests)")
+    parser.add_argument("--requests", type=int, default=None, help="total de requisições em vez de duração")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--async-mode", action="store_true", help="usa ?async_mode=true (mede só o enfileiramento)")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    generator = LoadGenerator(
+        base_url=args.base_url,
+        bot_ids=args.bot_id,
+        group_ids=args.group_id,
+        mix=parse_mix(args.mix),
+        concurrency=args.concurrency,
+        duration=None if args.requests else args.duration,
+        total_requests=args.requests,
+        timeout=args.timeout,
+        async_mode=args.async_mode,
+    )
+    report = asyncio.run(generator.run())
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    return 0 if report["overall"]["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
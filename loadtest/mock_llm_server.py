@@ -0,0 +1,333 @@
+# loadtest/mock_llm_server.py
+"""
+Servidor LLM falso para testes de carga sem gastar cota real.
+
+Fala os três protocolos usados pelo backend:
+  - OpenRouter (chat completions, com e sem streaming): POST /api/v1/chat/completions
+  - Hugging Face Inference API (AIClient):              POST /models/{model_id}
+  - Gemini (generateContent / streamGenerateContent):   POST /v1beta/models/{model}:generateContent
+
+Uso:
+    python loadtest/mock_llm_server.py --port 8001 --latency lognormal:0.8,0.4 \
+        --errors 429=0.05,500=0.02 --tokens-per-second 60
+
+E no backend:
+    OPENROUTER_API_BASE_URL=http://localhost:8001/api/v1/chat/completions
+    HF_API_BASE_URL=http://localhost:8001/models/
+    GEMINI_API_BASE_URL=http://localhost:8001
+
+A configuração pode ser trocada em tempo de execução com POST /_mock/config
+e os contadores lidos em GET /_mock/stats.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Configuração padrão (variáveis de ambiente ou argumentos de linha de comando)
+MOCK_LATENCY = os.getenv("MOCK_LATENCY", "lognormal:0.5,0.4")
+MOCK_ERRORS = os.getenv("MOCK_ERRORS", "")
+MOCK_TOKENS_PER_SECOND = float(os.getenv("MOCK_TOKENS_PER_SECOND", "50"))
+MOCK_COMPLETION_TOKENS = int(os.getenv("MOCK_COMPLETION_TOKENS", "60"))
+
+_WORDS = (
+    "o dragão observa a taverna enquanto o bardo afina o alaúde e a chuva bate "
+    "nas janelas da masmorra onde heróis cansados contam histórias de ouro e glória"
+).split()
+
+
+class LatencyModel:
+    """
+    Distribuição do tempo até o primeiro token, em segundos:
+    'fixed:0.2', 'uniform:0.1,0.8', 'normal:0.5,0.1' ou 'lognormal:0.5,0.4'
+    (na lognormal o primeiro valor é a mediana e o segundo o sigma).
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, raw_args = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.args = [float(value) for value in raw_args.split(",") if value.strip()]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return random.uniform(self.args[0], self.args[1])
+        if self.kind == "normal":
+            return max(0.0, random.gauss(self.args[0], self.args[1]))
+        median, sigma = self.args
+        return random.lognormvariate(0.0, sigma) * median
+
+
+def parse_error_rates(raw: Optional[str]) -> Dict[int, float]:
+    """Converte '429=0.05,500=0.02' em {429: 0.05, 500: 0.02}"""
+    rates = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        status, rate = item.split("=", 1)
+        rates[int(status)] = float(rate)
+    return rates
+
+
+class MockConfig:
+    def __init__(self, latency: str, errors: str, tokens_per_second: float, completion_tokens: int):
+        self.latency = LatencyModel(latency)
+        self.errors = parse_error_rates(errors)
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+
+    def pick_error(self) -> Optional[int]:
+        roll = random.random()
+        cumulative = 0.0
+        for status, rate in self.errors.items():
+            cumulative += rate
+            if roll < cumulative:
+                return status
+        return None
+
+    def token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "latency": self.latency.spec,
+            "errors": {str(status): rate for status, rate in self.errors.items()},
+            "tokens_per_second": self.tokens_per_second,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+config = MockConfig(MOCK_LATENCY, MOCK_ERRORS, MOCK_TOKENS_PER_SECOND, MOCK_COMPLETION_TOKENS)
+stats = {"requests": 0, "errors": {}, "tokens": 0, "by_api": {}}
+
+app = FastAPI(title="CRINGE Mock LLM", version="1.0.0")
+
+
+def _completion_tokens() -> list:
+    count = max(1, int(random.gauss(config.completion_tokens, config.completion_tokens * 0.25)))
+    return [random.choice(_WORDS) for _ in range(count)]
+
+
+def _prompt_tokens(body: dict) -> int:
+    # Aproximação grosseira: ~4 caracteres por token
+    return max(1, len(json.dumps(body, ensure_ascii=False)) // 4)
+
+
+async def _begin(api: str):
+    """Conta a requisição, espera a latência inicial e decide se falha."""
+    stats["requests"] += 1
+    stats["by_api"][api] = stats["by_api"].get(api, 0) + 1
+    await asyncio.sleep(config.latency.sample())
+    status = config.pick_error()
+    if status is None:
+        return None
+    stats["errors"][str(status)] = stats["errors"].get(str(status), 0) + 1
+    headers = {"Retry-After": "1"} if status == 429 else {}
+    return JSONResponse({"error": {"code": status, "message": f"mock error {status}"}}, status_code=status, headers=headers)
+
+
+async def _generate(tokens: list):
+    """Simula a vazão de tokens (usada pelas respostas sem streaming)."""
+    await asyncio.sleep(len(tokens) * config.token_delay())
+    stats["tokens"] += len(tokens)
+
+
+def _sse(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ----------------------------------------------------------------------
+# OpenRouter (formato OpenAI chat completions)
+# ----------------------------------------------------------------------
+
+@app.post("/api/v1/chat/completions")
+async def openrouter_chat_completions(request: Request):
+    body = await request.json()
+    error = await _begin("openrouter")
+    if error:
+        return error
+
+    model = body.get("model", "mock/model")
+    completion_id = f"gen-{uuid.uuid4().hex[:16]}"
+    tokens = _completion_tokens()
+    tokens = tokens[:max(1, int(body.get("max_tokens") or len(tokens)))]
+    usage = {
+        "prompt_tokens": _prompt_tokens(body.get("messages", [])),
+        "completion_tokens": len(tokens),
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if not body.get("stream"):
+        await _generate(tokens)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    async def stream():
+        delay = config.token_delay()
+        for index, token in enumerate(tokens):
+            await asyncio.sleep(delay)
+            stats["tokens"] += 1
+            yield _sse({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token if index == 0 else " " + token}, "finish_reason": None}],
+            })
+        yield _sse({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+# ----------------------------------------------------------------------
+# Hugging Face Inference API (text-generation)
+# ----------------------------------------------------------------------
+
+@app.post("/models/{model_id:path}")
+async def huggingface_inference(model_id: str, request: Request):
+    body = await request.json()
+    error = await _begin("huggingface")
+    if error:
+        return error
+
+    tokens = _completion_tokens()
+    parameters = body.get("parameters") or {}
+    tokens = tokens[:max(1, int(parameters.get("max_new_tokens") or len(tokens)))]
+    await _generate(tokens)
+
+    text = " ".join(tokens)
+    # O AIClient espera o prompt repetido no início quando return_full_text=True
+    if parameters.get("return_full_text", True):
+        text = f"{body.get('inputs', '')}</s>{text}"
+    return [{"generated_text": text}]
+
+
+# ----------------------------------------------------------------------
+# Gemini (generateContent / streamGenerateContent)
+# ----------------------------------------------------------------------
+
+def _gemini_chunk(text: str, finish: bool, prompt_tokens: int, completion_tokens: int) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.post("/{version}/models/{model_action}")
+async def gemini_generate(version: str, model_action: str, request: Request):
+    model, _, action = model_action.partition(":")
+    body = await request.json()
+    error = await _begin("gemini")
+    if error:
+        return error
+
+    tokens = _completion_tokens()
+    generation_config = body.get("generationConfig") or {}
+    tokens = tokens[:max(1, int(generation_config.get("maxOutputTokens") or len(tokens)))]
+    prompt_tokens = _prompt_tokens(body.get("contents", []))
+
+    if action != "streamGenerateContent":
+        await _generate(tokens)
+        return _gemini_chunk(" ".join(tokens), True, prompt_tokens, len(tokens))
+
+    async def stream():
+        delay = config.token_delay()
+        for index, token in enumerate(tokens):
+            await asyncio.sleep(delay)
+            stats["tokens"] += 1
+            last = index == len(tokens) - 1
+            yield _sse(_gemini_chunk(token if index == 0 else " " + token, last, prompt_tokens, index + 1))
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+# ----------------------------------------------------------------------
+# Controle do mock
+# ----------------------------------------------------------------------
+
+@app.get("/_mock/stats")
+async def get_stats():
+    return {"config": config.to_dict(), **stats}
+
+
+@app.post("/_mock/config")
+async def update_config(request: Request):
+    """Troca latência, taxas de erro e vazão sem reiniciar (ex.: simular um pico de 429)."""
+    global config
+    body = await request.json()
+    current = config.to_dict()
+    errors = body.get("errors", current["errors"])
+    if isinstance(errors, dict):
+        errors = ",".join(f"{status}={rate}" for status, rate in errors.items())
+    config = MockConfig(
+        body.get("latency", current["latency"]),
+        errors,
+        float(body.get("tokens_per_second", current["tokens_per_second"])),
+        int(body.get("completion_tokens", current["completion_tokens"])),
+    )
+    return config.to_dict()
+
+
+@app.post("/_mock/reset")
+async def reset_stats():
+    stats.update({"requests": 0, "errors": {}, "tokens": 0, "by_api": {}})
+    return stats
+
+
+def main():
+    global config
+    parser = argparse.ArgumentParser(description="Servidor LLM falso (OpenRouter, Hugging Face e Gemini)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default=MOCK_LATENCY, help="ex.: fixed:0.2, uniform:0.1,0.8, lognormal:0.5,0.4")
+    parser.add_argument("--errors", default=MOCK_ERRORS, help="ex.: 402=0.01,429=0.05,500=0.02")
+    parser.add_argument("--tokens-per-second", type=float, default=MOCK_TOKENS_PER_SECOND)
+    parser.add_argument("--completion-tokens", type=int, default=MOCK_COMPLETION_TOKENS)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.errors, args.tokens_per_second, args.completion_tokens)
+
+    import uvicorn
+    print(f"🧪 Mock LLM em http://{args.host}:{args.port} ({json.dumps(config.to_dict())})")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services import ai_service as ai_module
+from services.ai_service import AIService, shared_ai_service
+
+def test_connection_check_is_cached():
+    service = AIService()
+    calls = []
+    service._test_api_connection = lambda: calls.append(1) or True
+
+    assert service.connection_status is None
+    assert service.check_connection() is True
+    assert service.check_connection() is True
+    assert len(calls) == 1
+
+    # force=True (usado pelo /debug/ai-status) sempre refaz o teste
+    service.check_connection(force=True)
+    assert len(calls) == 2
+
+def test_failed_connection_is_retried_after_short_ttl(monkeypatch):
+    monkeypatch.setattr(ai_module, "AI_CONNECTION_FAILURE_TTL", 0)
+    service = AIService()
+    calls = []
+    service._test_api_connection = lambda: calls.append(1) or False
+
+    assert service.check_connection() is False
+    assert service.check_connection() is False
+    assert len(calls) == 2
+
+def test_shared_service_is_a_singleton():
+    assert shared_ai_service() is shared_ai_service()
+
+def test_fallback_metric_counts_only_real_fallbacks(monkeypatch):
+    monkeypatch.setattr(ai_module, "MAX_RETRIES", 1)
+    service = AIService()
+    service.api_key = "teste"
+    service.check_connection = lambda force=False: True
+    service.available_models = ["modelo-a", "modelo-b"]
+
+    class Down:
+        def post(self, *args, **kwargs):
+            raise RuntimeError("provedor fora do ar")
+    service.http_client = Down()
+
+    result = service._call_openrouter_api({"messages": []})
+    assert result["model"] is None and result["attempts"] == 2
+
+    fallbacks = {key[-1]: value for key, value in ai_module.LLM_FALLBACKS._values.items()}
+    # modelo-a caiu para o modelo-b; depois do último não há para onde cair
+    assert fallbacks.get("modelo-a") == 1
+    assert "modelo-b" not in fallbacks
@@ -0,0 +1,96 @@
+import sys, os, sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.stats import install_stats, read_stats, recount_stats
+from services.archive import install_archive, archive_idle_conversations, rehydrate_conversation, compress, decompress
+
+def _connect():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE bots (id TEXT PRIMARY KEY)")
+    conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, bot_id TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute(
+        "CREATE TABLE messages (id TEXT PRIMARY KEY, conversation_id TEXT, content TEXT, is_user BOOLEAN, "
+        "created_at DATETIME DEFAULT CURRENT_TIMESTAMP, prompt_tokens INTEGER)"
+    )
+    conn.commit()
+    install_stats(conn)
+    install_archive(conn)
+    return conn
+
+def _add_conversation(conn, conversation_id, created_at, count=3):
+    conn.execute("INSERT INTO conversations (id, bot_id) VALUES (?, 'b1')", (conversation_id,))
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, content, is_user, created_at, prompt_tokens) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"{conversation_id}-{i}", conversation_id, f"mensagem {i} ✨", i % 2 == 0, created_at, i or None) for i in range(count)]
+    )
+    conn.commit()
+
+def _messages(conn, conversation_id):
+    rows = conn.execute("SELECT * FROM messages WHERE conversation_id = ? ORDER BY id", (conversation_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+def test_idle_conversation_is_archived_and_rehydrated_intact():
+    conn = _connect()
+    _add_conversation(conn, "old", "2020-01-01 10:00:00")
+    _add_conversation(conn, "recent", "2999-01-01 10:00:00")
+    original = _messages(conn, "old")
+
+    summary = archive_idle_conversations(conn, idle_days=30)
+    assert summary["conversations"] == 1 and summary["messages"] == 3
+    assert _messages(conn, "old") == []
+    assert len(_messages(conn, "recent")) == 3
+    stats = read_stats(conn)
+    assert (stats["messages"], stats["archived_messages"], stats["archived_conversations"]) == (3, 3, 1)
+
+    # Já arquivada: a próxima rodada não faz nada
+    assert archive_idle_conversations(conn, idle_days=30)["conversations"] == 0
+
+    assert rehydrate_conversation(conn, "old") is True
+    assert _messages(conn, "old") == original
+    assert conn.execute("SELECT archived_at FROM conversations WHERE id = 'old'").fetchone()[0] is None
+    stats = read_stats(conn)
+    assert (stats["messages"], stats["archived_messages"], stats["archived_conversations"]) == (6, 0, 0)
+    assert rehydrate_conversation(conn, "old") is False
+
+def test_rehydrate_joins_open_transaction():
+    conn = _connect()
+    _add_conversation(conn, "old", "2020-01-01 10:00:00")
+    archive_idle_conversations(conn, idle_days=30)
+
+    # Como no chat: a mensagem nova já foi inserida e a transação segue aberta
+    conn.execute("INSERT INTO messages (id, conversation_id, content, is_user) VALUES ('new', 'old', 'voltei', 1)")
+    assert rehydrate_conversation(conn, "old") is True
+    conn.rollback()
+    assert _messages(conn, "old") == []
+    assert conn.execute("SELECT archived_at FROM conversations WHERE id = 'old'").fetchone()[0] is not None
+
+def test_rehydrated_conversation_is_not_archived_again_right_away():
+    conn = _connect()
+    _add_conversation(conn, "old", "2020-01-01 10:00:00")
+    archive_idle_conversations(conn, idle_days=30)
+    assert rehydrate_conversation(conn, "old") is True
+
+    # Só lida: last_message_at continua antigo, mas a reidratação conta como atividade
+    assert archive_idle_conversations(conn, idle_days=30)["conversations"] == 0
+    assert len(_messages(conn, "old")) == 3
+
+    # Passada a janela desde a reidratação, volta a ser arquivável
+    conn.execute("UPDATE conversations SET rehydrated_at = '2020-02-01 10:00:00' WHERE id = 'old'")
+    conn.commit()
+    assert archive_idle_conversations(conn, idle_days=30)["conversations"] == 1
+
+def test_recount_includes_archived_messages():
+    conn = _connect()
+    _add_conversation(conn, "old", "2020-01-01 10:00:00", count=5)
+    archive_idle_conversations(conn, idle_days=30)
+    conn.execute("UPDATE stats SET value = 0")
+    conn.commit()
+    stats = recount_stats(conn)
+    assert stats["archived_messages"] == 5 and stats["archived_conversations"] == 1
+
+def test_gzip_roundtrip():
+    data = ("histórico " * 1000).encode("utf-8")
+    packed = compress(data, "gzip")
+    assert len(packed) < len(data) / 10
+    assert decompress(packed, "gzip") == data
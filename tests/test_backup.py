@@ -0,0 +1,80 @@
+import sys, os, gzip, time, sqlite3, threading
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.backup import backup_database, copy_database, list_backups
+
+def _database(path, journal_mode):
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, content TEXT)")
+    conn.executemany("INSERT INTO messages (content) VALUES (?)", [("x" * 1000,) for _ in range(1000)])
+    conn.commit()
+    return conn
+
+class _Writer(threading.Thread):
+    """Outra conexão escrevendo sem parar enquanto a cópia roda."""
+
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.stop = threading.Event()
+        self.writes = 0
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        while not self.stop.is_set():
+            conn.execute("INSERT INTO messages (content) VALUES ('nova')")
+            conn.commit()
+            self.writes += 1
+            time.sleep(0.001)
+        conn.close()
+
+def _copy_while_writing(source, target, **options):
+    writer = _Writer(source)
+    writer.start()
+    while not writer.writes:
+        time.sleep(0.001)
+    try:
+        return copy_database(source, target, **options), writer
+    finally:
+        writer.stop.set()
+        writer.join()
+
+def test_wal_snapshot_is_pinned_and_writers_keep_going(tmp_path):
+    source = str(tmp_path / "cringe.db")
+    _database(source, "wal").close()
+
+    report, writer = _copy_while_writing(source, str(tmp_path / "copia.db"), pages=10, sleep=0.005)
+    assert report["snapshot_pinned"] and report["restarts"] == 0 and report["steps"] > 1
+    copy = sqlite3.connect(str(tmp_path / "copia.db"))
+    assert copy.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    # Snapshot do início da cópia; as escritas concorrentes continuaram
+    assert 1000 <= copy.execute("SELECT COUNT(*) FROM messages").fetchone()[0] < 1000 + writer.writes
+    assert writer.writes > report["steps"]
+
+def test_rollback_journal_falls_back_to_single_step(tmp_path):
+    source = str(tmp_path / "cringe.db")
+    _database(source, "delete").close()
+
+    report, _ = _copy_while_writing(source, str(tmp_path / "copia.db"), pages=10, sleep=0.005, max_restarts=2)
+    assert not report["snapshot_pinned"]
+    assert report["restarts"] == 3 and report["single_step_fallback"]
+    copy = sqlite3.connect(str(tmp_path / "copia.db"))
+    assert copy.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    assert copy.execute("SELECT COUNT(*) FROM messages").fetchone()[0] > 1000
+
+def test_compressed_snapshots_are_rotated(tmp_path):
+    source = str(tmp_path / "cringe.db")
+    _database(source, "delete").close()
+    directory = str(tmp_path / "backups")
+
+    reports = [backup_database(source, directory, compression="gzip", keep=2, sleep=0) for _ in range(3)]
+    assert reports[-1]["rotated"] == [os.path.basename(reports[0]["path"])]
+    assert [entry["path"] for entry in list_backups(source, directory)] == [reports[2]["path"], reports[1]["path"]]
+    assert reports[-1]["stored_bytes"] < reports[-1]["raw_bytes"]
+
+    restored = str(tmp_path / "restaurado.db")
+    with gzip.open(reports[-1]["path"], "rb") as compressed, open(restored, "wb") as out:
+        out.write(compressed.read())
+    assert sqlite3.connect(restored).execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 1000
+    assert sorted(os.listdir(directory)) == sorted(os.path.basename(r["path"]) for r in reports[1:])
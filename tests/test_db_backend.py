@@ -0,0 +1,103 @@
+import sys, os, sqlite3
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services import db_backend
+from services.db_backend import PostgresConnection, PostgresRow, translate_sql, sqlalchemy_engine_options
+
+def test_translate_sql_rewrites_placeholders_outside_literals():
+    assert translate_sql("SELECT * FROM bots WHERE id = ? AND name = '?'") == \
+        "SELECT * FROM bots WHERE id = %s AND name = '?'"
+    assert translate_sql("SELECT * FROM bots WHERE name LIKE 'a%' AND id = ?") == \
+        "SELECT * FROM bots WHERE name LIKE 'a%%' AND id = %s"
+    # Sem parâmetros o psycopg2 não interpola: "%" fica como está
+    assert translate_sql("SELECT 10 % 3", has_parameters=False) == "SELECT 10 % 3"
+
+def test_postgres_row_behaves_like_sqlite_row():
+    row = PostgresRow(("b1", "Pip"), {"id": 0, "name": 1})
+    assert row["name"] == "Pip" and row[0] == "b1"
+    assert dict(row) == {"id": "b1", "name": "Pip"}
+    assert row == ("b1", "Pip") and list(row) == ["b1", "Pip"]
+
+def _psycopg2_interpolate(sql, parameters):
+    """O que o psycopg2 faz no cliente: formatação "%" do Python com os valores já citados."""
+    def quote(value):
+        if value is None:
+            return "NULL"
+        if isinstance(value, (int, float)):
+            return repr(value)
+        return "'" + str(value).replace("'", "''") + "'"
+    return sql % tuple(quote(value) for value in parameters)
+
+# Comandos com as armadilhas que translate_sql trata: "?" e "%" em literais e comentários
+TRANSLATED_STATEMENTS = [
+    ("INSERT INTO bots (id, name, tags) VALUES (?, ?, ?)", ("b3", "100% O'Brien ?", '["%s"]')),
+    ("SELECT id FROM bots WHERE name LIKE 'P%' AND id = ?", ("b1",)),
+    ("SELECT id, name FROM bots WHERE name = '?' OR id = ? ORDER BY id", ("b2",)),
+    ("SELECT id FROM bots -- 100% dos bots? sim\nWHERE name LIKE ? || '%' ORDER BY id", ("P",)),
+    ("SELECT 10 % 3, ? || '%', name FROM bots WHERE id = ?", ("50", "b3")),
+    ("UPDATE bots SET tags = ? WHERE tags LIKE '%\"%s\"%' AND id = ?", ("[]", "b3")),
+    ("SELECT id, tags FROM bots ORDER BY id", ()),
+]
+
+def test_translated_statements_run_like_the_originals():
+    def connect():
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE bots (id TEXT PRIMARY KEY, name TEXT, tags TEXT)")
+        conn.executemany("INSERT INTO bots VALUES (?, ?, '[]')", [("b1", "Pip"), ("b2", "?")])
+        return conn
+
+    original, translated = connect(), connect()
+    for sql, parameters in TRANSLATED_STATEMENTS:
+        expected = original.execute(sql, parameters).fetchall()
+        statement = translate_sql(sql, bool(parameters))
+        if parameters:
+            statement = _psycopg2_interpolate(statement, parameters)
+        assert translated.execute(statement).fetchall() == expected, sql
+    assert translated.execute("SELECT * FROM bots ORDER BY id").fetchall() == \
+        original.execute("SELECT * FROM bots ORDER BY id").fetchall()
+
+def test_commands_without_parameters_are_not_translated():
+    # Sem parâmetros o psycopg2 não interpola: o operador jsonb "?" e o "%" passam intactos
+    sql = "SELECT tags::jsonb ? 'rpg', 10 % 3 FROM bots"
+    assert translate_sql(sql, has_parameters=False) == sql
+
+def test_postgres_connection_returns_to_the_engine_pool(tmp_path):
+    from sqlalchemy import create_engine, exc
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=0, pool_timeout=0.05)
+    setup = engine.raw_connection()
+    setup.cursor().execute("CREATE TABLE t (id INTEGER)")
+    setup.commit()
+    setup.close()
+
+    conn = PostgresConnection(engine.raw_connection())
+    conn.raw.cursor().execute("INSERT INTO t VALUES (1)")
+    assert engine.pool.checkedout() == 1
+    # Pool de uma conexão: o próximo empréstimo espera pool_timeout e desiste
+    with pytest.raises(exc.TimeoutError):
+        engine.raw_connection()
+
+    conn.close()  # sem commit: o INSERT é desfeito e a conexão volta ao pool
+    conn.close()
+    assert engine.pool.checkedout() == 0
+    reused = engine.raw_connection()
+    assert reused.cursor().execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
+    reused.close()
+
+def test_sqlalchemy_options_carry_pool_settings_for_postgres():
+    options = sqlalchemy_engine_options("postgresql://u:p@db/cringe")
+    assert {"pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"} <= set(options)
+    assert "statement_timeout" in options["connect_args"].get("options", "statement_timeout")
+    assert sqlalchemy_engine_options("sqlite:///./sql_app.db") == {"connect_args": {"check_same_thread": False}}
+
+def test_local_stores_default_to_the_api_database(monkeypatch):
+    monkeypatch.delenv("JOB_QUEUE_DB_PATH", raising=False)
+    monkeypatch.setattr(db_backend, "SQLITE_PATH", "/data/api.db")
+    monkeypatch.setattr(db_backend, "DB_BACKEND", "sqlite")
+    assert db_backend.local_store_path("JOB_QUEUE_DB_PATH") == "/data/api.db"
+
+    # Postgres: sem caminho explícito não há arquivo local (o store fica desligado)
+    monkeypatch.setattr(db_backend, "DB_BACKEND", "postgres")
+    assert db_backend.local_store_path("JOB_QUEUE_DB_PATH") is None
+    monkeypatch.setenv("JOB_QUEUE_DB_PATH", "/data/jobs.db")
+    assert db_backend.local_store_path("JOB_QUEUE_DB_PATH") == "/data/jobs.db"
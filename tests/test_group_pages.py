@@ -0,0 +1,156 @@
+import sys, os
+import sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database import get_db
+from models import Bot
+from routers import groups
+from services.job_queue import worker_pool
+from services.migrations import ORM_MIGRATIONS, run_migrations
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "test_group_pages.db")
+
+
+@pytest.fixture
+def session_factory():
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    # O schema vem das mesmas migrações do startup (init_orm_db)
+    conn = sqlite3.connect(DB_PATH)
+    run_migrations(conn, ORM_MIGRATIONS)
+    conn.close()
+
+    engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    bots = [Bot(id=f"bot-{n}", name=f"Bot {n}", system_prompt="Você é um bot.") for n in range(3)]
+    db.add_all(bots)
+    for n in range(7):
+        db.add(groups.Group(name=f"Grupo {n}", scenario="Taverna", bots=bots[: n % 3 + 1]))
+    db.commit()
+    db.close()
+    yield factory
+    engine.dispose()
+    os.remove(DB_PATH)
+
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(groups.router)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def _count_queries(session_factory):
+    statements = []
+    event.listen(session_factory.kw["bind"], "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_group_pages_round_trip_through_cursor(client):
+    ids, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 3} if cursor is None else {"limit": 3, "after": cursor}
+        response = client.get("/groups/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 3
+        ids.extend(group["id"] for group in page)
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        assert int(cursor) == page[-1]["id"]
+
+    assert pages == 3
+    assert ids == sorted(ids) and len(ids) == len(set(ids)) == 7
+
+
+def test_groups_without_limit_returns_every_group(client):
+    response = client.get("/groups/")
+    assert len(response.json()) == 7
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_limit_is_clamped(client):
+    response = client.get("/groups/", params={"limit": 1})
+    assert len(response.json()) == 1
+    assert response.headers["X-Next-Cursor"] == str(response.json()[0]["id"])
+    response = client.get("/groups/", params={"limit": groups.PAGE_SIZE_MAX + 1})
+    assert len(response.json()) == 7
+    assert groups._page_size(groups.PAGE_SIZE_MAX + 1, None, 50) == groups.PAGE_SIZE_MAX
+
+
+def test_group_page_loads_bots_in_constant_queries(client, session_factory):
+    statements = _count_queries(session_factory)
+    page = client.get("/groups/", params={"limit": 6}).json()
+
+    # Uma query para os grupos e uma (selectinload) para os bots de todos eles
+    assert len(statements) == 2
+    assert [len(group["bots"]) for group in page] == [1, 2, 3, 1, 2, 3]
+
+
+def test_message_pages_walk_back_in_chronological_chunks(client, session_factory):
+    db = session_factory()
+    for n in range(5):
+        db.add(groups.Message(group_id=1, sender_id="user-1", text=f"msg {n}"))
+    db.commit()
+    db.close()
+
+    first = client.get("/groups/1/messages", params={"limit": 3})
+    assert [m["text"] for m in first.json()] == ["msg 2", "msg 3", "msg 4"]
+    statements = _count_queries(session_factory)
+    second = client.get("/groups/1/messages", params={"limit": 3, "before": first.headers["X-Next-Cursor"]})
+    assert [m["text"] for m in second.json()] == ["msg 0", "msg 1"]
+    assert "X-Next-Cursor" not in second.headers
+    # Existência do grupo + a página
+    assert len(statements) == 2
+    assert [m["text"] for m in client.get("/groups/1/messages").json()] == [f"msg {n}" for n in range(5)]
+
+def test_group_message_job_saves_both_messages(session_factory, monkeypatch):
+    monkeypatch.setattr(groups, "SessionLocal", session_factory)
+    monkeypatch.setattr(groups, "get_gemini_client", lambda: None)
+    handler, provider = worker_pool._handlers["group_message"]
+
+    result = handler({"group_id": 2, "sender_id": "user-1", "text": "Olá, taverneiro"})
+
+    assert provider == "gemini"
+    assert result["status"] == "Message and response received"
+    db = session_factory()
+    saved = db.query(groups.Message).filter(groups.Message.group_id == 2).order_by(groups.Message.id).all()
+    assert [m.sender_id for m in saved] == ["user-1", "bot-bot-0"]
+    db.close()
+
+
+def test_group_turn_is_written_in_one_commit(session_factory, monkeypatch):
+    monkeypatch.setattr(groups, "get_gemini_client", lambda: None)
+    db = session_factory()
+    commits = []
+    event.listen(db, "after_commit", lambda session: commits.append(session))
+    statements = _count_queries(session_factory)
+
+    result = groups.process_group_message(
+        groups.MessageSend(group_id=3, sender_id="user-1", text="Uma rodada para todos"), db
+    )
+    db.close()
+
+    assert len(commits) == 1
+    # Ids lidos no flush: o turno termina nos INSERTs, sem SELECT de refresh
+    assert [s.split()[0] for s in statements[-2:]] == ["INSERT", "INSERT"]
+    assert result["bot_message_id"] == result["user_message_id"] + 1
@@ -0,0 +1,40 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.history_cache import HistoryCache
+
+def _history(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"mensagem {i}"} for i in range(n)]
+
+def test_window_keeps_last_messages_write_through():
+    cache = HistoryCache(window=4, max_bytes=1 << 20)
+    assert cache.get("c1") is None
+
+    cache.put("c1", _history(6))
+    cache.append_turn("c1", "pergunta", "resposta")
+    history = cache.get("c1")
+    assert [m["content"] for m in history] == ["mensagem 4", "mensagem 5", "pergunta", "resposta"]
+    assert history[-2]["role"] == "user" and history[-1]["role"] == "assistant"
+    # Cópia: quem monta o prompt pode acrescentar sem mexer na cache
+    history.append({"role": "user", "content": "x"})
+    assert len(cache.get("c1")) == 4
+
+def test_only_complete_windows_enter_the_cache():
+    cache = HistoryCache(window=4, max_bytes=1 << 20)
+    cache.append_turn("antiga", "oi", "olá")
+    assert cache.get("antiga") is None
+    cache.append_turn("nova", "oi", "olá", new_conversation=True)
+    assert len(cache.get("nova")) == 2
+    cache.invalidate("nova")
+    assert cache.get("nova") is None and cache.status()["bytes"] == 0
+
+def test_byte_cap_evicts_least_recently_used():
+    cache = HistoryCache(window=4, max_bytes=10_000)
+    big = [{"role": "user", "content": "x" * 3000}]
+    for conversation_id in ("a", "b", "c"):
+        cache.put(conversation_id, big)
+    cache.get("a")  # "a" passa a ser a mais recente
+    cache.put("d", big)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("d") is not None
+    assert cache.status()["bytes"] <= 10_000
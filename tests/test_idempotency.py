@@ -0,0 +1,132 @@
+import sys, os
+import time
+import threading
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services import idempotency
+from services.idempotency import IdempotencyStore, SingleFlight, run_idempotent, derive_idempotency_key
+
+def setup_function(function):
+    idempotency.idempotency_store = IdempotencyStore(os.path.join(os.path.dirname(__file__), "test_idempotency.db"))
+    idempotency.single_flight = SingleFlight()
+
+def teardown_function(function):
+    path = idempotency.idempotency_store.db_path
+    if os.path.exists(path):
+        os.remove(path)
+
+def test_concurrent_duplicates_share_one_generation():
+    calls = []
+    key = derive_idempotency_key("chat", "bot-1", "conv-1", "hash")
+
+    def generate():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"response": "olá"}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(run_idempotent(key, "chat", generate)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(result == {"response": "olá"} for result, _ in results)
+    assert sum(1 for _, replayed in results if replayed) == 4
+
+def test_late_duplicate_gets_stored_result():
+    calls = []
+    key = derive_idempotency_key("chat", "bot-1", "client-key")
+
+    def generate():
+        calls.append(1)
+        return {"response": f"resposta {len(calls)}"}
+
+    first, first_replayed = run_idempotent(key, "chat", generate)
+    second, second_replayed = run_idempotent(key, "chat", generate)
+
+    assert len(calls) == 1
+    assert first == second == {"response": "resposta 1"}
+    assert not first_replayed and second_replayed
+
+def test_expired_keys_are_not_replayed():
+    calls = []
+    key = derive_idempotency_key("chat", "bot-1", "expira")
+
+    def generate():
+        calls.append(1)
+        return {"response": "ok"}
+
+    run_idempotent(key, "chat", generate, ttl=0)
+    run_idempotent(key, "chat", generate, ttl=0)
+
+    assert len(calls) == 2
+
+def test_failed_generation_is_not_replayed():
+    calls = []
+    key = derive_idempotency_key("chat", "bot-1", "client-key")
+
+    def generate():
+        calls.append(1)
+        # Primeira chamada: todos os modelos falharam (model=None); o retry já funciona
+        model = None if len(calls) == 1 else "gpt-4o-mini"
+        return {"response": f"resposta {len(calls)}", "model": model}
+
+    succeeded = lambda result: result["model"] is not None
+    first, first_replayed = run_idempotent(key, "chat", generate, store_if=succeeded)
+    second, second_replayed = run_idempotent(key, "chat", generate, store_if=succeeded)
+    third, third_replayed = run_idempotent(key, "chat", generate, store_if=succeeded)
+
+    assert len(calls) == 2
+    assert first["model"] is None and not first_replayed
+    assert second == third == {"response": "resposta 2", "model": "gpt-4o-mini"}
+    assert not second_replayed and third_replayed
+
+def test_bots_router_does_not_store_fallback_replies(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from database import Base, get_db
+    from models import Bot
+    from routers import bots
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine, tables=[Bot.__table__])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(Bot(id="bot-1", name="Luma", system_prompt="Você é a Luma.", ai_config_json="{}"))
+    db.commit()
+    db.close()
+
+    calls = []
+
+    class FlakyAIService:
+        def generate_response_detailed(self, **kwargs):
+            calls.append(1)
+            # Primeira chamada: todos os modelos falharam
+            if len(calls) == 1:
+                return {"content": "Todos os modelos falharam", "model": None}
+            return {"content": "Olá, viajante.", "model": "gpt-4o-mini"}
+
+    monkeypatch.setattr(bots, "get_ai_service", lambda: FlakyAIService())
+    app = FastAPI()
+    app.include_router(bots.router)
+    app.dependency_overrides[get_db] = lambda: factory()
+    client = TestClient(app)
+
+    body = {"user_message": "oi", "chat_history": []}
+    headers = {"Idempotency-Key": "turno-1"}
+    first = client.post("/bots/chat/bot-1", json=body, headers=headers)
+    second = client.post("/bots/chat/bot-1", json=body, headers=headers)
+    third = client.post("/bots/chat/bot-1", json=body, headers=headers)
+
+    assert len(calls) == 2
+    assert first.json()["ai_response"] != "Olá, viajante." and "Idempotent-Replayed" not in first.headers
+    assert second.json() == third.json() == {"ai_response": "Olá, viajante."}
+    assert third.headers["Idempotent-Replayed"] == "true"
@@ -0,0 +1,165 @@
+import sys, os
+import time
+import threading
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.job_queue import JobQueue, JobWorkerPool
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "test_job_queue.db")
+
+def setup_function(function):
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+
+def teardown_function(function):
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+
+def test_jobs_survive_restart():
+    queue = JobQueue(DB_PATH)
+    queue.init_table()
+    job, created = queue.enqueue("chat", {"message": "oi"}, provider="openrouter")
+    assert created
+
+    # Simula um worker que caiu no meio da execução
+    claimed = queue.claim([])
+    assert claimed["job_id"] == job["job_id"]
+    assert queue.get(job["job_id"])["status"] == "running"
+
+    restarted = JobQueue(DB_PATH)
+    assert restarted.recover() == 1
+    assert restarted.get(job["job_id"])["status"] == "queued"
+
+def test_duplicate_job_id_returns_existing_job():
+    queue = JobQueue(DB_PATH)
+    queue.init_table()
+    first, created_first = queue.enqueue("chat", {"message": "oi"}, provider="openrouter", job_id="abc")
+    second, created_second = queue.enqueue("chat", {"message": "oi"}, provider="openrouter", job_id="abc")
+    assert created_first and not created_second
+    assert first["job_id"] == second["job_id"]
+
+def test_worker_pool_respects_provider_limit():
+    queue = JobQueue(DB_PATH)
+    queue.init_table()
+    pool = JobWorkerPool(queue, workers=4, provider_limits={"openrouter": 1})
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def handler(payload):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return {"echo": payload["n"]}
+
+    pool.register_handler("chat", handler, provider="openrouter")
+    jobs = [queue.enqueue("chat", {"n": n}, provider="openrouter")[0] for n in range(4)]
+    pool.start()
+    try:
+        results = [queue.wait(job["job_id"], timeout=5) for job in jobs]
+    finally:
+        pool.stop()
+
+    assert [r["result"]["echo"] for r in results] == [0, 1, 2, 3]
+    assert max(peak) == 1
+
+def test_depth_is_tracked_in_memory():
+    queue = JobQueue(DB_PATH)
+    queue.init_table()
+    first, _ = queue.enqueue("chat", {"message": "1"}, provider="openrouter")
+    second, _ = queue.enqueue("chat", {"message": "2"}, provider="openrouter")
+    queue.enqueue("chat", {"message": "1"}, provider="openrouter", job_id=first["job_id"])
+    assert queue.depth() == 2
+
+    queue.claim([])
+    queue.fail(first["job_id"], "timeout", retry=True)  # volta para a fila: continua contando
+    assert queue.depth() == 2
+    queue.claim([])
+    queue.complete(first["job_id"], {"response": "ok"})
+    assert queue.depth() == 1
+
+    # Job enfileirado por outro processo: só aparece na ressincronização com o banco
+    JobQueue(DB_PATH).enqueue("chat", {"message": "3"}, provider="openrouter")
+    assert queue.depth() == 1
+    assert queue.refresh_depth() == 2 and queue.depth() == 2
+
+def test_finished_jobs_are_purged_after_ttl():
+    queue = JobQueue(DB_PATH)
+    queue.init_table()
+    done, _ = queue.enqueue("chat", {"n": 1}, provider="openrouter")
+    failed, _ = queue.enqueue("chat", {"n": 2}, provider="openrouter")
+    pending, _ = queue.enqueue("chat", {"n": 3}, provider="openrouter")
+    queue.claim([])
+    queue.complete(done["job_id"], {"response": "ok"})
+    queue.claim([])
+    queue.fail(failed["job_id"], "erro")
+
+    # Dentro do TTL o resultado continua consultável
+    assert queue.purge_finished(ttl=3600) == 0
+    time.sleep(0.01)
+    assert queue.purge_finished(ttl=0, batch_size=1) == 2
+    assert queue.get(done["job_id"]) is None and queue.get(failed["job_id"]) is None
+    assert queue.get(pending["job_id"])["status"] == "queued"
+
+def test_worker_survives_database_errors(monkeypatch):
+    import sqlite3
+    from services import job_queue as job_queue_module
+    monkeypatch.setattr(job_queue_module, "JOB_ERROR_BACKOFF_SECONDS", 0.01)
+    queue = JobQueue(DB_PATH)
+    queue.init_table()
+    pool = JobWorkerPool(queue, workers=1)
+    pool.register_handler("chat", lambda payload: {"echo": payload["n"]}, provider="openrouter")
+
+    claim = queue.claim
+    failures = []
+
+    def flaky_claim(excluded):
+        # O primeiro claim encontra o banco travado
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return claim(excluded)
+
+    monkeypatch.setattr(queue, "claim", flaky_claim)
+    job, _ = queue.enqueue("chat", {"n": 7}, provider="openrouter")
+    pool.start()
+    try:
+        finished = queue.wait(job["job_id"], timeout=5)
+    finally:
+        pool.stop()
+
+    assert failures == [1]
+    assert finished["status"] == "done" and finished["result"]["echo"] == 7
+
+def test_server_errors_are_retried_and_client_errors_are_not():
+    from fastapi import HTTPException
+    queue = JobQueue(DB_PATH)
+    queue.init_table()
+    pool = JobWorkerPool(queue, workers=1)
+    attempts = {"server": 0, "client": 0}
+
+    def handler(payload):
+        attempts[payload["kind"]] += 1
+        # process_chat_turn embrulha a falha do LLM em HTTPException(500)
+        if payload["kind"] == "server" and attempts["server"] < 2:
+            raise HTTPException(status_code=500, detail="Erro ao gerar resposta")
+        if payload["kind"] == "client":
+            raise HTTPException(status_code=404, detail="Bot não encontrado")
+        return {"ok": True}
+
+    pool.register_handler("chat", handler, provider="openrouter")
+    server, _ = queue.enqueue("chat", {"kind": "server"}, provider="openrouter")
+    client, _ = queue.enqueue("chat", {"kind": "client"}, provider="openrouter")
+    pool.start()
+    try:
+        server_job = queue.wait(server["job_id"], timeout=5)
+        client_job = queue.wait(client["job_id"], timeout=5)
+    finally:
+        pool.stop()
+
+    assert server_job["status"] == "done" and attempts["server"] == 2
+    assert client_job["status"] == "failed" and attempts["client"] == 1
@@ -0,0 +1,56 @@
+import sys, os, io, json, logging
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services import logging_config
+from services.logging_config import JsonFormatter, SamplingFilter, parse_sample_rates
+
+def _record(name="main", level=logging.INFO, msg="olá %s", args=("mundo",), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_layout_includes_extra_fields():
+    line = JsonFormatter().format(_record(conversation_id="c1", _privado="x", duration_ms=12.5))
+    entry = json.loads(line)
+    assert entry["msg"] == "olá mundo" and entry["level"] == "INFO" and entry["logger"] == "main"
+    assert entry["ts"].endswith("+00:00") and "thread" in entry
+    assert entry["conversation_id"] == "c1" and entry["duration_ms"] == 12.5
+    # Atributos padrão do LogRecord e campos privados não vazam para o JSON
+    assert "_privado" not in entry and "args" not in entry and "levelno" not in entry
+
+def test_sampling_drops_debug_but_never_warnings():
+    sampling = SamplingFilter(parse_sample_rates("services=1, services.ai_service=0, lixo"))
+    assert not sampling.filter(_record("services.ai_service", logging.DEBUG))
+    assert not sampling.filter(_record("services.ai_service.http", logging.INFO))
+    assert sampling.filter(_record("services.ai_service", logging.WARNING))
+    assert sampling.filter(_record("services.ai_service", logging.ERROR))
+    # Prefixo mais longo vence; loggers sem regra não são amostrados
+    assert sampling.filter(_record("services.job_queue", logging.DEBUG))
+    assert sampling.filter(_record("main", logging.DEBUG))
+
+def test_queue_handler_defers_formatting_and_flushes_on_shutdown(monkeypatch):
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    stderr = io.StringIO()
+    monkeypatch.setattr(sys, "stderr", stderr)
+    monkeypatch.setattr(logging_config, "_listener", None)
+    try:
+        logging_config.setup_logging(level="DEBUG", log_format="json", sample_rates="")
+        [handler] = root.handlers
+        record = _record()
+        assert handler.prepare(record) is record and record.args == ("mundo",)
+
+        logger = logging.getLogger("teste.fila")
+        for i in range(200):
+            logger.info("mensagem %s", i, extra={"seq": i})
+        logging_config.shutdown_logging()
+    finally:
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
+
+    entries = [json.loads(line) for line in stderr.getvalue().splitlines()]
+    assert [entry["seq"] for entry in entries if entry["logger"] == "teste.fila"] == list(range(200))
+    assert logging_config._listener is None
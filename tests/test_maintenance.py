@@ -0,0 +1,80 @@
+import sys, os, sqlite3
+from datetime import datetime, timezone
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.maintenance import MaintenanceScheduler, maintain_database, parse_window, in_window
+
+def _database(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id TEXT, content TEXT)")
+    conn.execute("CREATE INDEX idx_messages_conversation ON messages (conversation_id)")
+    conn.executemany("INSERT INTO messages (conversation_id, content) VALUES (?, ?)",
+                     [(f"c{i % 10}", "x" * 1000) for i in range(500)])
+    conn.commit()
+    conn.execute("DELETE FROM messages WHERE id > 100")
+    conn.commit()
+    conn.close()
+
+def test_window_parsing_wraps_midnight():
+    assert parse_window("") is None
+    window = parse_window("23:00-02:00")
+    assert in_window(window, datetime(2024, 1, 1, 23, 30, tzinfo=timezone.utc))
+    assert in_window(window, datetime(2024, 1, 1, 1, 59, tzinfo=timezone.utc))
+    assert not in_window(window, datetime(2024, 1, 1, 2, 0, tzinfo=timezone.utc))
+    with pytest.raises(ValueError):
+        parse_window("25:00-01:00")
+
+def test_run_analyzes_checkpoints_and_reclaims_space(tmp_path):
+    path = str(tmp_path / "cringe.db")
+    _database(path)
+
+    report = maintain_database(path, time_budget=10)
+    steps = report["steps"]
+    assert all(step["result"] == "ok" for step in steps.values())
+    assert steps["optimize"]["analyze"] == "full"
+    assert steps["checkpoint"]["journal_mode"] == "wal" and steps["checkpoint"]["truncated"]
+    assert steps["vacuum"]["pages_freed"] > 0
+    assert report["after"]["free_pages"] == 0 and report["after"]["wal_bytes"] == 0
+    assert report["after"]["pages"] < report["before"]["pages"]
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+    conn.close()
+    # Com estatísticas já existentes, a próxima rodada usa só o PRAGMA optimize
+    assert maintain_database(path, time_budget=10)["steps"]["optimize"]["analyze"] == "optimize"
+
+def test_auto_vacuum_conversion_is_opt_in_and_rechecked(tmp_path):
+    path = str(tmp_path / "legado.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, content TEXT)")
+    conn.commit()
+    conn.close()
+
+    report = maintain_database(path, time_budget=10, convert_auto_vacuum=False)
+    assert "auto_vacuum" not in report["steps"] and not report["steps"]["vacuum"]["auto_vacuum"]
+
+    report = maintain_database(path, time_budget=10, convert_auto_vacuum=True)
+    assert report["steps"]["auto_vacuum"]["converted"] and report["steps"]["vacuum"]["auto_vacuum"]
+    # Já convertido: a próxima janela só confere o modo
+    report = maintain_database(path, time_budget=10, convert_auto_vacuum=True)
+    step = report["steps"]["auto_vacuum"]
+    assert step["incremental"] and not step["converted"]
+
+def test_scheduler_respects_interval_traffic_and_missing_files(tmp_path):
+    path = str(tmp_path / "cringe.db")
+    _database(path)
+    busy = {"value": True}
+    scheduler = MaintenanceScheduler(databases=lambda: [path, str(tmp_path / "nao-existe.db")],
+                                     window="", busy=lambda: busy["value"])
+
+    assert scheduler.run_once() == []
+    busy["value"] = False
+    reports = scheduler.run_once()
+    assert [report["database"] for report in reports] == [path]
+    assert not os.path.exists(tmp_path / "nao-existe.db")
+    assert scheduler.run_once() == []  # intervalo ainda não venceu
+    assert len(scheduler.run_once(force=True)) == 1
+    assert scheduler.status()["reports"][0]["database"] == path
@@ -0,0 +1,120 @@
+import sys, os
+import re
+import sqlite3
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.metrics import Counter, Histogram, Registry, registry, CHAT_LATENCY
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)', lambda m: {"n": "\n"}.get(m.group(1), m.group(1)), value)
+
+
+def parse_exposition(text):
+    """Parser mínimo do formato texto do Prometheus: {família: {"type", "help", "samples"}}."""
+    assert text.endswith("\n")
+    families, family_name = {}, None
+    for line in text.splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            _, keyword, name, rest = line.split(" ", 3)
+            family_name = name
+            families.setdefault(name, {"samples": []})[keyword.lower()] = rest
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"linha inválida: {line!r}"
+        name, raw_labels, value = match.groups()
+        labels = {}
+        if raw_labels:
+            consumed = 0
+            for label in LABEL.finditer(raw_labels):
+                assert label.start() == consumed, f"labels inválidos: {raw_labels!r}"
+                labels[label.group(1)] = _unescape(label.group(2))
+                consumed = label.end()
+            assert consumed == len(raw_labels), f"labels inválidos: {raw_labels!r}"
+        # Toda amostra pertence à família do último HELP/TYPE
+        assert family_name and name.startswith(family_name)
+        families[family_name]["samples"].append((name, labels, float(value)))
+    return families
+
+
+def test_label_values_and_help_are_escaped():
+    metrics = Registry()
+    counter = metrics.register(Counter("test_total", "Linha 1\nLinha \\2", ("bot",)))
+    tricky = 'Pip "a fada"\\n\nfim'
+    counter.inc(bot=tricky)
+
+    family = parse_exposition(metrics.expose())["test_total"]
+    assert family["type"] == "counter"
+    assert family["help"] == "Linha 1\\nLinha \\\\2"
+    assert family["samples"] == [("test_total", {"bot": tricky}, 1.0)]
+
+
+def test_histogram_buckets_are_cumulative_and_end_at_inf():
+    metrics = Registry()
+    histogram = metrics.register(Histogram("test_seconds", "Latência", ("route",), buckets=(0.1, 0.5, 1.0)))
+    for value in (0.05, 0.1, 0.3, 0.7, 3.0):
+        histogram.observe(value, route="/chat")
+
+    samples = parse_exposition(metrics.expose())["test_seconds"]["samples"]
+    buckets = [(labels["le"], value) for name, labels, value in samples if name == "test_seconds_bucket"]
+    # O limite é inclusivo (le): 0.1 cai no bucket 0.1
+    assert buckets == [("0.1", 2), ("0.5", 3), ("1", 4), ("+Inf", 5)]
+    totals = {name: value for name, labels, value in samples if name != "test_seconds_bucket"}
+    assert totals["test_seconds_count"] == buckets[-1][1] == 5
+    assert totals["test_seconds_sum"] == pytest.approx(4.15)
+
+
+def test_registry_exposition_parses():
+    CHAT_LATENCY.observe(0.2, bot="b1", model="m1", outcome="ok")
+    families = parse_exposition(registry.expose())
+    assert all("help" in family and "type" in family for family in families.values())
+    labels = [labels for name, labels, _ in families["cringe_chat_request_duration_seconds"]["samples"]]
+    assert {"bot": "b1", "model": "m1", "outcome": "ok", "le": "+Inf"} in labels
+
+
+def _chat_latency_count(**labels):
+    families = parse_exposition(registry.expose())
+    for name, sample_labels, value in families["cringe_chat_request_duration_seconds"]["samples"]:
+        if name.endswith("_count") and all(sample_labels.get(k) == v for k, v in labels.items()):
+            return value
+    return 0
+
+
+def test_chat_latency_is_observed_for_failed_turns(tmp_path, monkeypatch):
+    import main
+    from fastapi import HTTPException
+    from services.migrations import API_MIGRATIONS, run_migrations
+    db_path = str(tmp_path / "chat.db")
+    conn = sqlite3.connect(db_path)
+    run_migrations(conn, API_MIGRATIONS)
+    conn.execute(
+        "INSERT INTO bots (id, creator_id, name, gender, introduction, personality, welcome_message, avatar_url, "
+        "tags, conversation_context, context_images, system_prompt, ai_config) "
+        "VALUES ('metrics-bot', 'u', 'Luma', 'f', '', '', '', '', '[]', '', '[]', 'Você é a Luma.', '{}')"
+    )
+    conn.commit()
+    conn.close()
+
+    def connect():
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    class DownAIService:
+        def generate_response_detailed(self, **kwargs):
+            raise RuntimeError("provedor fora do ar")
+
+    monkeypatch.setattr(main, "get_db_connection", connect)
+    monkeypatch.setattr(main, "get_ai_service", lambda: DownAIService())
+
+    with pytest.raises(HTTPException):
+        main.process_chat_turn("metrics-missing-bot", main.ChatRequest(message="oi"))
+    assert _chat_latency_count(bot="metrics-missing-bot", outcome="rejected") == 1
+
+    result = main.process_chat_turn("metrics-bot", main.ChatRequest(message="oi"))
+    assert result["model"] is None
+    assert _chat_latency_count(bot="metrics-bot", outcome="fallback") == 1
@@ -0,0 +1,92 @@
+import sys, os, json, sqlite3
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.migrations import API_MIGRATIONS, Migration, run_migrations, current_version
+from services.stats import read_stats
+from services.tags import filtered_bots_query
+
+# Caminhos de acesso da API (backend/main.py e services/) que precisam de índice
+HOT_QUERIES = [
+    ("SELECT * FROM bots WHERE id = ? AND deleted_at IS NULL", ("b1",)),
+    ("SELECT * FROM conversations WHERE id = ?", ("c1",)),
+    ("SELECT content, is_user FROM messages WHERE conversation_id = ? ORDER BY created_at ASC", ("c1",)),
+    ("SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC", ("c1",)),
+    ("SELECT content, is_user FROM messages WHERE conversation_id = ? ORDER BY created_at DESC LIMIT ?", ("c1", 16)),
+    filtered_bots_query(None),
+    ("SELECT id FROM conversations WHERE bot_id = ? LIMIT 1", ("b1",)),
+    ("DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE conversation_id = ? ORDER BY created_at LIMIT ?)", ("c1", 500)),
+    ("DELETE FROM conversation_archive WHERE bot_id = ?", ("b1",)),
+    ("SELECT id FROM bots WHERE deleted_at IS NOT NULL", ()),
+    ("SELECT id FROM conversations WHERE archived_at IS NULL AND last_message_at < datetime('now', ?) "
+     "ORDER BY last_message_at LIMIT ?", ("-90 days", 100)),
+    ("SELECT prompt_tokens + completion_tokens FROM usage_daily WHERE day = ? AND bot_id = ?", ("2024-01-01", "b1")),
+    ("SELECT * FROM conversation_usage WHERE conversation_id = ?", ("c1",)),
+    ("SELECT bot_id FROM bot_tags WHERE tag IN (?) GROUP BY bot_id", ("rpg",)),
+]
+
+# Com filtro por tag o plano busca os bots pela PK a partir de bot_tags e ordena
+# só esse subconjunto: full scan continua proibido, ordenação em memória não
+FILTERED_QUERIES = [
+    filtered_bots_query(["rpg"], limit=20),
+    filtered_bots_query(["rpg", "magia"], match="any", limit=20),
+]
+
+def _legacy_db():
+    # Schema criado pelo init_db antigo de backend/main.py (sem migrações, user_version 0)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE bots (id TEXT PRIMARY KEY, creator_id TEXT NOT NULL, name TEXT NOT NULL, gender TEXT NOT NULL, "
+        "introduction TEXT NOT NULL, personality TEXT NOT NULL, welcome_message TEXT NOT NULL, avatar_url TEXT NOT NULL, "
+        "tags TEXT NOT NULL, conversation_context TEXT NOT NULL, context_images TEXT NOT NULL, system_prompt TEXT NOT NULL, "
+        "ai_config TEXT NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, bot_id TEXT NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute(
+        "CREATE TABLE messages (id TEXT PRIMARY KEY, conversation_id TEXT NOT NULL, content TEXT NOT NULL, "
+        "is_user BOOLEAN NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.execute(
+        "INSERT INTO bots VALUES ('b1', 'system', 'Pip', 'F', 'Intro', 'Caótica', 'Olá', 'url', ?, '', '[]', 'prompt', '{}', "
+        "'2024-01-01')", (json.dumps(["RPG", "magia"]),)
+    )
+    conn.execute("INSERT INTO conversations (id, bot_id) VALUES ('c1', 'b1')")
+    conn.execute("INSERT INTO messages (id, conversation_id, content, is_user) VALUES ('m1', 'c1', 'Oi, Pip!', 1)")
+    conn.commit()
+    return conn
+
+def test_fresh_database_reaches_latest_version_once():
+    conn = sqlite3.connect(":memory:")
+    assert run_migrations(conn, API_MIGRATIONS) == len(API_MIGRATIONS)
+    assert current_version(conn) == API_MIGRATIONS[-1].version
+    assert run_migrations(conn, API_MIGRATIONS) == 0
+
+def test_legacy_database_is_upgraded_in_place():
+    conn = _legacy_db()
+    run_migrations(conn, API_MIGRATIONS)
+
+    assert read_stats(conn)["messages"] == 1
+    assert [row[0] for row in conn.execute("SELECT tag FROM bot_tags ORDER BY tag")] == ["magia", "rpg"]
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    assert {"prompt_tokens", "completion_tokens", "latency_ms", "model"} <= columns
+    assert conn.execute("SELECT last_message_at FROM conversations WHERE id = 'c1'").fetchone()[0] is not None
+
+def test_runner_rejects_out_of_order_versions():
+    with pytest.raises(ValueError):
+        run_migrations(sqlite3.connect(":memory:"), [Migration(2, "b", lambda c: None), Migration(1, "a", lambda c: None)])
+
+def _plan(sql, params):
+    conn = _legacy_db()
+    run_migrations(conn, API_MIGRATIONS)
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+@pytest.mark.parametrize("sql,params", HOT_QUERIES + FILTERED_QUERIES)
+def test_hot_queries_never_scan_tables(sql, params):
+    for detail in _plan(sql, params):
+        assert not (detail.startswith("SCAN") and "INDEX" not in detail), f"full scan: {detail} ({sql})"
+
+@pytest.mark.parametrize("sql,params", HOT_QUERIES)
+def test_hot_queries_read_rows_in_index_order(sql, params):
+    for detail in _plan(sql, params):
+        assert "TEMP B-TREE" not in detail, f"ordenação em memória: {detail} ({sql})"
@@ -0,0 +1,69 @@
+import sys, os, sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.stats import install_stats, read_stats
+from services.purge import install_soft_delete, soft_delete_bot, purge_deleted_bots
+
+def _connect():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE bots (id TEXT PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, bot_id TEXT)")
+    conn.execute("CREATE TABLE messages (id TEXT PRIMARY KEY, conversation_id TEXT, created_at DATETIME)")
+    conn.execute("CREATE TABLE bot_tags (tag TEXT, bot_id TEXT)")
+    conn.execute("CREATE TABLE conversation_usage (conversation_id TEXT PRIMARY KEY)")
+    conn.execute("CREATE TABLE conversation_archive (conversation_id TEXT PRIMARY KEY, bot_id TEXT)")
+    conn.commit()
+    install_stats(conn)
+    install_soft_delete(conn)
+    for bot_id in ("b1", "b2"):
+        conn.execute("INSERT INTO bots (id, name) VALUES (?, ?)", (bot_id, bot_id.upper()))
+        conn.execute("INSERT INTO bot_tags VALUES ('rpg', ?)", (bot_id,))
+        for c in range(3):
+            conversation_id = f"{bot_id}-c{c}"
+            conn.execute("INSERT INTO conversations VALUES (?, ?)", (conversation_id, bot_id))
+            conn.execute("INSERT INTO conversation_usage VALUES (?)", (conversation_id,))
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id) VALUES (?, ?)",
+                [(f"{conversation_id}-m{m}", conversation_id) for m in range(7)]
+            )
+    conn.execute("INSERT INTO conversation_archive VALUES ('b1-old', 'b1')")
+    conn.commit()
+    return conn
+
+def _count(conn, sql):
+    return conn.execute(sql).fetchone()[0]
+
+def test_soft_delete_marks_bot_without_touching_conversations():
+    conn = _connect()
+    assert soft_delete_bot(conn, "b1") == "B1"
+    assert soft_delete_bot(conn, "b1") is None
+    assert soft_delete_bot(conn, "missing") is None
+    assert _count(conn, "SELECT COUNT(*) FROM messages") == 42
+    assert _count(conn, "SELECT COUNT(*) FROM bot_tags WHERE bot_id = 'b1'") == 0
+    assert read_stats(conn)["deleted_bots"] == 1
+
+def test_purge_removes_everything_in_small_batches():
+    conn = _connect()
+    soft_delete_bot(conn, "b1")
+
+    total = purge_deleted_bots(conn, batch_size=3, pause=0)
+    assert total == {"messages": 21, "conversations": 3, "bots": 1}
+    assert _count(conn, "SELECT COUNT(*) FROM bots") == 1
+    assert _count(conn, "SELECT COUNT(*) FROM conversations WHERE bot_id = 'b1'") == 0
+    assert _count(conn, "SELECT COUNT(*) FROM messages WHERE conversation_id LIKE 'b1-%'") == 0
+    assert _count(conn, "SELECT COUNT(*) FROM conversation_usage") == 3
+    assert _count(conn, "SELECT COUNT(*) FROM conversation_archive") == 0
+    # O outro bot fica intacto
+    assert _count(conn, "SELECT COUNT(*) FROM messages") == 21
+
+    stats = read_stats(conn)
+    assert (stats["bots"], stats["deleted_bots"], stats["messages"]) == (1, 0, 21)
+
+def test_stop_flag_interrupts_between_batches():
+    conn = _connect()
+    soft_delete_bot(conn, "b1")
+    checks = iter([False, True])
+    purge_deleted_bots(conn, batch_size=3, pause=0, should_stop=lambda: next(checks))
+    # Um lote só; o restante continua marcado para a próxima rodada
+    assert _count(conn, "SELECT COUNT(*) FROM messages WHERE conversation_id LIKE 'b1-%'") == 18
+    assert _count(conn, "SELECT deleted_at IS NOT NULL FROM bots WHERE id = 'b1'") == 1
@@ -0,0 +1,70 @@
+import sys, os
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from starlette.requests import Request
+from services.rate_limiter import AdmissionController, RateLimitExceeded, parse_trusted_proxies, resolve_user_id
+
+def test_user_limit_rejects_with_retry_after():
+    controller = AdmissionController(user_rate="2/60", bot_rate="100/60", global_rate="100/60")
+
+    for _ in range(2):
+        with controller.admit(user_id="u1", bot_id="b1"):
+            pass
+
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        with controller.admit(user_id="u1", bot_id="b1"):
+            pass
+    assert 1 <= exc_info.value.retry_after <= 30
+
+    # Outro usuário continua sendo atendido
+    with controller.admit(user_id="u2", bot_id="b1"):
+        pass
+
+def test_rejection_does_not_consume_other_buckets():
+    controller = AdmissionController(user_rate="1/60", bot_rate="2/60", global_rate="100/60")
+
+    with controller.admit(user_id="u1", bot_id="b1"):
+        pass
+    with pytest.raises(RateLimitExceeded):
+        with controller.admit(user_id="u1", bot_id="b1"):
+            pass
+
+    # A tentativa rejeitada não gastou o token do bot
+    with controller.admit(user_id="u2", bot_id="b1"):
+        pass
+
+def test_sheds_load_when_in_flight_limit_reached():
+    controller = AdmissionController(user_rate="100/60", bot_rate="100/60", global_rate="100/60", max_in_flight=1)
+
+    with controller.admit(user_id="u1"):
+        with pytest.raises(RateLimitExceeded):
+            with controller.admit(user_id="u2"):
+                pass
+    assert controller.in_flight == 0
+
+def test_sheds_load_when_queue_is_deep():
+    controller = AdmissionController(max_queue_depth=10, queue_depth_fn=lambda: 10)
+
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        with controller.admit(user_id="u1"):
+            pass
+    assert exc_info.value.reason == "Fila de geração cheia"
+
+def _request(client_host, **headers):
+    return Request({
+        "type": "http",
+        "headers": [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": (client_host, 50000),
+    })
+
+def test_identity_headers_only_count_behind_trusted_proxy():
+    trusted = parse_trusted_proxies("10.0.0.0/8, 127.0.0.1")
+    # Cliente direto: headers forjados não trocam o bucket
+    assert resolve_user_id(_request("203.0.113.7", X_User_Id="aleatorio"), trusted) == "203.0.113.7"
+    assert resolve_user_id(_request("203.0.113.7", X_Forwarded_For="1.1.1.1"), trusted) == "203.0.113.7"
+    # Atrás do proxy: vale o usuário informado ou o último IP não confiável da cadeia
+    assert resolve_user_id(_request("10.0.0.2", X_User_Id="u1"), trusted) == "u1"
+    forwarded = _request("10.0.0.2", X_Forwarded_For="6.6.6.6, 198.51.100.4, 10.0.0.9")
+    assert resolve_user_id(forwarded, trusted) == "198.51.100.4"
+    assert resolve_user_id(_request("10.0.0.2"), []) == "10.0.0.2"
@@ -0,0 +1,79 @@
+import sys, os, sqlite3
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.migrations import API_MIGRATIONS, run_migrations
+from services.retention import (RetentionRule, parse_rules, find_expired_conversations,
+                                apply_retention, convert_to_incremental_vacuum, AUTO_VACUUM_INCREMENTAL)
+from services.archive import archive_conversation
+from services.stats import read_stats
+
+def _db():
+    conn = sqlite3.connect(":memory:")
+    run_migrations(conn, API_MIGRATIONS)
+    return conn
+
+def _conversation(conn, conversation_id, messages, days_ago):
+    conn.execute(
+        "INSERT INTO conversations (id, bot_id, created_at) VALUES (?, 'b1', datetime('now', ?))",
+        (conversation_id, f"-{days_ago} days")
+    )
+    for i in range(messages):
+        conn.execute(
+            "INSERT INTO messages (id, conversation_id, content, is_user, created_at) "
+            "VALUES (?, ?, ?, 1, datetime('now', ?))",
+            (f"{conversation_id}-{i}", conversation_id, "x" * 2000, f"-{days_ago} days")
+        )
+    conn.commit()
+
+def test_parse_rules():
+    assert parse_rules("7:3, 365") == [RetentionRule(7, 3), RetentionRule(365)]
+    assert parse_rules("") == []
+    with pytest.raises(ValueError):
+        parse_rules("sete:3")
+
+def test_rules_delete_only_matching_conversations():
+    conn = _db()
+    _conversation(conn, "orfa", 1, 10)        # curta e parada: sai pela regra 7:3
+    _conversation(conn, "vazia", 0, 10)       # nunca recebeu mensagem: vale created_at
+    _conversation(conn, "curta-nova", 2, 1)   # curta, mas recente
+    _conversation(conn, "longa", 5, 10)       # parada, mas com conversa de verdade
+    _conversation(conn, "antiga", 5, 400)     # parada há mais de um ano
+    archive_conversation(conn, "antiga", idle_days=90)
+
+    deleted = []
+    total = apply_retention(conn, [RetentionRule(7, 3), RetentionRule(365)], batch_size=2,
+                            scan_size=1, pause=0, on_delete=deleted.append)
+
+    assert sorted(deleted) == ["antiga", "orfa", "vazia"]
+    assert total["conversations"] == 3 and total["messages"] == 1
+    remaining = [row[0] for row in conn.execute("SELECT id FROM conversations ORDER BY id")]
+    assert remaining == ["curta-nova", "longa"]
+    stats = read_stats(conn)
+    assert stats["messages"] == 7 and stats["archived_conversations"] == 0
+    assert conn.execute("SELECT COUNT(*) FROM messages WHERE conversation_id NOT IN (SELECT id FROM conversations)").fetchone()[0] == 0
+
+def test_large_conversation_is_deleted_in_batches_and_space_reclaimed():
+    conn = _db()
+    # A migração não reescreve o banco; a conversão é da janela de manutenção
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL
+    assert convert_to_incremental_vacuum(conn)["converted"]
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+    assert not convert_to_incremental_vacuum(conn)["converted"]
+    _conversation(conn, "enorme", 50, 400)
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+
+    total = apply_retention(conn, [RetentionRule(365)], batch_size=7, pause=0)
+    assert total["messages"] == 50 and total["conversations"] == 1
+    assert total["pages_freed"] > 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert conn.execute("PRAGMA page_count").fetchone()[0] < pages
+
+def test_candidate_scan_uses_activity_index():
+    conn = _db()
+    plan = " ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM conversations WHERE COALESCE(last_message_at, created_at) < datetime('now', '-7 days') "
+        "ORDER BY COALESCE(last_message_at, created_at), id LIMIT 10"
+    ))
+    assert "idx_conversations_activity" in plan and "TEMP B-TREE" not in plan
+    assert find_expired_conversations(conn, RetentionRule(7, 3)) == []
@@ -0,0 +1,89 @@
+import sys, os, json, sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+import pytest
+from services.search import install_search, build_match_query, search_bots, search_messages, run_search
+
+def _connect():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE bots (id TEXT PRIMARY KEY, name TEXT, introduction TEXT, personality TEXT, tags TEXT, ai_config TEXT, "
+        "deleted_at DATETIME)"
+    )
+    conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, bot_id TEXT)")
+    conn.execute(
+        "CREATE TABLE messages (id TEXT PRIMARY KEY, conversation_id TEXT, content TEXT, is_user BOOLEAN, "
+        "created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    return conn
+
+def _add_bot(conn, bot_id, name, introduction, tags):
+    conn.execute(
+        "INSERT INTO bots VALUES (?, ?, ?, 'Curiosa.', ?, '{}', NULL)",
+        (bot_id, name, introduction, json.dumps(tags))
+    )
+
+def test_match_query_is_quoted_with_prefix_on_last_term():
+    assert build_match_query('poção "OR dragão*') == '"poção" "OR" "dragão"*'
+    assert build_match_query("  ?! ") is None
+
+def test_existing_rows_are_indexed_and_ranked():
+    conn = _connect()
+    _add_bot(conn, "b1", "Zimbrak", "Um inventor de engrenagens.", ["steampunk"])
+    _add_bot(conn, "b2", "Luma", "Guardiã da biblioteca; gosta de engrenagens antigas.", ["magia"])
+    conn.commit()
+    assert install_search(conn) is True
+
+    hits = search_bots(conn.cursor(), build_match_query("zimb"))["items"]
+    assert [hit["id"] for hit in hits] == ["b1"]
+    assert hits[0]["tags"] == ["steampunk"]
+
+    # Sem acento na busca, com acento no texto (remove_diacritics)
+    assert [hit["id"] for hit in search_bots(conn.cursor(), build_match_query("guardia"))["items"]] == ["b2"]
+
+def test_triggers_keep_message_index_in_sync_and_paginate():
+    conn = _connect()
+    install_search(conn)
+    _add_bot(conn, "b1", "Pip", "Fada.", [])
+    conn.execute("INSERT INTO conversations VALUES ('c1', 'b1')")
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, content, is_user) VALUES (?, 'c1', ?, 1)",
+        [(f"m{i}", f"O dragão número {i} voa sobre a taverna") for i in range(3)]
+    )
+    conn.commit()
+
+    page = search_messages(conn.cursor(), build_match_query("dragao"), "c1", limit=2)
+    assert len(page["items"]) == 2 and page["has_more"] is True
+    assert "[dragão]" in page["items"][0]["snippet"]
+
+    conn.execute("DELETE FROM messages WHERE id = 'm0'")
+    conn.execute("UPDATE messages SET content = 'Só silêncio' WHERE id = 'm1'")
+    conn.commit()
+    hits = search_messages(conn.cursor(), build_match_query("dragao"), "c1")["items"]
+    assert [hit["message_id"] for hit in hits] == ["m2"]
+    assert search_messages(conn.cursor(), build_match_query("dragao"), "c1", bot_id="outro")["items"] == []
+
+def test_unscoped_search_returns_no_message_content():
+    conn = _connect()
+    install_search(conn)
+    _add_bot(conn, "b1", "Pip", "Fada dos segredos.", [])
+    _add_bot(conn, "b2", "Tiko", "Palhaço.", [])
+    conn.execute("INSERT INTO conversations VALUES ('c1', 'b1'), ('c2', 'b2')")
+    conn.execute("INSERT INTO messages (id, conversation_id, content, is_user) VALUES ('m1', 'c1', 'meu segredo é a senha 123', 1)")
+    conn.execute("INSERT INTO messages (id, conversation_id, content, is_user) VALUES ('m2', 'c2', 'outro segredo', 1)")
+    conn.commit()
+    match = build_match_query("segredo")
+
+    # Sem conversation_id: só bots, nenhum trecho ou id de conversa
+    result = run_search(conn.cursor(), match, "all")
+    assert "messages" not in result and [hit["id"] for hit in result["bots"]["items"]] == ["b1"]
+    assert "c1" not in json.dumps(result) and "senha" not in json.dumps(result)
+    with pytest.raises(ValueError):
+        run_search(conn.cursor(), match, "messages")
+
+    # Com escopo: só a conversa pedida; bot removido some da busca
+    scoped = run_search(conn.cursor(), match, "messages", conversation_id="c1")
+    assert [hit["message_id"] for hit in scoped["messages"]["items"]] == ["m1"]
+    conn.execute("UPDATE bots SET deleted_at = CURRENT_TIMESTAMP WHERE id = 'b1'")
+    assert run_search(conn.cursor(), match, "messages", conversation_id="c1")["messages"]["items"] == []
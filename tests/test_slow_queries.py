@@ -0,0 +1,63 @@
+import sys, os, sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.slow_queries import SlowQueryLog, explainer_for, parameter_shape
+
+def _explainer(tmp_path):
+    path = str(tmp_path / "slow.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id TEXT PRIMARY KEY, conversation_id TEXT, content TEXT)")
+    conn.commit()
+    conn.close()
+    return explainer_for(lambda: sqlite3.connect(path), "sqlite")
+
+def test_slow_statement_gets_parameter_shape_and_plan(tmp_path):
+    log = SlowQueryLog(threshold_ms=100)
+    explain = _explainer(tmp_path)
+    sql = "SELECT * FROM messages WHERE conversation_id = ?"
+    log.observe(sql, ("segredo",), 0.05, explain)
+    assert log.top() == []
+
+    log.observe(sql, ("segredo",), 0.3, explain)
+    log.observe("SELECT   *  FROM messages\n WHERE conversation_id = ?", ("outro",), 0.5, explain)
+    log.flush()
+    [entry] = log.top()
+    assert (entry["count"], entry["max_ms"], entry["total_ms"]) == (2, 500.0, 800.0)
+    assert entry["parameters"] == ["str(7)"]
+    assert any(line.startswith("SCAN") for line in entry["plan"])
+
+def test_ranking_and_statements_without_plan(tmp_path):
+    log = SlowQueryLog(threshold_ms=0, max_statements=2)
+    explain = _explainer(tmp_path)
+    log.observe("COMMIT", None, 2.0, explain)
+    log.observe("SELECT id FROM messages WHERE id = ?", ("m1",), 0.1, explain)
+    log.observe("DELETE FROM messages WHERE id = ?", ("m1",), 0.2, explain)
+    log.flush()
+    # Limite de 2 comandos: sai o de menor tempo acumulado
+    assert [entry["statement"] for entry in log.top()] == ["COMMIT", "DELETE FROM messages WHERE id = ?"]
+    assert log.top()[0]["plan"] is None
+    assert log.top(order="max", limit=1)[0]["statement"] == "COMMIT"
+    assert parameter_shape({"id": 1, "name": "abc"}) == {"id": "int", "name": "str(3)"}
+
+def test_slow_executemany_is_explained_with_first_row(tmp_path, monkeypatch):
+    from services import db_instrumentation
+    log = SlowQueryLog(threshold_ms=0)
+    explain = _explainer(tmp_path)
+    observer = lambda sql, parameters, duration: log.observe(sql, parameters, duration, explain)
+    monkeypatch.setattr(db_instrumentation, "_query_observers", [observer])
+    conn = db_instrumentation.connect(str(tmp_path / "slow.db"))
+    conn.executemany("INSERT INTO messages (id, conversation_id, content) VALUES (?, ?, ?)",
+                     ((f"m{i}", "c1", "x") for i in range(50)))
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 50
+    conn.close()
+    log.flush()
+
+    [entry] = [e for e in log.top() if e["statement"].startswith("INSERT")]
+    assert entry["parameters"] == ["str(2)", "str(2)", "str(1)"]
+    assert entry["plan_error"] is None and entry["plan"] is not None
+    # Sem parâmetros e com placeholders não há EXPLAIN (nem erro de bindings)
+    log.observe("DELETE FROM messages WHERE id = ?", None, 1.0, explain)
+    log.flush()
+    deleted = [e for e in log.top() if e["statement"].startswith("DELETE")][0]
+    assert deleted["plan"] is None and deleted["plan_error"] is None
@@ -0,0 +1,39 @@
+import sys, os, sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.stats import install_stats, read_stats, recount_stats
+
+def _connect():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE bots (id TEXT PRIMARY KEY)")
+    conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, bot_id TEXT)")
+    conn.execute("CREATE TABLE messages (id TEXT PRIMARY KEY, conversation_id TEXT)")
+    return conn
+
+def test_initial_count_then_triggers_keep_stats_current():
+    conn = _connect()
+    conn.execute("INSERT INTO bots VALUES ('b1')")
+    conn.commit()
+
+    install_stats(conn)
+    assert read_stats(conn) == {"bots": 1, "conversations": 0, "messages": 0}
+
+    conn.execute("INSERT INTO conversations VALUES ('c1', 'b1')")
+    conn.executemany("INSERT INTO messages VALUES (?, 'c1')", [("m1",), ("m2",), ("m3",)])
+    conn.execute("DELETE FROM messages WHERE id = 'm2'")
+    conn.commit()
+    assert read_stats(conn) == {"bots": 1, "conversations": 1, "messages": 2}
+
+    # Rodar de novo (todo startup) não recontará nem duplicará os triggers
+    install_stats(conn)
+    conn.execute("INSERT INTO bots VALUES ('b2')")
+    conn.commit()
+    assert read_stats(conn)["bots"] == 2
+
+def test_rolled_back_writes_do_not_change_stats():
+    conn = _connect()
+    install_stats(conn)
+    conn.execute("INSERT INTO messages VALUES ('m1', 'c1')")
+    conn.rollback()
+    assert read_stats(conn)["messages"] == 0
+    assert recount_stats(conn)["messages"] == 0
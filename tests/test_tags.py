@@ -0,0 +1,49 @@
+import sys, os, json, sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.tags import install_tags, filtered_bots_query, tag_facets
+
+def _connect():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE bots (id TEXT PRIMARY KEY, tags TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, deleted_at DATETIME)")
+    return conn
+
+def _add_bot(conn, bot_id, tags, created_at):
+    conn.execute("INSERT INTO bots (id, tags, created_at) VALUES (?, ?, ?)", (bot_id, json.dumps(tags), created_at))
+
+def _ids(conn, tags, match="all", limit=None, offset=0):
+    query, params = filtered_bots_query(tags, match, limit, offset)
+    return [row[0] for row in conn.execute(query, params)]
+
+def test_backfill_and_triggers_keep_normalized_tags():
+    conn = _connect()
+    _add_bot(conn, "b1", ["Fantasia", " magia ", "fantasia"], "2024-01-01")
+    conn.execute("INSERT INTO bots (id, tags) VALUES ('broken', 'não é json')")
+    conn.commit()
+    install_tags(conn)
+    assert conn.execute("SELECT tag FROM bot_tags WHERE bot_id = 'b1' ORDER BY tag").fetchall() == [("fantasia",), ("magia",)]
+
+    _add_bot(conn, "b2", ["humor"], "2024-01-02")
+    conn.execute("UPDATE bots SET tags = ? WHERE id = 'b1'", (json.dumps(["rpg"]),))
+    conn.execute("DELETE FROM bots WHERE id = 'b2'")
+    conn.commit()
+    assert conn.execute("SELECT bot_id, tag FROM bot_tags").fetchall() == [("b1", "rpg")]
+
+def test_all_any_filters_and_facets():
+    conn = _connect()
+    install_tags(conn)
+    _add_bot(conn, "b1", ["fantasia", "magia"], "2024-01-01")
+    _add_bot(conn, "b2", ["fantasia", "humor"], "2024-01-02")
+    _add_bot(conn, "b3", ["humor"], "2024-01-03")
+    conn.commit()
+
+    assert _ids(conn, ["Fantasia", "magia"]) == ["b1"]
+    assert _ids(conn, ["magia", "humor"], match="any") == ["b3", "b2", "b1"]
+    assert _ids(conn, ["humor"], limit=1, offset=1) == ["b2"]
+    assert _ids(conn, None) == ["b3", "b2", "b1"]
+
+    facets = tag_facets(conn.cursor(), ["fantasia"])
+    assert facets["total_bots"] == 2
+    assert facets["tags"] == [{"tag": "fantasia", "count": 2}, {"tag": "humor", "count": 1}, {"tag": "magia", "count": 1}]
+    assert tag_facets(conn.cursor(), ["magia", "humor"], match="any")["total_bots"] == 3
+    assert tag_facets(conn.cursor())["tags"][0] == {"tag": "fantasia", "count": 2}
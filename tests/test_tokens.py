@@ -0,0 +1,63 @@
+import sys, os, sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.migrations import API_MIGRATIONS, run_migrations
+from services.tokens import count_tokens, chars_per_token, backfill_token_counts, conversation_token_window, recent_messages_within
+from services.usage import enforce_prompt_budget
+
+def _db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    run_migrations(conn, API_MIGRATIONS)
+    conn.execute("INSERT INTO conversations (id, bot_id) VALUES ('c1', 'b1')")
+    conn.commit()
+    return conn
+
+def _insert(conn, message_id, content, tokens, created_at):
+    conn.execute(
+        "INSERT INTO messages (id, conversation_id, content, is_user, token_count, created_at) VALUES (?, 'c1', ?, 1, ?, ?)",
+        (message_id, content, tokens, created_at)
+    )
+
+def test_model_family_changes_the_ratio():
+    assert chars_per_token("anthropic/claude-3-haiku") < chars_per_token("openai/gpt-4o")
+    assert chars_per_token("modelo-desconhecido") == chars_per_token(None)
+    text = "Olá, tudo bem? Vamos jogar RPG hoje à noite!"
+    assert count_tokens(text, "qwen-2") >= count_tokens(text, "gpt-4o") > 0
+    assert count_tokens("") == 0
+
+def test_conversation_total_follows_inserts_deletes_and_backfill():
+    conn = _db()
+    _insert(conn, "m1", "um", 3, "2024-01-01 10:00:00")
+    _insert(conn, "m2", "dois", 5, "2024-01-01 10:01:00")
+    _insert(conn, "m3", "mensagem antiga sem contagem", None, "2024-01-01 10:02:00")
+    conn.commit()
+    assert conversation_token_window(conn.cursor(), "c1")["token_total"] == 8
+
+    assert backfill_token_counts(conn, batch_size=1) == 1
+    expected = 8 + count_tokens("mensagem antiga sem contagem")
+    assert conversation_token_window(conn.cursor(), "c1")["token_total"] == expected
+
+    conn.execute("DELETE FROM messages WHERE id = 'm1'")
+    conn.commit()
+    assert conversation_token_window(conn.cursor(), "c1")["token_total"] == expected - 3
+    assert conversation_token_window(conn.cursor(), "nao-existe") is None
+
+def test_recent_messages_within_budget_in_order():
+    conn = _db()
+    for i, tokens in enumerate([50, 10, 20, 30]):
+        _insert(conn, f"m{i}", f"mensagem {i}", tokens, f"2024-01-01 10:0{i}:00")
+    conn.commit()
+
+    recent = recent_messages_within(conn.cursor(), "c1", 55)
+    assert [m["content"] for m in recent] == ["mensagem 2", "mensagem 3"]
+    window = conversation_token_window(conn.cursor(), "c1", max_tokens=60)
+    assert window["budget"] == {"max_tokens": 60, "messages": 3, "tokens": 60}
+
+def test_prompt_budget_uses_stored_counts():
+    messages = [
+        {"role": "assistant", "content": "curta", "tokens": 500},
+        {"role": "user", "content": "atual", "tokens": 2},
+    ]
+    # A contagem gravada (500) manda, não a estimativa pelo tamanho do texto
+    assert enforce_prompt_budget(messages, 100) == messages[1:]
@@ -0,0 +1,45 @@
+import sys, os, json
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services import tracing
+
+TRACE_FILE = os.path.join(os.path.dirname(__file__), "test_traces.jsonl")
+
+def setup_function():
+    if os.path.exists(TRACE_FILE):
+        os.remove(TRACE_FILE)
+    tracing.configure_tracing(enabled=True, exporter="file", path=TRACE_FILE, backend="builtin")
+
+def teardown_function():
+    tracing._exporter.shutdown()
+    tracing.configure_tracing(enabled=False)
+    if os.path.exists(TRACE_FILE):
+        os.remove(TRACE_FILE)
+
+def _read_spans():
+    tracing._exporter.shutdown()
+    with open(TRACE_FILE, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_child_spans_share_trace_and_parent():
+    with tracing.start_span("http.request") as root:
+        root.update_name("POST /bots/chat/{bot_id}")
+        with tracing.start_span("llm.generate"):
+            tracing.record_span("llm.attempt", 0.25, **{"llm.attempt": 1, "llm.status": "429"})
+        tracing.trace_db_query("SELECT * FROM bots WHERE id = ?", ("b1",), 0.001)
+
+    spans = {span["name"]: span for span in _read_spans()}
+    root = spans["POST /bots/chat/{bot_id}"]
+    assert root["parent_id"] is None
+    assert spans["llm.generate"]["parent_id"] == root["context"]["span_id"]
+    assert spans["llm.attempt"]["parent_id"] == spans["llm.generate"]["context"]["span_id"]
+    assert spans["llm.attempt"]["duration_ms"] == 250.0
+    assert spans["db.query"]["attributes"]["db.operation"] == "SELECT bots"
+    assert len({span["context"]["trace_id"] for span in spans.values()}) == 1
+
+def test_measured_spans_outside_a_trace_are_dropped():
+    tracing.trace_db_query("SELECT 1", (), 0.001)
+    with tracing.start_span("chat.turn"):
+        pass
+
+    assert [span["name"] for span in _read_spans()] == ["chat.turn"]
@@ -0,0 +1,76 @@
+import sys, os, sqlite3
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.usage import (
+    BudgetExceeded,
+    enforce_prompt_budget,
+    install_usage,
+    record_usage,
+    check_budgets,
+    get_conversation_usage,
+)
+
+def _connect():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE messages (id TEXT PRIMARY KEY, conversation_id TEXT, content TEXT, is_user BOOLEAN)")
+    install_usage(conn)
+    return conn
+
+def test_prompt_budget_drops_oldest_history_first():
+    messages = [
+        {"role": "system", "content": "s" * 40},
+        {"role": "user", "content": "a" * 400},
+        {"role": "assistant", "content": "b" * 40},
+        {"role": "user", "content": "c" * 40},
+    ]
+    trimmed = enforce_prompt_budget(messages, max_prompt_tokens=60)
+    assert [m["content"][0] for m in trimmed] == ["s", "b", "c"]
+
+    with pytest.raises(BudgetExceeded) as exc_info:
+        enforce_prompt_budget(messages, max_prompt_tokens=10)
+    assert exc_info.value.status_code == 413
+
+def test_daily_and_conversation_budgets_block_before_the_call():
+    conn = _connect()
+    cursor = conn.cursor()
+    record_usage(cursor, "b1", "c1", prompt_tokens=150, completion_tokens=50, latency_ms=800)
+
+    check_budgets(cursor, "b1", "c1", {"max_daily_tokens": 500, "max_conversation_tokens": 500})
+
+    with pytest.raises(BudgetExceeded) as exc_info:
+        check_budgets(cursor, "b1", "c2", {"max_daily_tokens": 200})
+    assert exc_info.value.budget == "max_daily_tokens"
+    assert exc_info.value.retry_after > 0
+
+    with pytest.raises(BudgetExceeded) as exc_info:
+        check_budgets(cursor, "b2", "c1", {"max_conversation_tokens": 200})
+    assert exc_info.value.budget == "max_conversation_tokens"
+
+    usage = get_conversation_usage(cursor, "c1")
+    assert usage["prompt_tokens"] == 150 and usage["avg_latency_ms"] == 800
+
+def test_install_usage_is_idempotent():
+    conn = _connect()
+    install_usage(conn)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    assert {"prompt_tokens", "completion_tokens", "latency_ms", "model"} <= columns
+
+def test_failed_generation_is_not_recorded_as_usage():
+    import main
+    from services.migrations import API_MIGRATIONS, run_migrations
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    run_migrations(conn, API_MIGRATIONS)
+    cursor = conn.cursor()
+
+    # Todos os modelos falharam: a mensagem de contingência é salva, mas sem uso
+    fallback = {"content": "Estou sem palavras agora.", "model": None, "usage": {}, "attempts": 3}
+    main.save_bot_reply(cursor, "b1", "c1", fallback["content"], fallback)
+    assert get_conversation_usage(cursor, "c1") is None
+    assert cursor.execute("SELECT COUNT(*) FROM usage_daily").fetchone()[0] == 0
+
+    generation = {"model": "m1", "usage": {"prompt_tokens": 10, "completion_tokens": 5}, "latency": 0.2}
+    main.save_bot_reply(cursor, "b1", "c1", "Olá!", generation)
+    assert cursor.execute("SELECT SUM(requests) FROM usage_daily").fetchone()[0] == 1
@@ -0,0 +1,55 @@
+import sys, os, sqlite3, threading
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
+
+from services.write_behind import GroupCommitWriter
+
+def _writer(tmp_path, **kwargs):
+    path = str(tmp_path / "wb.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id TEXT PRIMARY KEY, content TEXT NOT NULL)")
+    conn.commit()
+    conn.close()
+    writer = GroupCommitWriter(lambda: sqlite3.connect(path, check_same_thread=False), **kwargs)
+    writer.start()
+    return writer, path
+
+def _insert(message_id, content="ok"):
+    return lambda cursor: cursor.execute("INSERT INTO messages VALUES (?, ?)", (message_id, content))
+
+def _count(path):
+    return sqlite3.connect(path).execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+def test_concurrent_writes_share_commits(tmp_path):
+    writer, path = _writer(tmp_path, flush_ms=20, durability="commit")
+    threads = [threading.Thread(target=writer.write, args=(_insert(f"m{i}"),)) for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.stop()
+
+    status = writer.status()
+    assert _count(path) == 40 and status["units"] == 40
+    assert status["batches"] < 40
+
+def test_failing_unit_is_rolled_back_alone(tmp_path):
+    writer, path = _writer(tmp_path, flush_ms=50, durability="enqueue")
+    first = writer.write(_insert("m1"))
+    duplicate = writer.write(_insert("m1", "de novo"))
+    last = writer.write(_insert("m2"))
+    for ticket in (first, last):
+        ticket.wait()
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.wait()
+    writer.stop()
+    assert _count(path) == 2
+
+def test_stop_drains_queued_writes(tmp_path):
+    writer, path = _writer(tmp_path, flush_ms=1, durability="enqueue")
+    tickets = [writer.write(_insert(f"m{i}")) for i in range(25)]
+    writer.stop()
+    assert all(ticket.done for ticket in tickets)
+    assert _count(path) == 25
+    with pytest.raises(RuntimeError):
+        writer.submit(_insert("late"))